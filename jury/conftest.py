@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# neded for pytest resolution
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.config import settings
+
+@pytest.fixture(autouse=True)
+def isolated_caches(tmp_path, monkeypatch):
+    # parsers and embedders built by tests must not write the checkout's ./data caches
+    monkeypatch.setattr(settings, "AST_CACHE_PATH", str(tmp_path / "ast_cache.sqlite3"))
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_PATH", str(tmp_path / "embedding_cache.sqlite3"))
@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+
+# neded for pytest resolution
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.ast_parser import ASTMetadata, Symbol
+from src.core.chunker import Chunker
+
+SOURCE = (
+    "import os\n"
+    "import sys\n"
+    "\n"
+    "TIMEOUT = 30\n"
+    "\n"
+    "\n"
+    "class Session:\n"
+    "    def open(self):\n"
+    "        return os.getcwd()\n"
+    "\n"
+    "    def close(self):\n"
+    "        return None\n"
+    "\n"
+    "def main():\n"
+    "    Session().open()\n"
+    "\n"
+    "if __name__ == \"__main__\":\n"
+    "    main()\n"
+)
+SYMBOLS = [
+    Symbol("Session", "class", 7, 12),
+    Symbol("open", "method", 8, 9, parent="Session"),
+    Symbol("close", "method", 11, 12, parent="Session"),
+    Symbol("main", "function", 14, 15),
+]
+
+class TestChunker:
+    def test_symbol_chunks_cover_every_line_once(self):
+        chunks = Chunker().chunk_file(Path("app.py"), SOURCE, ASTMetadata("python", SYMBOLS))
+
+        assert [(c.start_line, c.end_line, c.chunk_type, c.symbol_name) for c in chunks] == [
+            (1, 6, "block", None),
+            (7, 7, "class", "Session"),
+            (8, 9, "method", "open"),
+            (11, 12, "method", "close"),
+            (14, 15, "function", "main"),
+            (16, 18, "block", None),
+        ]
+        lines = SOURCE.splitlines()
+        covered = [line for c in chunks for line in range(c.start_line, c.end_line + 1)]
+        assert len(covered) == len(set(covered))
+        assert {i + 1 for i, line in enumerate(lines) if line.strip()} <= set(covered)
+        assert "".join(c.content for c in chunks) == "".join(
+            line for i, line in enumerate(SOURCE.splitlines(keepends=True)) if i + 1 in set(covered)
+        )
+
+    def test_large_symbols_are_split(self, monkeypatch):
+        from src.core.config import settings
+        monkeypatch.setattr(settings, "CHUNK_SIZE", 10)
+        monkeypatch.setattr(settings, "CHUNK_OVERLAP", 2)
+        source = "def big():\n" + "".join(f"    x_{i} = {i}\n" for i in range(39))
+
+        chunks = Chunker().chunk_file(Path("big.py"), source, ASTMetadata("python", [Symbol("big", "function", 1, 40)]))
+
+        assert all(c.end_line - c.start_line + 1 <= 10 for c in chunks)
+        assert all(c.symbol_name == "big" for c in chunks)
+        assert chunks[0].start_line == 1 and chunks[-1].end_line == 40
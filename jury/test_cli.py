@@ -0,0 +1,103 @@
+import asyncio
+import json
+import pytest
+import sys
+from pathlib import Path
+
+# neded for pytest resolution
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.cli import daemon
+from src.core.config import settings
+from src.core.rag_pipeline import CodebaseRAG
+
+class TestCli:
+    def test_components_are_built_on_first_use(self):
+        rag = CodebaseRAG()
+        assert not {'embeddings', 'qdrant', 'ast_parser', 'query_rewriter'} & vars(rag).keys()
+        assert rag.hybrid_search.qdrant is rag.qdrant
+
+    def test_close_stops_the_parse_workers(self, monkeypatch):
+        monkeypatch.setattr(settings, "PARSE_WORKERS", 1)
+        monkeypatch.setattr(settings, "PARSE_POOL_MODE", "thread")
+        rag = CodebaseRAG()
+        # nothing built yet, nothing to close
+        rag.close()
+        pool = rag.parse_pool
+        rag.close()
+        with pytest.raises(RuntimeError):
+            pool.executor.submit(print)
+
+    def test_stats_json_is_parseable(self, monkeypatch):
+        from click.testing import CliRunner
+        from src.cli.main import cli
+        snapshot = {'stages': {}, 'counters': {'queries': 3}, 'query_cache': {}}
+        monkeypatch.setattr(daemon, "request", lambda command, **args: snapshot)
+        result = CliRunner().invoke(cli, ['stats', '--json'])
+        assert result.exit_code == 0 and json.loads(result.output) == snapshot
+
+    @pytest.mark.asyncio
+    async def test_daemon_round_trip(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "mock")
+        monkeypatch.setattr(settings, "AST_CACHE_ENABLED", False)
+        # unix socket paths are length limited, keep it short
+        socket_path = f"/tmp/cbrt-{tmp_path.name}.sock"
+        assert daemon.request('ping', socket_path=socket_path) is None
+
+        server = asyncio.create_task(daemon.serve(socket_path))
+        for _ in range(100):
+            if Path(socket_path).exists():
+                break
+            await asyncio.sleep(0.05)
+        try:
+            assert await asyncio.to_thread(daemon.request, 'ping', socket_path=socket_path) == 'pong'
+            result = await asyncio.to_thread(
+                daemon.request, 'query', socket_path=socket_path,
+                repo_id="missing_repo", query="how does login work", generate_response=False
+            )
+            assert result['query'] == "how does login work" and result['results'] == []
+            items = await asyncio.to_thread(lambda: list(daemon.request_stream(
+                'query', socket_path=socket_path, repo_id="missing_repo", query="how does login work"
+            )))
+            assert len(items) == 1 and items[0]['results'] == []
+            stats = await asyncio.to_thread(daemon.request, 'stats', socket_path=socket_path)
+            assert stats['counters']['queries'] >= 2 and 'retrieve' in stats['stages']
+            with pytest.raises(daemon.DaemonError):
+                await asyncio.to_thread(daemon.request, 'bogus', socket_path=socket_path)
+            # a malformed line gets an error back and the connection stays usable
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            writer.write(b'not json\n' + json.dumps({'command': 'ping', 'args': {}}).encode() + b'\n')
+            await writer.drain()
+            assert json.loads(await reader.readline())['ok'] is False
+            assert json.loads(await reader.readline()) == {'ok': True, 'result': 'pong'}
+            writer.close()
+        finally:
+            server.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await server
+        assert not Path(socket_path).exists()
+
+    @pytest.mark.asyncio
+    async def test_query_stream_yields_results_before_the_answer(self, monkeypatch):
+        from src.core.hybrid_search import SearchResult
+        from src.core.query_rewriter import RewrittenQuery
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "mock")
+        rag = CodebaseRAG()
+        found = [SearchResult(
+            file_path="auth.py", content="def login(): ...", language="python", start_line=1, end_line=1,
+            score=0.9, chunk_type="function", symbol_name="login", source="semantic"
+        )]
+        async def search(repo_id, query, top_k, search_mode):
+            return RewrittenQuery(query, [query], 'hybrid', [], ""), found
+        monkeypatch.setattr(rag, "_search", search)
+        async def stream_response(query, results):
+            for piece in ["login ", "checks ", "the password"]:
+                yield piece
+        monkeypatch.setattr(rag.response_generator, "stream_response", stream_response)
+
+        items = [item async for item in rag.query_stream("repo", "how does login work")]
+        assert items[0].results == found and items[1:] == ["login ", "checks ", "the password"]
+        assert items[0].generated_response == "login checks the password"
+        # the complete answer is cached for the plain query path too
+        assert (await rag.query("repo", "how does login work")).generated_response == "login checks the password"
@@ -0,0 +1,136 @@
+import pytest
+import sys
+from pathlib import Path
+
+# neded for pytest resolution
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.embedding_cache import EmbeddingCache
+
+def as_lists(vectors):
+    return [vector.tolist() if vector is not None else None for vector in vectors]
+
+class TestEmbeddingCache:
+    def test_hits_and_misses(self, tmp_path):
+        cache = EmbeddingCache("test-model", 4, path=str(tmp_path / "cache.sqlite3"))
+        assert cache.get_many(["a", "b"]) == [None, None]
+
+        cache.put_many(["a"], [[1.0, 2.0, 3.0, 4.0]])
+        assert as_lists(cache.get_many(["a", "b", "a"])) == [[1.0, 2.0, 3.0, 4.0], None, [1.0, 2.0, 3.0, 4.0]]
+        assert (cache.hits, cache.misses) == (2, 3)
+
+        # keyed on model name, and persisted across instances
+        other = EmbeddingCache("other-model", 4, path=str(tmp_path / "cache.sqlite3"))
+        assert other.get_many(["a"]) == [None]
+        cache.close()
+        reopened = EmbeddingCache("test-model", 4, path=str(tmp_path / "cache.sqlite3"))
+        assert as_lists(reopened.get_many(["a"])) == [[1.0, 2.0, 3.0, 4.0]]
+
+    def test_lru_eviction(self, tmp_path):
+        # room for three 4-float vectors
+        cache = EmbeddingCache("test-model", 4, path=str(tmp_path / "cache.sqlite3"), max_bytes=48)
+        cache.put_many(["a", "b", "c"], [[1.0] * 4, [2.0] * 4, [3.0] * 4])
+        cache.get_many(["a"])
+        cache.put_many(["d"], [[4.0] * 4])
+
+        assert cache.stats()['size_bytes'] <= 48
+        assert as_lists(cache.get_many(["a", "d"])) == [[1.0] * 4, [4.0] * 4]
+        assert cache.get_many(["b"]) == [None]
+
+class TestEmbeddingGenerator:
+    @pytest.mark.asyncio
+    async def test_returns_float32_matrix(self, tmp_path, monkeypatch):
+        import numpy as np
+        from src.core.config import settings
+        from src.core.embeddings import EmbeddingGenerator
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "mock")
+        generator = EmbeddingGenerator()
+        expected = await generator.generate_embeddings(["a", "b", "a"])
+        assert expected.dtype == np.float32 and expected.shape == (3, settings.EMBEDDING_DIMENSION)
+        assert expected.flags['C_CONTIGUOUS']
+
+        # a partially cached batch is assembled into the same matrix
+        generator.cache = EmbeddingCache("mock", settings.EMBEDDING_DIMENSION, path=str(tmp_path / "cache.sqlite3"))
+        await generator.generate_embeddings(["b"])
+        vectors = await generator.generate_embeddings(["a", "b", "a"])
+        assert np.array_equal(vectors, expected)
+        assert generator.cache.hits == 1
+
+        monkeypatch.setattr(settings, "EMBEDDING_NORMALIZE", True)
+        normalized = await generator.generate_embeddings(["a", "b"])
+        assert np.allclose(np.linalg.norm(normalized, axis=1), 1.0)
+
+    def test_batches_by_token_length(self, monkeypatch):
+        import numpy as np
+        from src.core.config import settings
+        from src.core.embeddings import EmbeddingGenerator
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "mock")
+        generator = EmbeddingGenerator()
+
+        class FakeModel:
+            max_seq_length = 512
+            def __init__(self):
+                self.batches = []
+                self.failed = False
+            def get_sentence_embedding_dimension(self):
+                return 2
+            def tokenizer(self, texts, **kwargs):
+                return {'input_ids': [[0] * len(text.split()) for text in texts]}
+            def encode(self, texts, batch_size, convert_to_numpy):
+                # the first batch that pads past 40 tokens runs out of memory
+                if not self.failed and len(texts) * max(len(t.split()) for t in texts) > 40:
+                    self.failed = True
+                    raise RuntimeError("CUDA out of memory")
+                self.batches.append([len(t.split()) for t in texts])
+                return np.array([[len(t.split()), i] for i, t in enumerate(texts)], dtype=np.float32)
+
+        generator.model = FakeModel()
+        generator.batch_tokens = 64
+        texts = [" ".join(["w"] * n) for n in (30, 1, 2, 30, 1, 3, 2, 1)]
+        vectors = generator._encode_by_length(texts)
+
+        # output rows follow the input order no matter how the texts were grouped
+        assert vectors[:, 0].tolist() == [30, 1, 2, 30, 1, 3, 2, 1]
+        # short texts are grouped together, each batch stays within the halved budget
+        assert generator.batch_tokens == 32
+        assert generator.model.batches == [[1, 1, 1, 2, 2, 3], [30], [30]]
+
+    def test_onnx_backend_matches_torch(self, tmp_path):
+        """Test that the quantized onnx vectors stay within the documented tolerance of the torch ones"""
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("tokenizers")
+        st = pytest.importorskip("sentence_transformers")
+        import numpy as np
+        from src.core.config import settings
+        from src.core.onnx_encoder import OnnxEncoder
+
+        texts = ["def login(user):\n    return check_password(user)\n", "class Pool:\n    pass\n", "x = 1"]
+        onnx = OnnxEncoder(settings.EMBEDDING_MODEL, cache_dir=str(tmp_path), quantize=True, threads=1)
+        torch_vectors = st.SentenceTransformer(settings.EMBEDDING_MODEL).encode(texts, convert_to_numpy=True)
+        onnx_vectors = onnx.encode(texts, batch_size=len(texts))
+
+        cosine = (onnx_vectors * torch_vectors).sum(axis=1) / (
+            np.linalg.norm(onnx_vectors, axis=1) * np.linalg.norm(torch_vectors, axis=1)
+        )
+        assert cosine.min() >= 0.98
+
+    @pytest.mark.asyncio
+    async def test_worker_pool_matches_in_process(self, monkeypatch):
+        import numpy as np
+        from src.core.config import settings
+        from src.core.embedding_pool import get_embedding_pool
+        from src.core.embeddings import EmbeddingGenerator
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "mock")
+        texts = [f"def f{i}():\n" + "    pass\n" * (i % 7) for i in range(50)]
+        expected = await EmbeddingGenerator().generate_embeddings(texts)
+
+        monkeypatch.setattr(settings, "EMBEDDING_WORKERS", 2)
+        first, second = EmbeddingGenerator(), EmbeddingGenerator()
+        # every generator in the process shares the same warm workers
+        assert first.pool is second.pool is get_embedding_pool()
+        assert first.model is None
+
+        vectors = await first.generate_embeddings(texts)
+        assert np.array_equal(vectors, expected)
+        assert np.array_equal(await second.generate_embeddings(texts[:3]), expected[:3])
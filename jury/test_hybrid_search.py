@@ -0,0 +1,295 @@
+import pytest
+import sys
+from pathlib import Path
+
+# neded for pytest resolution
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.hybrid_search import HybridSearch, SearchResult
+from src.core.query_rewriter import RewrittenQuery
+from src.core.rag_pipeline import CodebaseRAG
+
+def make_result(path: str, score: float, source: str = 'semantic') -> SearchResult:
+    return SearchResult(
+        file_path=path, content="", language="python", start_line=1, end_line=2,
+        score=score, chunk_type="block", symbol_name=None, source=source
+    )
+
+class TestHybridSearch:
+    def test_reciprocal_rank_fusion(self):
+        search = HybridSearch(qdrant_client=None)
+        fused = search.reciprocal_rank_fusion(
+            [make_result("a.py", 0.9), make_result("b.py", 0.8)],
+            [make_result("b.py", 5.0, 'ast'), make_result("c.py", 4.0, 'ast')],
+        )
+        assert [r.file_path for r in fused] == ["b.py", "a.py", "c.py"]
+        assert fused[0].source == 'hybrid'
+        assert fused[1].source == 'semantic'
+
+    @pytest.mark.asyncio
+    async def test_expansions_are_searched_in_one_batch(self, tmp_path, monkeypatch):
+        from src.core.config import settings
+        from src.core.indexing_pipeline import IndexingPipeline
+        settings.EMBEDDING_PROVIDER = "mock"
+        monkeypatch.setattr(settings, "AST_CACHE_ENABLED", False)
+
+        (tmp_path / "auth.py").write_text("def login(user):\n    return check_password(user)\n")
+        (tmp_path / "db.py").write_text("def connect(url):\n    return open_pool(url)\n")
+
+        rag = CodebaseRAG()
+        await rag.init()
+        pipeline = IndexingPipeline(rag.ast_parser, rag.chunker, rag.embeddings, rag.qdrant)
+        await pipeline.run("search_repo", tmp_path, sorted(tmp_path.iterdir()))
+
+        async def rewrite(query):
+            return RewrittenQuery(query, ["login", "check_password"], 'hybrid', [], "")
+        monkeypatch.setattr(rag.query_rewriter, "rewrite_query", rewrite)
+
+        batch_sizes = []
+        real_batch = rag.qdrant.client.query_batch_points
+        def counting_batch(**kwargs):
+            batch_sizes.append(len(kwargs["requests"]))
+            return real_batch(**kwargs)
+        monkeypatch.setattr(rag.qdrant.client, "query_batch_points", counting_batch)
+
+        result = await rag.query("search_repo", "how do users log in", top_k=2, generate_response=False)
+
+        assert batch_sizes == [3]
+        assert {r.file_path for r in result.results} == {"auth.py", "db.py"}
+
+class TestLexicalIndex:
+    def test_tokenize_splits_identifiers(self):
+        from src.core.lexical_index import tokenize
+        assert tokenize("getUserName(http_server)") == [
+            "getusername", "get", "user", "name", "http_server", "http", "server"
+        ]
+        assert tokenize("HTTPServerError") == ["httpservererror", "http", "server", "error"]
+
+    def test_bm25_identifier_lookup(self, tmp_path, monkeypatch):
+        from src.core.chunker import Chunk
+        from src.core.config import settings
+        from src.core.lexical_index import LexicalIndex, LexicalIndexBuilder
+        monkeypatch.setattr(settings, "LEXICAL_INDEX_DIR", str(tmp_path))
+
+        def chunk(path, content, symbol=None):
+            return Chunk(content=content, path=path, language="python", start_line=1, end_line=2,
+                         chunk_type="function" if symbol else "block", symbol_name=symbol)
+
+        builder = LexicalIndexBuilder("repo")
+        builder.add_chunks([
+            chunk("auth.py", "def validate_token(token):\n    return token.is_valid()\n", "validate_token"),
+            chunk("db.py", "def open_pool(url):\n    return Pool(url)\n", "open_pool"),
+            chunk("util.py", "x = 1\n"),
+        ])
+        builder.save()
+
+        index = LexicalIndex.load("repo")
+        hits = index.search("validateToken", limit=5)
+        assert [index.doc(doc_id)[0][0] for doc_id, _ in hits] == ["auth.py"]
+
+        # an incremental rebuild keeps unchanged files and drops the stale ones
+        rebuilt = LexicalIndexBuilder("repo")
+        rebuilt.carry_over(index, {"db.py"})
+        rebuilt.add_chunks([chunk("db.py", "def open_connection(url):\n    pass\n", "open_connection")])
+        rebuilt.save()
+
+        # carried postings score exactly like a fresh build of the same docs
+        fresh = LexicalIndexBuilder("fresh")
+        fresh.add_chunks([
+            chunk("auth.py", "def validate_token(token):\n    return token.is_valid()\n", "validate_token"),
+            chunk("util.py", "x = 1\n"),
+            chunk("db.py", "def open_connection(url):\n    pass\n", "open_connection"),
+        ])
+        fresh.save()
+        carried, expected = LexicalIndex.load("repo"), LexicalIndex.load("fresh")
+        assert list(carried.iter_docs()) == list(expected.iter_docs())
+        for query in ["validate token", "open connection url", "x"]:
+            assert carried.search(query, limit=5) == expected.search(query, limit=5)
+
+        search = HybridSearch(qdrant_client=None)
+        results = search.ast_search("repo", RewrittenQuery("open_connection", [], 'ast', [], ""), 5, None)
+        assert [(r.file_path, r.symbol_name, r.source) for r in results] == [("db.py", "open_connection", "ast")]
+        assert search.ast_search("repo", RewrittenQuery("Pool", [], 'ast', [], ""), 5, None) == []
+
+class TestSymbolIndex:
+    def test_parser_extracts_symbols(self, tmp_path):
+        pytest.importorskip("tree_sitter_python")
+        from src.core.ast_cache import ASTCache
+        from src.core.ast_parser import ASTParser
+        source = (
+            "import os\n"
+            "from db import pool\n\n"
+            "class Session:\n"
+            "    \"\"\"a user session\"\"\"\n"
+            "    def refresh(self, token):\n"
+            "        def check(value):\n"
+            "            return value\n"
+            "        return check(token)\n\n"
+            "def login(user):\n"
+            "    return Session()\n"
+        )
+        metadata = ASTParser(cache=ASTCache(1, path=str(tmp_path / "ast.sqlite3"))).parse_file(Path("auth.py"), source)
+        assert [(s.name, s.type, s.parent) for s in metadata.symbols] == [
+            ("Session", "class", None), ("refresh", "method", "Session"),
+            # nested in a method, not a member of the class
+            ("check", "function", "refresh"), ("login", "function", None)
+        ]
+        assert metadata.symbols[0].docstring == "a user session"
+        assert metadata.symbols[1].signature == "def refresh(self, token)"
+        assert metadata.dependencies == ["os", "db"]
+
+    def test_parse_cache_skips_unchanged_blobs(self, tmp_path, monkeypatch):
+        pytest.importorskip("tree_sitter_python")
+        import sqlite3
+        from src.core import ast_parser
+        from src.core.ast_cache import ASTCache
+        source = b"import os\n\nclass Pool:\n    def get(self):\n        pass\n"
+        first = ast_parser.ASTParser(cache=ASTCache(1, path=str(tmp_path / "ast.sqlite3")))
+        parsed = first.parse_file(Path("a/pool.py"), source)
+        first.cache.close()
+
+        # a later index, of another branch or fork, never reaches tree-sitter for the same contents
+        monkeypatch.setattr(ast_parser, "_grammar", lambda language: pytest.fail("reparsed a cached blob"))
+        second = ast_parser.ASTParser(cache=ASTCache(1, path=str(tmp_path / "ast.sqlite3")))
+        assert second.parse_file(Path("b/renamed.py"), source) == parsed
+        assert second.cache.stats()["hits"] == 1
+        # hits are stamped in batches rather than committed one by one
+        def last_used():
+            with sqlite3.connect(tmp_path / "ast.sqlite3") as conn:
+                return conn.execute("SELECT last_used FROM parses").fetchone()[0]
+        stamped = last_used()
+        second.cache.close()
+        assert last_used() > stamped
+        # an extractor version bump ignores old results
+        assert ast_parser.ASTParser(cache=ASTCache(2, path=str(tmp_path / "ast.sqlite3"))).cache.get(
+            ast_parser.blob_sha(source), "python"
+        ) is None
+
+    def test_lookup_answers_identifier_queries(self, tmp_path, monkeypatch):
+        from src.core.ast_parser import Symbol
+        from src.core.config import settings
+        from src.core.symbol_index import SymbolIndex
+        monkeypatch.setattr(settings, "SYMBOL_INDEX_DIR", str(tmp_path / "symbols"))
+        (tmp_path / "auth.py").write_text("class Session:\n    def refresh(self):\n        pass\n")
+
+        index = SymbolIndex("repo", str(tmp_path))
+        index.add_file("auth.py", [
+            Symbol("Session", "class", 1, 3),
+            Symbol("refresh", "method", 2, 3, signature="def refresh(self)", parent="Session"),
+        ], ["os"])
+        index.add_file("old.py", [Symbol("refresh", "function", 1, 1)], [])
+        index.remove_files({"old.py"})
+        index.save()
+
+        loaded = SymbolIndex.load("repo")
+        assert [e.path for e in loaded.lookup("REFRESH")] == ["auth.py"]
+        assert [e.name for e in loaded.prefix("ref")] == ["refresh"]
+        assert loaded.importers("os") == ["auth.py"]
+
+        search = HybridSearch(qdrant_client=None)
+        results = search.lookup_symbol("repo", "where is Session.refresh defined?")
+        assert [(r.symbol_name, r.start_line, r.source) for r in results] == [("refresh", 2, "ast")]
+        assert results[0].content == "    def refresh(self):\n        pass"
+        assert search.lookup_symbol("repo", "how does session refresh work") == []
+        # a bare word is a topic unless it is shaped or quoted like an identifier
+        assert search.lookup_symbol("repo", "refresh") == []
+        assert [r.symbol_name for r in search.lookup_symbol("repo", "refresh()")] == ["refresh"]
+        assert [r.symbol_name for r in search.lookup_symbol("repo", "`refresh`")] == ["refresh"]
+
+    def test_symbol_queries(self):
+        from src.core.hybrid_search import symbol_query
+        assert [symbol_query(q) for q in ["authentication", "Logging", "get_user", "getUser", "ns::Pool", "Foo.bar"]] == [
+            None, None, "get_user", "getUser", "ns::Pool", "Foo.bar"
+        ]
+        assert symbol_query("where is Session defined") == "Session"
+
+class TestQueryCache:
+    def test_ttl_cache_evicts_and_expires(self):
+        from src.core.query_cache import TTLCache
+        cache = TTLCache(max_entries=2, ttl=60)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        # "b" was the least recently used
+        assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+
+        expired = TTLCache(max_entries=2, ttl=-1)
+        expired.put("a", 1)
+        assert expired.get("a") is None and len(expired) == 0
+        assert (cache.hits, cache.misses) == (3, 1)
+
+    @pytest.mark.asyncio
+    async def test_repeated_queries_are_served_from_cache(self, tmp_path, monkeypatch):
+        from src.core.config import settings
+        from src.core.index_manifest import IndexManifest
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "mock")
+        monkeypatch.setattr(settings, "INDEX_MANIFEST_DIR", str(tmp_path / "manifests"))
+
+        rag = CodebaseRAG()
+        rewrites = []
+        async def rewrite(query):
+            rewrites.append(query)
+            return RewrittenQuery(query, ["login"], 'semantic', [], "")
+        monkeypatch.setattr(rag.query_rewriter, "rewrite_query", rewrite)
+        searches = []
+        async def search(repo_id, query_vectors, rewritten_query, top_k):
+            searches.append(len(query_vectors))
+            return [make_result("auth.py", 0.9)]
+        monkeypatch.setattr(rag.hybrid_search, "search", search)
+
+        manifest = IndexManifest(repo_id="repo", commit="abc")
+        manifest.save()
+        first = await rag.query("repo", "how do users log in", generate_response=False)
+        second = await rag.query("repo", "how do users log in", generate_response=False)
+        assert rewrites == ["how do users log in"] and searches == [2]
+        assert [r.file_path for r in second.results] == [r.file_path for r in first.results]
+
+        # a re-index changes the version, so the next query searches again but
+        # reuses the cached query embeddings
+        embedded = []
+        real_generate = rag.embeddings.generate_embeddings
+        async def generate(texts):
+            embedded.append(list(texts))
+            return await real_generate(texts)
+        monkeypatch.setattr(rag.embeddings, "generate_embeddings", generate)
+        manifest.commit = "def"
+        manifest.save()
+        rag.query_cache.invalidate("repo")
+        await rag.query("repo", "how do users log in", generate_response=False)
+        assert searches == [2, 2] and embedded == []
+
+class TestContextPacker:
+    def test_merges_overlaps_drops_duplicates_and_fits_budget(self, monkeypatch):
+        from src.core.chunker import Chunker
+        from src.core.config import settings
+        from src.core.context_packer import estimate_tokens, pack_context
+        monkeypatch.setattr(settings, "CHUNK_SIZE", 4)
+        monkeypatch.setattr(settings, "CHUNK_OVERLAP", 1)
+        source = "".join(f"line_{i} = {i}\n" for i in range(1, 11))
+        def snippets(path, content, *scores):
+            return [
+                SearchResult(
+                    file_path=path, content=c.content, language="python", start_line=c.start_line,
+                    end_line=c.end_line, score=score, chunk_type=c.chunk_type, symbol_name=None, source='semantic'
+                )
+                for c, score in zip(Chunker().chunk_file(Path(path), content, None), scores)
+            ]
+
+        # a.py chunks to (1, 4), (4, 7), (7, 10)
+        a = snippets("a.py", source, 0.9, 0.5, 0.4)
+        assert [(r.start_line, r.end_line) for r in a] == [(1, 4), (4, 7), (7, 10)]
+        # the same code vendored elsewhere, reindented
+        vendored = snippets("vendor/a.py", "".join("    " + line for line in source.splitlines(keepends=True)), 0.3)
+        monkeypatch.setattr(settings, "CHUNK_SIZE", 400)
+        big = snippets("b.py", "".join(f"other_{i} = {i}\n" for i in range(400)), 0.8)
+        packed = pack_context(a + vendored + big, token_budget=200)
+
+        assert [(r.file_path, r.start_line, r.end_line, r.score) for r in packed] == [("a.py", 1, 10, 0.9)]
+        assert packed[0].content == source
+
+        # the best snippet is always sent, cut down to the budget
+        packed = pack_context(big, token_budget=50)
+        assert len(packed) == 1 and estimate_tokens(packed[0].content) <= 60
+        assert packed[0].end_line == packed[0].start_line + len(packed[0].content.splitlines()) - 1
@@ -45,6 +45,356 @@ class TestIndexing:
         assert rag.chunker is not None
         assert rag.git_handler is not None
 
+    @pytest.mark.asyncio
+    async def test_pipeline_streams_local_repo(self, tmp_path, monkeypatch):
+        """Test the staged pipeline on a local tree, with batches smaller than the repo"""
+        from src.core.config import settings
+        from src.core.indexing_pipeline import IndexingPipeline
+        settings.EMBEDDING_PROVIDER = "mock"
+        monkeypatch.setattr(settings, "AST_CACHE_ENABLED", False)
+
+        for i in range(5):
+            (tmp_path / f"mod_{i}.py").write_text("".join(f"x_{j} = {j}\n" for j in range(120)))
+        (tmp_path / ".git").mkdir()
+        (tmp_path / ".git" / "HEAD").write_text("ref: refs/heads/main\n")
+
+        rag = CodebaseRAG()
+        await rag.init()
+
+        pipeline = IndexingPipeline(rag.ast_parser, rag.chunker, rag.embeddings, rag.qdrant)
+        pipeline.embed_batch_size = 4
+        stats = await pipeline.run("streamed_repo", tmp_path, rag.git_handler.list_files(tmp_path))
+
+        assert stats.files == 5
+        assert stats.failed_files == 0
+        assert stats.chunks == stats.upserted > 0
+        assert await rag.qdrant.count_points("streamed_repo") == stats.upserted
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("mode", ["thread", "process"])
+    async def test_parse_pool_matches_inline_order(self, tmp_path, monkeypatch, mode):
+        """Test that pooled parsing produces the same chunks, in the same order, as inline parsing"""
+        from src.core.config import settings
+        from src.core.indexing_pipeline import IndexingPipeline
+        from src.core.parse_pool import ParsePool
+        monkeypatch.setattr(settings, "AST_CACHE_ENABLED", False)
+
+        for i in range(40):
+            (tmp_path / f"mod_{i:02d}.py").write_text("".join(f"x_{j} = {i}\n" for j in range(i * 3 + 1)))
+        files = sorted(tmp_path.iterdir())
+
+        rag = CodebaseRAG()
+        seen = {}
+        for pool in (None, ParsePool(workers=3, mode=mode, batch_size=4)):
+            upserted = []
+            async def capture(repo_id, chunks, embeddings, ids=None):
+                upserted.extend((c.path, c.start_line, c.end_line, c.content) for c in chunks)
+            rag.qdrant.upsert_chunks = capture
+
+            pipeline = IndexingPipeline(rag.ast_parser, rag.chunker, rag.embeddings, rag.qdrant, parse_pool=pool)
+            stats = await pipeline.run("local_repo", tmp_path, files)
+            assert stats.files == 40
+            seen[pool is None] = (upserted, stats.file_hashes)
+            if pool:
+                pool.close()
+
+        assert seen[True] == seen[False]
+
+    def test_incremental_plan_from_git_diff(self, tmp_path):
+        """Test that only changed files are re-indexed, with and without a usable git diff"""
+        import git
+        from src.core.git_handler import GitHandler
+        from src.core.index_manifest import IndexManifest, content_digest, plan_reindex
+
+        repo = git.Repo.init(tmp_path)
+        repo.config_writer().set_value("user", "name", "test").set_value("user", "email", "t@t").release()
+        for name in ("a.py", "b.py", "c.py"):
+            (tmp_path / name).write_text(f"# {name}\n")
+        repo.index.add(["a.py", "b.py", "c.py"])
+        first = repo.index.commit("first").hexsha
+
+        handler = GitHandler()
+        manifest = IndexManifest(repo_id="local", commit=first, files={
+            str(p.relative_to(tmp_path)): content_digest(p.read_bytes()) for p in handler.list_files(tmp_path)
+        })
+
+        (tmp_path / "a.py").write_text("# changed\n")
+        (tmp_path / "d.py").write_text("# new\n")
+        repo.index.remove(["c.py"], working_tree=True)
+        repo.index.add(["a.py", "d.py"])
+        repo.index.commit("second")
+
+        diff = handler.diff_files(tmp_path, first)
+        assert diff == ({"a.py", "d.py"}, {"c.py"})
+
+        for plan in (
+            plan_reindex(manifest, tmp_path, handler.list_files(tmp_path), diff),
+            plan_reindex(manifest, tmp_path, handler.list_files(tmp_path)),
+        ):
+            assert sorted(p.name for p in plan.to_index) == ["a.py", "d.py"]
+            assert plan.stale == {"a.py", "c.py"}
+            assert plan.deleted == {"c.py"}
+
+    @pytest.mark.asyncio
+    async def test_reindex_only_embeds_changed_chunks(self, tmp_path, monkeypatch):
+        """Test that an incremental index keeps the points of unchanged chunks and drops stale ones"""
+        import git
+        from src.core.config import settings
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "mock")
+        monkeypatch.setattr(settings, "AST_CACHE_ENABLED", False)
+        for name in ("INDEX_MANIFEST_DIR", "LEXICAL_INDEX_DIR", "SYMBOL_INDEX_DIR"):
+            monkeypatch.setattr(settings, name, str(tmp_path / name.lower()))
+        source = tmp_path / "repo"
+        source.mkdir()
+        repo = git.Repo.init(source)
+        repo.config_writer().set_value("user", "name", "test").set_value("user", "email", "t@t").release()
+        functions = [f"def handler_{i}(event):\n    return event + {i}\n" for i in range(4)]
+        (source / "handlers.py").write_text("\n".join(functions))
+        (source / "other.py").write_text("def other():\n    pass\n")
+        repo.index.add(["handlers.py", "other.py"])
+        repo.index.commit("first")
+
+        rag = CodebaseRAG()
+        await rag.init()
+        first = await rag.index_path("reindex_repo", source, force_reindex=True)
+        assert first.reused == 0 and first.upserted == first.chunks >= 5
+
+        functions[2] = "def handler_2(event):\n    return None\n"
+        (source / "handlers.py").write_text("\n".join(functions))
+        repo.index.add(["handlers.py"])
+        repo.index.commit("second")
+        embedded = []
+        real_generate = rag.embeddings.generate_embeddings
+        async def generate(texts):
+            embedded.extend(texts)
+            return await real_generate(texts)
+        monkeypatch.setattr(rag.embeddings, "generate_embeddings", generate)
+
+        second = await rag.index_path("reindex_repo", source)
+        assert second.files == 1 and second.chunks == second.upserted == 1
+        assert second.reused == 3 and "return None" in embedded[0]
+        assert await rag.qdrant.count_points("reindex_repo") == first.upserted
+
+    @pytest.mark.asyncio
+    async def test_failed_files_are_retried_on_the_next_run(self, tmp_path, monkeypatch):
+        """Test that a changed file that fails to index is retried even though git no longer reports it"""
+        import git
+        from src.core import indexing_pipeline
+        from src.core.config import settings
+        from src.core.index_manifest import IndexManifest
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "mock")
+        monkeypatch.setattr(settings, "AST_CACHE_ENABLED", False)
+        for name in ("INDEX_MANIFEST_DIR", "LEXICAL_INDEX_DIR", "SYMBOL_INDEX_DIR"):
+            monkeypatch.setattr(settings, name, str(tmp_path / name.lower()))
+        source = tmp_path / "repo"
+        source.mkdir()
+        repo = git.Repo.init(source)
+        repo.config_writer().set_value("user", "name", "test").set_value("user", "email", "t@t").release()
+        for name in ("a.py", "b.py"):
+            (source / name).write_text(f"def {name[0]}():\n    pass\n")
+        repo.index.add(["a.py", "b.py"])
+        repo.index.commit("first")
+
+        rag = CodebaseRAG()
+        await rag.init()
+        await rag.index_path("retry_repo", source, force_reindex=True)
+
+        (source / "a.py").write_text("def a():\n    return 1\n")
+        repo.index.add(["a.py"])
+        repo.index.commit("second")
+        real_process = indexing_pipeline.process_file
+        def flaky(parser, chunker, repo_path, path):
+            return None if path.name == "a.py" else real_process(parser, chunker, repo_path, path)
+        monkeypatch.setattr(indexing_pipeline, "process_file", flaky)
+        failed = await rag.index_path("retry_repo", source)
+        assert failed.failed_paths == ["a.py"]
+        manifest = IndexManifest.load("retry_repo")
+        assert manifest.failed == ["a.py"] and "a.py" not in manifest.files
+
+        monkeypatch.setattr(indexing_pipeline, "process_file", real_process)
+        retried = await rag.index_path("retry_repo", source)
+        assert retried.files == 1 and retried.upserted == 1
+        manifest = IndexManifest.load("retry_repo")
+        assert manifest.failed == [] and "a.py" in manifest.files
+
+    @pytest.mark.asyncio
+    async def test_failed_index_discards_lexical_generation(self, tmp_path, monkeypatch):
+        """Test that a run failing before the pipeline starts leaves no half written lexical index"""
+        from src.core.config import settings
+        monkeypatch.setattr(settings, "LEXICAL_INDEX_DIR", str(tmp_path / "lexical"))
+        monkeypatch.setattr(settings, "SYMBOL_INDEX_DIR", str(tmp_path / "symbols"))
+        (tmp_path / "repo").mkdir()
+        (tmp_path / "repo" / "a.py").write_text("x = 1\n")
+
+        rag = CodebaseRAG()
+        async def unreachable(repo_id):
+            raise ConnectionError("qdrant unreachable")
+        monkeypatch.setattr(rag.qdrant, "delete_repo", unreachable)
+        with pytest.raises(ConnectionError):
+            await rag.index_path("lexical_fail_repo", tmp_path / "repo", force_reindex=True)
+        assert not any((tmp_path / "lexical").rglob("content.bin"))
+
+    @pytest.mark.parametrize("mmap_min_kb", [0, 1024])
+    def test_file_discovery_policy(self, tmp_path, monkeypatch, mmap_min_kb):
+        """Test that discovery honours .gitignore, the exclude policy, size caps and binary sniffing"""
+        import git
+        from src.core.config import settings
+        from src.core.file_scanner import read_source
+        from src.core.git_handler import GitHandler
+        from src.core.index_manifest import IndexManifest, plan_reindex
+        monkeypatch.setattr(settings, "INDEX_MAX_FILE_KB", 20)
+        monkeypatch.setattr(settings, "INDEX_MMAP_MIN_KB", mmap_min_kb)
+
+        repo = git.Repo.init(tmp_path)
+        files = {
+            ".gitignore": "out/\n",
+            "src/app.py": "def main():\n    pass\n",
+            "src/empty.py": "",
+            "out/gen.py": "x = 1\n",
+            "node_modules/dep/index.js": "module.exports = 1;\n",
+            "web/app.min.js": "var a=1;\n",
+            "web/bundle.js": "var a=1;" * 2000,
+            "big.py": "x = 1\n" * 6000,
+            "logo.png": "png",
+        }
+        for name, content in files.items():
+            (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / name).write_text(content)
+        (tmp_path / "src" / "blob.c").write_bytes(b"int x;\0\x01\x02")
+        repo.index.add(["src/app.py"])
+        repo.index.commit("first")
+
+        listed = sorted(str(p.relative_to(tmp_path)) for p in GitHandler().list_files(tmp_path))
+        assert listed == ["src/app.py", "src/blob.c", "src/empty.py", "web/bundle.js"]
+        contents = {rel: read_source(tmp_path / rel)[1] for rel in listed}
+        assert contents == {"src/app.py": b"def main():\n    pass\n", "src/blob.c": None, "src/empty.py": b"", "web/bundle.js": None}
+
+        # a changed file the policy now rejects is dropped from the index like a deleted one
+        manifest = IndexManifest(repo_id="local", files={"src/app.py": "old", "node_modules/dep/index.js": "old"})
+        plan = plan_reindex(manifest, tmp_path, [], ({"src/app.py", "node_modules/dep/index.js"}, set()))
+        assert [p.name for p in plan.to_index] == ["app.py"]
+        assert plan.deleted == {"node_modules/dep/index.js"}
+
+    def test_blobless_sparse_clone_and_update(self, tmp_path, monkeypatch):
+        """Test that a clone only downloads the checked out files and updates with a fetch"""
+        import git
+        from src.core.config import settings
+        from src.core.git_handler import GitHandler
+
+        source = tmp_path / "source"
+        repo = git.Repo.init(source)
+        with repo.config_writer() as config:
+            config.set_value("user", "name", "test").set_value("user", "email", "t@t")
+            config.set_value("uploadpack", "allowFilter", "true")
+        (source / "pkg").mkdir()
+        (source / "pkg" / "app.py").write_text("def main():\n    pass\n")
+        (source / "data.bin").write_bytes(bytes(range(256)) * 64)
+        repo.index.add(["pkg/app.py", "data.bin"])
+        repo.index.commit("first")
+
+        monkeypatch.setattr(settings, "GIT_CACHE_DIR", str(tmp_path / "cache"))
+        handler = GitHandler()
+        clone = tmp_path / "cache" / "local"
+        handler._clone(f"file://{source}", clone)
+        assert [p.relative_to(clone).as_posix() for p in handler.list_files(clone)] == ["pkg/app.py"]
+        # the unselected file's blob was never downloaded
+        missing = handler._git(["rev-list", "--objects", "--all", "--missing=print"], cwd=clone)
+        assert f"?{repo.head.commit.tree['data.bin'].hexsha}" in missing.split()
+
+        (source / "pkg" / "app.py").write_text("def main():\n    return 1\n")
+        repo.index.add(["pkg/app.py"])
+        second = repo.index.commit("second").hexsha
+        handler._update(clone)
+        assert handler.get_head_commit(clone) == second
+        assert (clone / "pkg" / "app.py").read_text() == "def main():\n    return 1\n"
+        assert handler.diff_files(clone, repo.head.commit.parents[0].hexsha) == ({"pkg/app.py"}, set())
+
+        monkeypatch.setattr(settings, "MAX_REPO_SIZE_MB", 0)
+        monkeypatch.setattr(settings, "GIT_CHECKOUT_EXTENSIONS", ())
+        with pytest.raises(ValueError, match="too large"):
+            handler._clone(f"file://{source}", tmp_path / "cache" / "too_big")
+        assert not (tmp_path / "cache" / "too_big").exists()
+        assert not (tmp_path / "cache" / "too_big.partial").exists()
+
+    def test_size_cap_counts_only_what_a_fetch_adds(self, tmp_path, monkeypatch):
+        from src.core import git_handler
+        from src.core.config import settings
+        monkeypatch.setattr(settings, "GIT_CACHE_DIR", str(tmp_path))
+        monkeypatch.setattr(settings, "MAX_REPO_SIZE_MB", 1)
+        # a clone already past the cap can still be updated
+        monkeypatch.setattr(git_handler, "_pack_size", lambda path: 5 * 1024 * 1024)
+        git_handler.GitHandler()._git(["--version"], watch=tmp_path)
+
+        sizes = iter([5 * 1024 * 1024, 7 * 1024 * 1024])
+        monkeypatch.setattr(git_handler, "_pack_size", lambda path: next(sizes))
+        with pytest.raises(ValueError, match="too large"):
+            git_handler.GitHandler()._git(["--version"], watch=tmp_path)
+
+    def test_clone_locks_survive_new_event_loops(self, tmp_path, monkeypatch):
+        from src.core.config import settings
+        from src.core.git_handler import GitHandler
+        monkeypatch.setattr(settings, "GIT_CACHE_DIR", str(tmp_path))
+        handler = GitHandler()
+        def fake_clone(url, repo_path):
+            (repo_path / ".git").mkdir(parents=True, exist_ok=True)
+        monkeypatch.setattr(handler, "_clone", fake_clone)
+        monkeypatch.setattr(handler, "_update", lambda repo_path: None)
+        monkeypatch.setattr(handler, "get_head_commit", lambda repo_path: "0" * 40)
+
+        # the cli runs every command on a fresh loop
+        async def sync():
+            await asyncio.gather(*(handler.clone_repo("https://github.com/example/loops", update=True) for _ in range(3)))
+        asyncio.run(sync())
+        asyncio.run(sync())
+
+    @pytest.mark.asyncio
+    async def test_concurrent_clones_share_one_sync(self, tmp_path, monkeypatch):
+        from src.core.config import settings
+        from src.core.git_handler import GitHandler
+        monkeypatch.setattr(settings, "GIT_CACHE_DIR", str(tmp_path))
+
+        clones = []
+        def fake_clone(url, repo_path):
+            clones.append(url)
+            (repo_path / ".git").mkdir(parents=True)
+        handler = GitHandler()
+        monkeypatch.setattr(handler, "_clone", fake_clone)
+
+        url = "https://github.com/example/shared"
+        results = await asyncio.gather(*(handler.clone_repo(url, update=True) for _ in range(4)))
+        assert clones == [url]
+        assert {repo_id for repo_id, _ in results} == {"example_shared"}
+
+class TestBenchmark:
+    def test_synthetic_repo_is_deterministic(self, tmp_path):
+        from src.bench.synthetic_repo import generate_repo
+        counts = generate_repo(tmp_path / "a", 50, seed=3)
+        generate_repo(tmp_path / "b", 50, seed=3)
+        files_a = sorted(p.relative_to(tmp_path / "a") for p in (tmp_path / "a").rglob("*.*"))
+        assert sum(counts.values()) == len(files_a) == 50
+        assert files_a == sorted(p.relative_to(tmp_path / "b") for p in (tmp_path / "b").rglob("*.*"))
+        assert all((tmp_path / "a" / f).read_text() == (tmp_path / "b" / f).read_text() for f in files_a)
+
+    @pytest.mark.asyncio
+    async def test_benchmark_reports_throughput_and_latency(self, tmp_path, monkeypatch):
+        from src.bench.run import run_benchmark, save_result
+        from src.core.config import settings
+        # the run points these at its workdir, put them back afterwards
+        for name in ("EMBEDDING_PROVIDER", "EMBEDDING_CACHE_ENABLED", "QUERY_CACHE_ENABLED", "AST_CACHE_ENABLED",
+                     "INDEX_MANIFEST_DIR",
+                     "LEXICAL_INDEX_DIR", "SYMBOL_INDEX_DIR", "QDRANT_PATH", "QDRANT_HOST"):
+            monkeypatch.setattr(settings, name, getattr(settings, name))
+        monkeypatch.setattr(settings, "QDRANT_HOST", None)
+
+        result = await run_benchmark(40, queries=5, workdir=tmp_path, qdrant_path=":memory:")
+        assert result["index"]["files"] == 40 and result["index"]["chunks"] > 0
+        assert result["index"]["files_per_s"] > 0 and result["index"]["upsert_per_s"] > 0
+        assert result["query"]["count"] == 5
+        assert result["query"]["p50_ms"] <= result["query"]["p95_ms"] <= result["query"]["p99_ms"]
+
+        path = save_result(result, tmp_path / "results")
+        assert path.name.startswith("40-") and path.suffix == ".json"
+
 # manual test development
 async def manual_test_indexing():
     init_logger()
@@ -79,3 +429,49 @@ if __name__ == "__main__":
         print("CLI tool indexing test passed")
     else:
         print("CLI tool indexing test failed")
+
+class TestChunkBatch:
+    def test_batch_round_trips_chunks(self):
+        import pickle
+        from src.core.chunker import Chunk, ChunkBatch
+
+        chunks = [
+            Chunk(content=f"x = {i}\n", path=f"mod_{i % 3}.py", language="python", start_line=i + 1,
+                  end_line=i + 2, chunk_type="block" if i % 2 else "function", symbol_name=f"f{i}" if i % 2 else None)
+            for i in range(10)
+        ]
+        batch = ChunkBatch.from_chunks(chunks)
+        assert list(batch) == chunks
+        assert batch[4] == chunks[4]
+
+        # slices share the interned tables, batches from another process get re-interned
+        head, tail = batch.slice(0, 4), pickle.loads(pickle.dumps(batch.slice(4, 10)))
+        head.extend(tail)
+        assert list(head) == chunks
+        assert head.path(9) == "mod_0.py"
+
+    def test_batch_is_smaller_than_chunk_objects(self):
+        import tracemalloc
+        from src.core.chunker import Chunk, ChunkBatch
+
+        n = 20000
+        contents = [f"x = {i}\n" for i in range(n)]
+        def measure(build):
+            tracemalloc.start()
+            kept = build()
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del kept
+            return size
+
+        objects = measure(lambda: [
+            Chunk(content=contents[i], path=f"src/mod_{i // 50}.py", language="python",
+                  start_line=i, end_line=i + 10, chunk_type="function")
+            for i in range(n)
+        ])
+        def build_batch():
+            batch = ChunkBatch()
+            for i in range(n):
+                batch.append(contents[i], f"src/mod_{i // 50}.py", "python", i, i + 10, "function")
+            return batch
+        assert measure(build_batch) * 3 < objects
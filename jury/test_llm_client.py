@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# neded for pytest resolution
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core import llm_client
+from src.core.config import settings
+from src.core.query_rewriter import QueryRewriter
+
+class FakeMessages:
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.prompts = []
+        self.running = 0
+        self.peak = 0
+
+    async def create(self, model, max_tokens, messages):
+        self.prompts.append(messages[0]["content"])
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        return SimpleNamespace(content=[SimpleNamespace(text=f"answer to {messages[0]['content']}")])
+
+def install_fake_client(monkeypatch, delay: float, concurrency: int) -> FakeMessages:
+    monkeypatch.setattr(settings, "LLM_API_KEY", "test-key")
+    messages = FakeMessages(delay)
+    state = llm_client._LoopState.__new__(llm_client._LoopState)
+    state.client = SimpleNamespace(messages=messages)
+    state.semaphore = asyncio.Semaphore(concurrency)
+    state.in_flight = {}
+    llm_client._states[asyncio.get_running_loop()] = state
+    return messages
+
+class TestLLMClient:
+    @pytest.mark.asyncio
+    async def test_identical_prompts_share_a_request(self, monkeypatch):
+        messages = install_fake_client(monkeypatch, delay=0.05, concurrency=2)
+        answers = await asyncio.gather(*(llm_client.complete(f"q{i % 3}", max_tokens=10) for i in range(9)))
+        assert answers == [f"answer to q{i % 3}" for i in range(9)]
+        assert sorted(messages.prompts) == ["q0", "q1", "q2"]
+        assert messages.peak == 2
+
+    @pytest.mark.asyncio
+    async def test_slow_rewrite_falls_back_to_the_original_query(self, monkeypatch):
+        messages = install_fake_client(monkeypatch, delay=1, concurrency=2)
+        monkeypatch.setattr(settings, "QUERY_REWRITE_TIMEOUT_S", 0.05)
+        rewritten = await QueryRewriter().rewrite_query("how do users log in")
+        assert rewritten.expanded_terms == ["how do users log in"]
+        assert rewritten.reasoning == "Rewriting timed out"
+        assert len(messages.prompts) == 1
+        # the request itself keeps running for any other caller
+        for task in list(llm_client._states[asyncio.get_running_loop()].in_flight.values()):
+            task.cancel()
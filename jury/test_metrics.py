@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+import sys
+from pathlib import Path
+
+# neded for pytest resolution
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.config import settings
+from src.core.metrics import Metrics, breakdown, metrics, serve_metrics
+
+class TestMetrics:
+    @pytest.mark.asyncio
+    async def test_spans_feed_histograms_and_the_breakdown(self):
+        registry = Metrics()
+        async def stage(name, delay):
+            with registry.span(name):
+                await asyncio.sleep(delay)
+
+        with breakdown() as timings:
+            # stages in child tasks land in the same breakdown
+            await asyncio.gather(stage("embed", 0.01), stage("rewrite", 0.02))
+            await stage("embed", 0.01)
+        registry.count("queries")
+
+        assert set(timings) == {"embed", "rewrite"} and timings["embed"] >= 20
+        snapshot = registry.snapshot()
+        assert snapshot["stages"]["embed"]["count"] == 2 and snapshot["counters"] == {"queries": 1}
+        text = registry.render()
+        assert 'cbrt_stage_seconds_bucket{stage="embed",le="+Inf"} 2' in text
+        assert "cbrt_queries_total 1" in text
+
+    def test_disabled_metrics_record_nothing(self, monkeypatch):
+        monkeypatch.setattr(settings, "METRICS_ENABLED", False)
+        registry = Metrics()
+        with breakdown() as timings, registry.span("embed"):
+            registry.count("queries")
+        assert timings == {} and registry.snapshot() == {"counters": {}, "stages": {}}
+
+    @pytest.mark.asyncio
+    async def test_query_result_carries_the_stage_breakdown(self, monkeypatch):
+        from src.core.query_rewriter import RewrittenQuery
+        from src.core.rag_pipeline import CodebaseRAG
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "mock")
+        monkeypatch.setattr(settings, "QUERY_CACHE_ENABLED", False)
+
+        rag = CodebaseRAG()
+        async def rewrite(query):
+            with metrics.span("rewrite"):
+                return RewrittenQuery(query, ["login"], 'semantic', [], "")
+        monkeypatch.setattr(rag.query_rewriter, "rewrite_query", rewrite)
+        async def search(repo_id, query_vectors, rewritten_query, top_k):
+            return []
+        monkeypatch.setattr(rag.hybrid_search, "search", search)
+
+        result = await rag.query("repo", "how do users log in", generate_response=False)
+        assert {"rewrite", "embed", "retrieve"} <= set(result.timings_ms)
+
+    @pytest.mark.asyncio
+    async def test_prometheus_endpoint(self, unused_tcp_port):
+        metrics.count("test_scrapes")
+        server = asyncio.create_task(serve_metrics(unused_tcp_port))
+        try:
+            for _ in range(50):
+                try:
+                    reader, writer = await asyncio.open_connection("127.0.0.1", unused_tcp_port)
+                    break
+                except OSError:
+                    await asyncio.sleep(0.02)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = (await reader.read()).decode()
+            writer.close()
+        finally:
+            server.cancel()
+        assert response.startswith("HTTP/1.1 200 OK")
+        assert "cbrt_test_scrapes_total" in response
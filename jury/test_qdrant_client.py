@@ -0,0 +1,81 @@
+import pytest
+import sys
+from pathlib import Path
+
+# neded for pytest resolution
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.core.chunker import Chunk
+from src.core.config import settings
+from src.qdrant.qdrant_client import QdrantClient
+
+def make_chunks(n: int, path: str = "a.py"):
+    return [
+        Chunk(content=f"x = {i}\n", path=path, language="python", start_line=i + 1, end_line=i + 1, chunk_type="block")
+        for i in range(n)
+    ]
+
+def make_vectors(n: int):
+    return [[float(i + 1)] + [0.5] * (settings.EMBEDDING_DIMENSION - 1) for i in range(n)]
+
+class TestQdrantClient:
+    @pytest.mark.asyncio
+    async def test_upsert_is_batched_and_retried(self, monkeypatch):
+        qdrant = QdrantClient()
+        await qdrant.create_collection()
+        qdrant.upsert_batch_size = 10
+
+        real_upsert = qdrant.client.upsert
+        calls = []
+        def flaky_upsert(**kwargs):
+            calls.append(len(kwargs["points"].ids))
+            # the second batch fails once and is retried on its own
+            if len(calls) == 2:
+                raise ConnectionError("transient")
+            return real_upsert(**kwargs)
+        # the underlying client is shared, so patch it only for this test
+        monkeypatch.setattr(qdrant.client, "upsert", flaky_upsert)
+
+        await qdrant.upsert_chunks("batched_repo", make_chunks(25), make_vectors(25))
+
+        assert calls == [10, 10, 10, 5]
+        assert await qdrant.count_points("batched_repo") == 25
+
+    @pytest.mark.asyncio
+    async def test_delete_files(self):
+        qdrant = QdrantClient()
+        await qdrant.create_collection()
+        await qdrant.upsert_chunks("delete_repo", make_chunks(3, "a.py") + make_chunks(2, "b.py"), make_vectors(5))
+
+        await qdrant.delete_files("delete_repo", ["a.py"])
+
+        assert await qdrant.count_points("delete_repo") == 2
+
+    @pytest.mark.asyncio
+    async def test_point_ids_are_content_addressed(self):
+        from src.core.chunker import ChunkBatch
+        qdrant = QdrantClient()
+        await qdrant.create_collection()
+        chunks = ChunkBatch.from_chunks(make_chunks(3, "c.py"))
+        ids = qdrant.point_ids("ids_repo", chunks)
+        assert ids == qdrant.point_ids("ids_repo", ChunkBatch.from_chunks(make_chunks(3, "c.py")))
+        assert len(set(ids + qdrant.point_ids("fork_repo", chunks))) == 6
+
+        # upserting the same chunks again writes the same points
+        await qdrant.upsert_chunks("ids_repo", chunks, make_vectors(3))
+        await qdrant.upsert_chunks("ids_repo", chunks, make_vectors(3))
+        assert await qdrant.count_points("ids_repo") == 3
+        assert await qdrant.existing_ids(ids + [qdrant.point_ids("fork_repo", chunks)[0]]) == set(ids)
+
+        # an edited chunk is a new point, the stale one goes once the file is re-indexed
+        edited = make_chunks(3, "c.py")
+        edited[1].content = "x = 'changed'\n"
+        edited_ids = qdrant.point_ids("ids_repo", ChunkBatch.from_chunks(edited))
+        assert edited_ids[0] == ids[0] and edited_ids[1] != ids[1]
+        await qdrant.upsert_chunks("ids_repo", edited[1:2], make_vectors(1))
+        await qdrant.delete_files("ids_repo", ["c.py"], keep_ids=edited_ids)
+        assert await qdrant.existing_ids(ids + edited_ids) == set(edited_ids)
+
+    def test_client_is_shared(self):
+        assert QdrantClient().client is QdrantClient().client
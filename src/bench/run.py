@@ -0,0 +1,135 @@
+import json
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from src.bench.synthetic_repo import generate_repo, sample_queries
+from src.core.config import settings
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux and bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _per_second(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds > 0 else 0.0
+
+def _isolate(workdir: Path, embedder: str, qdrant_path: Optional[str]) -> None:
+    """point every on-disk index at workdir, so a run never touches ./data"""
+    settings.EMBEDDING_PROVIDER = embedder
+    settings.EMBEDDING_CACHE_ENABLED = False
+    settings.QUERY_CACHE_ENABLED = False
+    settings.AST_CACHE_ENABLED = False
+    settings.INDEX_MANIFEST_DIR = str(workdir / 'manifests')
+    settings.LEXICAL_INDEX_DIR = str(workdir / 'lexical')
+    settings.SYMBOL_INDEX_DIR = str(workdir / 'symbols')
+    if not settings.QDRANT_HOST:
+        settings.QDRANT_PATH = qdrant_path or str(workdir / 'qdrant')
+
+async def run_benchmark(
+    files: int,
+    queries: int = 200,
+    top_k: int = 5,
+    seed: int = 0,
+    embedder: str = 'mock',
+    workdir: Optional[Path] = None,
+    qdrant_path: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    index a synthetic repo of `files` files from scratch, then time `queries`
+    queries against it without response generation. qdrant is QDRANT_HOST
+    when set, otherwise a local on-disk store under workdir. embedding, parse and
+    query caches are off so every run does the same work
+    """
+    workdir = Path(workdir or Path(settings.GIT_DIR) / 'bench')
+    repo_id = f"bench_{files}_{seed}"
+    repo_path = workdir / 'repos' / repo_id
+    # generated once per size and seed, the marker sits outside the tree so it isn't indexed
+    complete = repo_path.with_name(repo_id + '.complete')
+    if not complete.exists():
+        shutil.rmtree(repo_path, ignore_errors=True)
+        logger.info(f"generating {files} file synthetic repo at {repo_path}")
+        generate_repo(repo_path, files, seed)
+        complete.touch()
+    # every run starts from an empty index
+    for name in ('manifests', 'lexical', 'symbols', 'qdrant'):
+        shutil.rmtree(workdir / name, ignore_errors=True)
+    _isolate(workdir, embedder, qdrant_path)
+
+    # imported after the settings are in place, the components read them on construction
+    from src.core.rag_pipeline import CodebaseRAG
+    rag = CodebaseRAG()
+    try:
+        await rag.init()
+
+        started = time.perf_counter()
+        stats = await rag.index_path(repo_id, repo_path, force_reindex=True)
+        index_seconds = time.perf_counter() - started
+
+        latencies: List[float] = []
+        for query in sample_queries(queries, seed):
+            started = time.perf_counter()
+            await rag.query(repo_id, query, top_k=top_k, generate_response=False)
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        rag.close()
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+
+    return {
+        'commit': _commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform()},
+        'settings': {
+            'embedder': settings.EMBEDDING_PROVIDER,
+            'embedding_model': settings.EMBEDDING_MODEL,
+            'embedding_workers': settings.EMBEDDING_WORKERS,
+            'parse_workers': settings.PARSE_WORKERS,
+            'embed_batch_size': settings.INDEX_EMBED_BATCH_SIZE,
+            'qdrant': settings.QDRANT_HOST or settings.QDRANT_PATH,
+        },
+        'repo': {'files': files, 'seed': seed},
+        'index': {
+            'seconds': round(index_seconds, 3),
+            'files': stats.files,
+            'failed_files': stats.failed_files,
+            'chunks': stats.chunks,
+            'files_per_s': _per_second(stats.files, index_seconds),
+            'chunks_per_s': _per_second(stats.chunks, index_seconds),
+            # busy time of each stage, so these are what the stage alone sustains
+            'embed_per_s': _per_second(stats.chunks, stats.embed_seconds),
+            'upsert_per_s': _per_second(stats.upserted, stats.upsert_seconds),
+        },
+        'query': {
+            'count': len(latencies),
+            'top_k': top_k,
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2),
+        },
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+    }
+
+def save_result(result: Dict[str, Any], output: Path) -> Path:
+    """write result as json. a directory gets a <files>-<commit>.json file"""
+    if output.suffix != '.json':
+        output = output / f"{result['repo']['files']}-{(result['commit'] or 'unknown')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2) + "\n")
+    return output
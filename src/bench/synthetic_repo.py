@@ -0,0 +1,148 @@
+import random
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+# words identifiers and prose are built from, so queries can be drawn from the same vocabulary
+WORDS = (
+    "user session token cache request response client server config index query parser "
+    "buffer stream record batch queue worker task event handler router schema model vector "
+    "file path repo commit diff chunk symbol embed search score rank filter merge split "
+    "load save open close read write send fetch parse build render validate encode decode"
+).split()
+
+FILES_PER_DIR = 20
+
+def _snake(rng: random.Random, parts: int = 2) -> str:
+    return "_".join(rng.choice(WORDS) for _ in range(parts))
+
+def _camel(rng: random.Random, parts: int = 2) -> str:
+    return "".join(rng.choice(WORDS).capitalize() for _ in range(parts))
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 12)))
+
+def _python(rng: random.Random, functions: int) -> str:
+    out = [f'"""{_sentence(rng)}"""', "import os", f"from {_snake(rng)} import {_camel(rng)}", ""]
+    name = _camel(rng)
+    out += [f"class {name}:", f'    """{_sentence(rng)}"""', ""]
+    for _ in range(functions):
+        arg = _snake(rng, 1)
+        out += [
+            f"    def {_snake(rng)}(self, {arg}):",
+            f'        """{_sentence(rng)}"""',
+            f"        {_snake(rng, 1)} = self.{_snake(rng)}({arg})",
+            f"        if not {arg}:",
+            f"            raise ValueError('{_sentence(rng)}')",
+            f"        return {arg}",
+            "",
+        ]
+    return "\n".join(out)
+
+def _javascript(rng: random.Random, functions: int) -> str:
+    out = [f"// {_sentence(rng)}", f"import {{ {_camel(rng)} }} from './{_snake(rng)}';", ""]
+    for _ in range(functions):
+        arg = _snake(rng, 1)
+        out += [
+            f"export function {rng.choice(WORDS)}{_camel(rng)}({arg}) {{",
+            f"  // {_sentence(rng)}",
+            f"  const {_snake(rng, 1)} = {arg}.{rng.choice(WORDS)}();",
+            f"  return {arg};",
+            "}",
+            "",
+        ]
+    return "\n".join(out)
+
+def _go(rng: random.Random, functions: int) -> str:
+    out = [f"// {_sentence(rng)}", f"package {rng.choice(WORDS)}", "", 'import "fmt"', ""]
+    for _ in range(functions):
+        arg = rng.choice(WORDS)
+        out += [
+            f"// {_camel(rng)} {_sentence(rng)}",
+            f"func {_camel(rng)}({arg} string) error {{",
+            f'\tfmt.Println("{_sentence(rng)}", {arg})',
+            "\treturn nil",
+            "}",
+            "",
+        ]
+    return "\n".join(out)
+
+def _rust(rng: random.Random, functions: int) -> str:
+    out = [f"//! {_sentence(rng)}", f"use crate::{_snake(rng)}::{_camel(rng)};", ""]
+    for _ in range(functions):
+        arg = _snake(rng, 1)
+        out += [
+            f"/// {_sentence(rng)}",
+            f"pub fn {_snake(rng)}({arg}: &str) -> Option<usize> {{",
+            f"    let {_snake(rng, 1)} = {arg}.len();",
+            f"    Some({arg}.len())",
+            "}",
+            "",
+        ]
+    return "\n".join(out)
+
+def _java(rng: random.Random, functions: int) -> str:
+    out = [f"package {rng.choice(WORDS)}.{rng.choice(WORDS)};", "", f"/** {_sentence(rng)} */",
+           f"public class {_camel(rng)} {{"]
+    for _ in range(functions):
+        arg = rng.choice(WORDS)
+        out += [
+            f"    /** {_sentence(rng)} */",
+            f"    public String {rng.choice(WORDS)}{_camel(rng)}(String {arg}) {{",
+            f"        return {arg}.trim();",
+            "    }",
+            "",
+        ]
+    out.append("}")
+    return "\n".join(out)
+
+def _markdown(rng: random.Random, sections: int) -> str:
+    out = [f"# {_camel(rng)}", ""]
+    for _ in range(sections):
+        out += [f"## {_sentence(rng)}", "", _sentence(rng) + ".", _sentence(rng) + ".", ""]
+    return "\n".join(out)
+
+# extension, writer, share of the files
+LANGUAGES: List[Tuple[str, Callable[[random.Random, int], str], float]] = [
+    (".py", _python, 0.35),
+    (".js", _javascript, 0.2),
+    (".go", _go, 0.15),
+    (".rs", _rust, 0.1),
+    (".java", _java, 0.1),
+    (".md", _markdown, 0.1),
+]
+
+def generate_repo(root: Path, files: int, seed: int = 0) -> Dict[str, int]:
+    """
+    write a deterministic multi-language source tree of `files` files under
+    root, FILES_PER_DIR per directory, nested two levels deep. the same size
+    and seed always produce the same tree. returns files per extension
+    """
+    rng = random.Random(seed)
+    extensions = [language[0] for language in LANGUAGES]
+    writers = {language[0]: language[1] for language in LANGUAGES}
+    weights = [language[2] for language in LANGUAGES]
+    counts = {extension: 0 for extension in extensions}
+
+    for i in range(files):
+        directory = root / f"pkg{i // (FILES_PER_DIR * FILES_PER_DIR)}" / f"mod{i // FILES_PER_DIR}"
+        if i % FILES_PER_DIR == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        extension = rng.choices(extensions, weights)[0]
+        # mostly small files with a long tail of large ones, like real repos
+        size = min(60, max(1, int(rng.paretovariate(1.5) * 3)))
+        (directory / f"{_snake(rng)}_{i}{extension}").write_text(writers[extension](rng, size))
+        counts[extension] += 1
+    return counts
+
+def sample_queries(count: int, seed: int = 0) -> List[str]:
+    """a mix of identifier lookups and natural language questions over WORDS"""
+    rng = random.Random(seed + 1)
+    queries = []
+    for i in range(count):
+        if i % 3 == 0:
+            queries.append(_camel(rng))
+        elif i % 3 == 1:
+            queries.append(f"how does the {rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(WORDS)}")
+        else:
+            queries.append(f"where do we {rng.choice(WORDS)} the {rng.choice(WORDS)} {rng.choice(WORDS)}")
+    return queries
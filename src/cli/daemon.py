@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+from dataclasses import asdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, Optional
+
+from loguru import logger
+
+from src.core.config import settings
+
+# only the client half runs on every cbrt invocation, so nothing heavy is imported at module level
+if TYPE_CHECKING:
+    from src.core.rag_pipeline import CodebaseRAG
+
+class DaemonError(Exception):
+    """a command the daemon received failed"""
+
+async def dispatch(rag: "CodebaseRAG", request: Dict[str, Any]) -> Any:
+    """run one cli command against rag. results are plain json-serializable values"""
+    command = request.get('command')
+    args = request.get('args') or {}
+    if command == 'ping':
+        return 'pong'
+    if command == 'stats':
+        from src.core.metrics import metrics
+        return {**metrics.snapshot(), 'query_cache': rag.query_cache.stats()}
+    if command == 'index':
+        return await rag.index_repo(args['github_url'], force_reindex=args.get('force_reindex', False))
+    if command == 'query':
+        result = await rag.query(
+            args['repo_id'],
+            args['query'],
+            top_k=args.get('top_k', 5),
+            search_mode=args.get('search_mode', 'hybrid'),
+            generate_response=args.get('generate_response', True)
+        )
+        return asdict(result)
+    raise ValueError(f"unknown command: {command}")
+
+async def dispatch_stream(rag: "CodebaseRAG", request: Dict[str, Any]) -> AsyncIterator[Any]:
+    """
+    like dispatch, but yields output as it is produced. a query yields its
+    result as a dict, then the answer text in pieces
+    """
+    if request.get('command') != 'query':
+        yield await dispatch(rag, request)
+        return
+    args = request.get('args') or {}
+    async for item in rag.query_stream(
+        args['repo_id'],
+        args['query'],
+        top_k=args.get('top_k', 5),
+        search_mode=args.get('search_mode', 'hybrid'),
+        generate_response=args.get('generate_response', True)
+    ):
+        yield item if isinstance(item, str) else asdict(item)
+
+async def serve(socket_path: Optional[str] = None, metrics_port: Optional[int] = None) -> None:
+    """
+    keep one initialized CodebaseRAG warm and answer cli commands over a unix
+    socket. with a metrics port, also serve prometheus metrics over http
+    """
+    from src.core.metrics import serve_metrics
+    from src.core.rag_pipeline import CodebaseRAG
+
+    path = Path(socket_path or settings.DAEMON_SOCKET)
+    if request('ping', socket_path=str(path)) == 'pong':
+        raise RuntimeError(f"a daemon is already listening on {path}")
+    path.parent.mkdir(parents = True, exist_ok = True)
+    path.unlink(missing_ok = True)
+
+    rag = CodebaseRAG()
+    await rag.init()
+    # pay for the model load and opening the caches now rather than on the first command
+    rag.embeddings
+    rag.ast_parser
+    rag.hybrid_search
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                    if message.get('stream'):
+                        # one line per item, then an end marker
+                        async for item in dispatch_stream(rag, message):
+                            writer.write(json.dumps({'ok': True, 'item': item}).encode() + b'\n')
+                            await writer.drain()
+                        response = {'ok': True, 'done': True}
+                    else:
+                        response = {'ok': True, 'result': await dispatch(rag, message)}
+                except Exception as e:
+                    logger.error(f"daemon command failed: {e}")
+                    response = {'ok': False, 'error': str(e)}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(handle, path=str(path))
+    # unwind through the finally below on kill as well as ctrl-c
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    logger.info(f"cbrt daemon listening on {path}")
+    metrics_port = metrics_port or settings.METRICS_PORT
+    exporter = asyncio.create_task(serve_metrics(metrics_port)) if metrics_port else None
+    if exporter is not None:
+        logger.info(f"serving metrics on http://127.0.0.1:{metrics_port}/metrics")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if exporter is not None:
+            exporter.cancel()
+        loop.remove_signal_handler(signal.SIGTERM)
+        path.unlink(missing_ok = True)
+        rag.close()
+
+def _connect(path: str) -> Optional[socket.socket]:
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(1.0)
+        sock.connect(path)
+    except OSError:
+        # stale socket file from a daemon that died
+        sock.close()
+        return None
+    return sock
+
+def _read_response(stream: Any) -> Dict[str, Any]:
+    line = stream.readline()
+    if not line:
+        raise DaemonError("daemon closed the connection")
+    response = json.loads(line)
+    if not response['ok']:
+        raise DaemonError(response['error'])
+    return response
+
+def request(command: str, socket_path: Optional[str] = None, timeout: Optional[float] = None, **args: Any) -> Any:
+    """
+    send a command to a running daemon and return its result, or None when
+    no daemon is listening. raises DaemonError if the command itself failed
+    """
+    sock = _connect(socket_path or settings.DAEMON_SOCKET)
+    if sock is None:
+        return None
+    with sock:
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps({'command': command, 'args': args}).encode() + b'\n')
+        with sock.makefile('rb') as stream:
+            return _read_response(stream)['result']
+
+def request_stream(
+    command: str,
+    socket_path: Optional[str] = None,
+    timeout: Optional[float] = None,
+    **args: Any
+) -> Optional[Iterator[Any]]:
+    """
+    send a command to a running daemon and iterate over its output as it
+    arrives (see dispatch_stream), or None when no daemon is listening
+    """
+    sock = _connect(socket_path or settings.DAEMON_SOCKET)
+    if sock is None:
+        return None
+    try:
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps({'command': command, 'args': args, 'stream': True}).encode() + b'\n')
+    except BaseException:
+        sock.close()
+        raise
+
+    def items() -> Iterator[Any]:
+        with sock, sock.makefile('rb') as stream:
+            while 'item' in (response := _read_response(stream)):
+                yield response['item']
+    return items()
@@ -1,39 +1,136 @@
 import asyncio
+import json
+from pathlib import Path
+from typing import Any, Callable, Optional
+
 import click
 
-from src.core.config import settings
-from src.core.rag_pipeline import CodebaseRAG
+from src.cli import daemon
 from src.utils.logger import init_logger
 
-def cli():
-    welcome_message = "codbease rag tool"
-    print(welcome_message)
+def run(ctx: click.Context, command: str, **args: Any) -> Any:
+    """run a command on the warm daemon if one is listening, otherwise in this process"""
+    if not ctx.obj['local']:
+        result = daemon.request(command, **args)
+        if result is not None:
+            return result
+
+    # only pay for the pipeline imports when there is no daemon to do the work
+    from src.core.rag_pipeline import CodebaseRAG
+    async def run_local() -> Any:
+        rag = CodebaseRAG()
+        try:
+            await rag.init()
+            return await daemon.dispatch(rag, {'command': command, 'args': args})
+        finally:
+            rag.close()
+    return asyncio.run(run_local())
+
+def run_stream(ctx: click.Context, command: str, on_item: Callable[[Any], None], **args: Any) -> None:
+    """like run, but hands each piece of output to on_item as soon as it is produced"""
+    if not ctx.obj['local']:
+        items = daemon.request_stream(command, **args)
+        if items is not None:
+            for item in items:
+                on_item(item)
+            return
+
+    from src.core.rag_pipeline import CodebaseRAG
+    async def run_local() -> None:
+        rag = CodebaseRAG()
+        try:
+            await rag.init()
+            async for item in daemon.dispatch_stream(rag, {'command': command, 'args': args}):
+                on_item(item)
+        finally:
+            rag.close()
+    asyncio.run(run_local())
+
+@click.group()
+@click.option('--local', is_flag=True, help="don't use a running daemon")
+@click.pass_context
+def cli(ctx: click.Context, local: bool) -> None:
     init_logger()
+    ctx.obj = {'local': local}
+
+@cli.command()
+@click.argument('github_url')
+@click.option('--force', is_flag=True, help="re-index every file")
+@click.pass_context
+def index(ctx: click.Context, github_url: str, force: bool) -> None:
+    """clone (or update) a repo and index it"""
+    repo_id = run(ctx, 'index', github_url=github_url, force_reindex=force)
+    print("Indexed repo: ", repo_id)
+
+@cli.command()
+@click.argument('repo_id')
+@click.argument('query')
+@click.option('--top-k', default=5, show_default=True)
+@click.option('--mode', type=click.Choice(['hybrid', 'ast', 'semantic']), default='hybrid', show_default=True)
+@click.pass_context
+def query(ctx: click.Context, repo_id: str, query: str, top_k: int, mode: str) -> None:
+    """search an indexed repo and answer a question about it"""
+    def show(item: Any) -> None:
+        if isinstance(item, str):
+            # answer text, printed as it streams in
+            print(item, end="", flush=True)
+            return
+        if not item['results']:
+            print("No results found")
+        for res in item['results']:
+            print(f"{res['file_path']}:{res['start_line']}-{res['end_line']}  Score: {res['score']:.3f}")
+            print("```")
+            print(res['content'])
+            print("```")
+        if item['results']:
+            print("Answer:")
+
+    run_stream(ctx, 'query', show, repo_id=repo_id, query=query, top_k=top_k, search_mode=mode)
+    print()
+
+@cli.command()
+@click.option('--files', default=1000, show_default=True, help="synthetic repo size, e.g. 1000, 10000 or 100000")
+@click.option('--queries', default=200, show_default=True)
+@click.option('--seed', default=0, show_default=True)
+@click.option('--embedder', type=click.Choice(['mock', 'sentence-transformers', 'onnx']), default='mock', show_default=True)
+@click.option('--workdir', type=click.Path(path_type=Path), default=Path('./data/bench'), show_default=True)
+@click.option('--output', type=click.Path(path_type=Path), default=None, help="json file or directory [default: <workdir>/results]")
+def bench(files: int, queries: int, seed: int, embedder: str, workdir: Path, output: Optional[Path]) -> None:
+    """index and query a synthetic repo offline and save the throughput and latency as json"""
+    # always in this process, a daemon's warm caches and settings would skew the numbers
+    from src.bench.run import run_benchmark, save_result
+    result = asyncio.run(run_benchmark(files, queries=queries, seed=seed, embedder=embedder, workdir=workdir))
+    path = save_result(result, output or workdir / 'results')
+    print(json.dumps({'index': result['index'], 'query': result['query'], 'peak_rss_mb': result['peak_rss_mb']}, indent=2))
+    print("Saved to", path)
 
-def index(github_url: str) -> None:
-    rag = CodebaseRAG()
-    async def run_index(github_url: str) -> str:
-        await rag.init()
-        return await rag.index_repo(github_url)
-
-def query(repo_id: str, query: str, top_k: int = 5, mode: str = "hybrid") -> None:
-    rag = CodebaseRAG()
-    async def run_query() -> None:
-        await rag.init()
-        return await rag.query(repo_id, query, top_k, mode)
-    result = asyncio.run(run_query())
-
-    if not result.results:
-        print("No results found")
-
-    if result.generated_response:
-        print("Refined query: ", result.generated_response)
-    for i, res in enumerate(result.results, 1):
-        print("Score: ", res.score)
-        print("```")
-        print(res.content)
-        print("```")
+@cli.command()
+@click.option('--json', 'as_json', is_flag=True, help="print the raw snapshot")
+def stats(as_json: bool) -> None:
+    """per-stage latencies and counters of the running daemon"""
+    # metrics live in the process doing the work, a fresh local process has none
+    snapshot = daemon.request('stats')
+    if snapshot is None:
+        print("No daemon running, start one with `cbrt daemon` to collect metrics")
+        return
+    if as_json:
+        print(json.dumps(snapshot, indent=2))
+        return
+    print(f"{'stage':<24}{'count':>8}{'mean ms':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, s in sorted(snapshot['stages'].items()):
+        print(f"{stage:<24}{s['count']:>8}{s['mean_ms']:>12.1f}{s['p50_ms']:>10g}{s['p95_ms']:>10g}{s['p99_ms']:>10g}")
+    print()
+    for name, value in sorted(snapshot['counters'].items()):
+        print(f"{name:<32}{value:>12g}")
+    for name, cache in snapshot['query_cache'].items():
+        print(f"query cache {name:<20}{cache['hits']:>6} hits {cache['misses']:>6} misses {cache['entries']:>6} entries")
 
+@cli.command(name='daemon')
+@click.option('--socket', 'socket_path', default=None, help="unix socket to listen on")
+@click.option('--metrics-port', type=int, default=None, help="serve prometheus metrics on this port")
+def run_daemon(socket_path: str, metrics_port: Optional[int]) -> None:
+    """keep the models and clients warm for other cbrt invocations"""
+    asyncio.run(daemon.serve(socket_path, metrics_port))
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,43 @@
+from pathlib import Path
+from typing import Optional
+
+from src.core.config import settings
+from src.core.sqlite_cache import SqliteLRUCache
+
+class ASTCache(SqliteLRUCache):
+    """
+    persistent cache of parse results keyed on (git blob sha, language,
+    extractor version), so a file is parsed once no matter how many
+    re-indexes, branches or forks it shows up in. payloads are opaque bytes
+    and the least recently used rows are evicted past max_bytes. parse
+    workers in other processes open the same file, sqlite serializes them
+    """
+
+    _TABLE = 'parses'
+    _KEY = ('blob', 'language', 'version')
+    _VALUE = 'payload'
+    _COLUMNS = "blob BLOB NOT NULL, language TEXT NOT NULL, version INTEGER NOT NULL, payload BLOB NOT NULL"
+
+    def __init__(self, version: int, path: Optional[str] = None, max_bytes: Optional[int] = None) -> None:
+        self.version = version
+        super().__init__(
+            Path(path or settings.AST_CACHE_PATH),
+            max_bytes if max_bytes is not None else settings.AST_CACHE_MAX_MB * 1024 * 1024
+        )
+
+    def get(self, blob: bytes, language: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM parses WHERE blob = ? AND language = ? AND version = ?",
+                (blob, language, self.version)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch([(blob, language, self.version)])
+            return row[0]
+
+    def put(self, blob: bytes, language: str, payload: bytes) -> None:
+        with self._lock:
+            self._insert([(blob, language, self.version, payload)])
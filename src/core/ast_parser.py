@@ -1,8 +1,17 @@
-from typing import List, Optional, Any, Dict
+import importlib
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional, Any, Dict, Tuple, Union
 from pathlib import Path
 
 from loguru import logger
 
+from src.core.ast_cache import ASTCache
+from src.core.config import settings
+from src.core.index_manifest import blob_sha
+
+@dataclass(slots=True)
 class Symbol:
     name: str
     type: str # function, class, method, etc.
@@ -10,72 +19,341 @@ class Symbol:
     end_line: int
     signature: Optional[str] = None
     docstring: Optional[str] = None
+    parent: Optional[str] = None # nearest enclosing definition, the class for methods
 
+@dataclass(slots=True)
 class ASTMetadata:
     language: str
-    symbols: List[Symbol]
-    dependencies: List[str] # import?
-    lines: int
+    symbols: List[Symbol] = field(default_factory=list)
+    dependencies: List[str] = field(default_factory=list) # import?
+    lines: int = 0
     raw_ast: Optional[Any] = None
 
+# language -> (grammar package, function returning the language pointer)
+_GRAMMARS: Dict[str, Tuple[str, str]] = {
+    'python': ('tree_sitter_python', 'language'),
+    'javascript': ('tree_sitter_javascript', 'language'),
+    'typescript': ('tree_sitter_typescript', 'language_typescript'),
+    'tsx': ('tree_sitter_typescript', 'language_tsx'),
+    'c': ('tree_sitter_c', 'language'),
+    'cpp': ('tree_sitter_cpp', 'language'),
+}
+
+_JS_SYMBOLS = {
+    'function_declaration': 'function',
+    'generator_function_declaration': 'function',
+    'class_declaration': 'class',
+    'method_definition': 'method',
+}
+_TS_SYMBOLS = {
+    **_JS_SYMBOLS,
+    'abstract_class_declaration': 'class',
+    'interface_declaration': 'interface',
+    'type_alias_declaration': 'type',
+    'enum_declaration': 'enum',
+}
+_C_SYMBOLS = {
+    'function_definition': 'function',
+    'struct_specifier': 'struct',
+    'union_specifier': 'union',
+    'enum_specifier': 'enum',
+    'type_definition': 'type',
+}
+# tree-sitter node type -> symbol type
+_SYMBOL_NODES: Dict[str, Dict[str, str]] = {
+    'python': {'function_definition': 'function', 'class_definition': 'class'},
+    'javascript': _JS_SYMBOLS,
+    'typescript': _TS_SYMBOLS,
+    'tsx': _TS_SYMBOLS,
+    'c': _C_SYMBOLS,
+    'cpp': {**_C_SYMBOLS, 'class_specifier': 'class'},
+}
+CLASS_TYPES = {'class', 'struct', 'interface'}
+# declarator wrappers to look through for a c/c++ function or typedef name
+_DECLARATOR_WRAPPERS = {
+    'function_declarator', 'pointer_declarator', 'reference_declarator', 'parenthesized_declarator',
+    'array_declarator', 'attributed_declarator',
+}
+_JS_FUNCTION_VALUES = {'arrow_function', 'function_expression', 'function', 'generator_function'}
+
+# bump when extraction changes, so cached parse results from older code are ignored
+_EXTRACT_VERSION = 2
+
+@dataclass(slots=True)
+class _Grammar:
+    language: Any
+    symbols: Any # compiled query, every symbol node as @symbol
+    imports: Any # compiled query, every import node as @import
+
+# grammars and their compiled queries, loaded on the first file of each language.
+# None marks a language whose grammar is not installed
+_grammars: Dict[str, Optional[_Grammar]] = {}
+_grammar_lock = threading.Lock()
+# tree-sitter parsers are not thread safe, so each thread (and so each parse
+# worker) keeps one per language and reuses it for every file
+_local = threading.local()
+_QueryCursor: Any = None
+
+def _grammar(language: str) -> Optional[_Grammar]:
+    grammar = _grammars.get(language, False)
+    if grammar is not False:
+        return grammar
+    with _grammar_lock:
+        if language not in _grammars:
+            _grammars[language] = _load_grammar(language)
+        return _grammars[language]
+
+def _load_grammar(language: str) -> Optional[_Grammar]:
+    global _QueryCursor
+    if language not in _GRAMMARS:
+        return None
+    try:
+        import tree_sitter
+        from tree_sitter import Language, Query
+    except ImportError:
+        logger.warning("tree-sitter not installed, files will be chunked by line")
+        return None
+    # tree-sitter < 0.25 runs captures on the query itself
+    _QueryCursor = getattr(tree_sitter, 'QueryCursor', None)
+    package, attr = _GRAMMARS[language]
+    try:
+        grammar = Language(getattr(importlib.import_module(package), attr)())
+        return _Grammar(
+            language=grammar,
+            symbols=Query(grammar, _symbol_query(language, grammar)),
+            imports=Query(grammar, _IMPORT_QUERIES[language])
+        )
+    except Exception as e:
+        logger.debug(f"no tree-sitter grammar for {language}: {e}")
+        return None
+
+def _symbol_query(language: str, grammar: Any) -> str:
+    # node types missing from the installed grammar version would fail the whole query
+    def known(kind: str) -> bool:
+        return bool(grammar.id_for_node_kind(kind, True))
+
+    patterns = [f"({kind}) @symbol" for kind in _SYMBOL_NODES[language] if known(kind)]
+    if language in ('javascript', 'typescript', 'tsx'):
+        # const handler = () => {...}
+        values = ' '.join(f"({kind})" for kind in _JS_FUNCTION_VALUES if known(kind))
+        patterns.append(f"(variable_declarator value: [{values}]) @symbol")
+    return '\n'.join(patterns)
+
+_JS_IMPORTS = "(import_statement) @import (export_statement source: (_)) @import"
+_IMPORT_QUERIES: Dict[str, str] = {
+    'python': "(import_statement) @import (import_from_statement) @import",
+    'javascript': _JS_IMPORTS,
+    'typescript': _JS_IMPORTS,
+    'tsx': _JS_IMPORTS,
+    'c': "(preproc_include) @import",
+    'cpp': "(preproc_include) @import",
+}
+
+def _parser(language: str, grammar: _Grammar) -> Any:
+    parsers = getattr(_local, 'parsers', None)
+    if parsers is None:
+        parsers = _local.parsers = {}
+    parser = parsers.get(language)
+    if parser is None:
+        from tree_sitter import Parser
+        parser = parsers[language] = Parser(grammar.language)
+    return parser
+
+def _captures(query: Any, node: Any, name: str) -> List[Any]:
+    """nodes captured as name, in document order with enclosing nodes first"""
+    cursor = _QueryCursor(query) if _QueryCursor is not None else query
+    nodes = cursor.captures(node).get(name, [])
+    return sorted(nodes, key=lambda n: (n.start_byte, -n.end_byte))
+
 class ASTParser:
-    def __init__(self) -> None:
-        self.parsers: Dict[str, Any] = {}
-        self._init_parsers()
+    """
+    extracts symbols and imports with tree-sitter. grammars load on the first
+    file of their language, and with a cache, results are stored by git blob
+    sha so a file with the same contents is never parsed twice
+    """
 
-    def _init_parsers(self) -> None:
-        try:
-            pass
-        except Exception as e:
-            pass
-        pass
+    def __init__(self, cache: Optional[ASTCache] = None) -> None:
+        self.cache = cache
+        if cache is None and settings.AST_CACHE_ENABLED:
+            try:
+                self.cache = ASTCache(_EXTRACT_VERSION)
+            except Exception as e:
+                logger.warning(f"ast cache unavailable, every file will be parsed: {e}")
 
-    def parse_file(self, path: Path, content: str) -> Optional[ASTMetadata]:
+    def parse_file(self, path: Path, content: Union[str, bytes]) -> Optional[ASTMetadata]:
         language = self._detect_language(path)
-        if not language or language not in self.parsers:
+        if not language or language not in _GRAMMARS:
+            logger.debug(f"Could not find a suitable parser for file: {path}")
+            return None
+        # callers that read the file pass its bytes, which is what tree-sitter parses
+        source = content if isinstance(content, bytes) else content.encode()
+        blob = blob_sha(source) if self.cache is not None else None
+        if blob is not None:
+            cached = self.cache.get(blob, language)
+            if cached is not None:
+                return _decode(language, cached)
+
+        grammar = _grammar(language)
+        if grammar is None:
             logger.debug(f"Could not find a suitable parser for file: {path}")
             return None
         try:
-            parser = self.parsers[language]
-            tree = parser.parse(content.encode())
-            symbols = self._extract_symbols(tree.root_node, language, content)
-            dependencies = self._extract_dependencies(tree.root_node, language, content)
-            pass
+            tree = _parser(language, grammar).parse(source)
+            metadata = ASTMetadata(
+                language=language,
+                symbols=self._extract_symbols(tree.root_node, language, source, grammar),
+                dependencies=self._extract_dependencies(tree.root_node, language, source, grammar),
+                lines=source.count(b'\n') + 1
+            )
         except Exception as e:
-            pass
+            logger.warning(f"Failed to parse {path}: {e}")
+            return None
+        if blob is not None:
+            self.cache.put(blob, language, _encode(metadata))
+        return metadata
 
-    def _extract_symbols(self, node: Any, language: str, content: str) -> List[Symbol]:
+    def _extract_symbols(self, node: Any, language: str, content: bytes, grammar: _Grammar) -> List[Symbol]:
         symbols: List[Symbol] = []
-        if language == 'python':
-            pass
-        elif language == 'javascript':
-            pass
-        elif language == 'typescript':
-            pass
-        elif language == 'cpp':
-            pass
-        elif language == 'c':
-            pass
+        symbol_nodes = _SYMBOL_NODES[language]
+        # definitions enclosing the current node, as (end byte, name, type)
+        enclosing: List[Tuple[int, str, str]] = []
+        for current in _captures(grammar.symbols, node, 'symbol'):
+            while enclosing and enclosing[-1][0] <= current.start_byte:
+                enclosing.pop()
+            parent, parent_type = enclosing[-1][1:] if enclosing else (None, None)
+
+            if current.type == 'variable_declarator':
+                symbol_type = 'function'
+                name_node = current.child_by_field_name('name')
+            else:
+                symbol_type = symbol_nodes[current.type]
+                name_node = self._symbol_name_node(current, language)
+            if name_node is None:
+                continue
+
+            name = self._text(name_node, content)
+            # only direct members of a class are methods, not functions nested in one
+            if symbol_type == 'function' and parent_type in CLASS_TYPES and language != 'c':
+                symbol_type = 'method'
+            symbols.append(Symbol(
+                name=name,
+                type=symbol_type,
+                start_line=current.start_point[0] + 1,
+                end_line=current.end_point[0] + 1,
+                signature=self._signature(current, content),
+                docstring=self._docstring(current, language, content),
+                parent=parent
+            ))
+            enclosing.append((current.end_byte, name, symbol_type))
         return symbols
 
-    def _extract_dependencies(self, node: Any, language: str, content: str) -> List[str]:
+    def _symbol_name_node(self, node: Any, language: str) -> Optional[Any]:
+        if language in ('c', 'cpp'):
+            if node.type in ('struct_specifier', 'union_specifier', 'enum_specifier', 'class_specifier'):
+                # only definitions, not every `struct foo *x` usage
+                if node.child_by_field_name('body') is None:
+                    return None
+                return node.child_by_field_name('name')
+            declarator = node.child_by_field_name('declarator')
+            while declarator is not None and declarator.type in _DECLARATOR_WRAPPERS:
+                declarator = declarator.child_by_field_name('declarator')
+            return declarator
+        return node.child_by_field_name('name')
+
+    def _signature(self, node: Any, content: bytes) -> str:
+        body = node.child_by_field_name('body')
+        end = body.start_byte if body is not None else node.end_byte
+        text = content[node.start_byte:end].decode('utf-8', errors='ignore')
+        if body is None:
+            text = text.split('\n', 1)[0]
+        return ' '.join(text.split()).rstrip(':{; ')
+
+    def _docstring(self, node: Any, language: str, content: bytes) -> Optional[str]:
+        if language == 'python':
+            body = node.child_by_field_name('body')
+            first = body.named_children[0] if body is not None and body.named_children else None
+            if first is not None and first.type == 'expression_statement' and first.named_children:
+                string = first.named_children[0]
+                if string.type == 'string':
+                    parts = [self._text(c, content) for c in string.named_children if c.type == 'string_content']
+                    return ''.join(parts).strip() or None
+            return None
+
+        # everything else: the comment block right above the definition
+        if node.parent is not None and node.parent.type in ('export_statement', 'template_declaration'):
+            node = node.parent
+        comments: List[str] = []
+        sibling = node.prev_named_sibling
+        row = node.start_point[0]
+        while sibling is not None and sibling.type == 'comment' and sibling.end_point[0] >= row - 1:
+            comments.append(self._text(sibling, content))
+            row = sibling.start_point[0]
+            sibling = sibling.prev_named_sibling
+        if not comments:
+            return None
+        return '\n'.join(reversed(comments)).strip()
+
+    def _extract_dependencies(self, node: Any, language: str, content: bytes, grammar: _Grammar) -> List[str]:
         dependencies: List[str] = []
-        return dependencies
+        for current in _captures(grammar.imports, node, 'import'):
+            if current.type == 'import_statement' and language == 'python':
+                for child in current.named_children:
+                    target = child.child_by_field_name('name') if child.type == 'aliased_import' else child
+                    dependencies.append(self._text(target, content))
+            elif current.type == 'import_from_statement':
+                module = current.child_by_field_name('module_name')
+                if module is not None:
+                    dependencies.append(self._text(module, content))
+            elif current.type == 'preproc_include':
+                include = current.child_by_field_name('path')
+                if include is not None:
+                    dependencies.append(self._text(include, content).strip('<>"'))
+            else:
+                source = current.child_by_field_name('source')
+                if source is not None:
+                    dependencies.append(self._text(source, content).strip('\'"`'))
+        return list(dict.fromkeys(dependencies))
+
+    def _text(self, node: Any, content: bytes) -> str:
+        return content[node.start_byte:node.end_byte].decode('utf-8', errors='ignore')
 
     def _detect_language(self, path: Path) -> Optional[str]:
-        language_map = {
-            '.py': 'python',
-            '.js': 'javascript',
-            '.ts': 'typescript',
-            '.tsx': 'tsx',
-            '.jsx': 'javascript',
-            '.java': 'java',
-            '.cpp': 'cpp',
-            '.cc': 'cpp',
-            '.c': 'c',
-            '.h': 'cpp',
-            '.hpp': 'cpp',
-            '.go': 'go',
-            '.rs': 'rust',
-        }
-        return language_map.get(path.suffix.lower())
+        return detect_language(path)
+
+_LANGUAGES = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.ts': 'typescript',
+    '.tsx': 'tsx',
+    '.jsx': 'javascript',
+    '.java': 'java',
+    '.cpp': 'cpp',
+    '.cc': 'cpp',
+    '.c': 'c',
+    '.h': 'cpp',
+    '.hpp': 'cpp',
+    '.go': 'go',
+    '.rs': 'rust',
+}
+
+def detect_language(path: Path) -> Optional[str]:
+    return _LANGUAGES.get(path.suffix.lower())
+
+def _encode(metadata: ASTMetadata) -> bytes:
+    return json.dumps([
+        [[s.name, s.type, s.start_line, s.end_line, s.signature, s.docstring, s.parent] for s in metadata.symbols],
+        metadata.dependencies,
+        metadata.lines,
+    ], separators=(',', ':')).encode()
+
+def _decode(language: str, payload: bytes) -> ASTMetadata:
+    symbols, dependencies, lines = json.loads(payload)
+    return ASTMetadata(
+        language=language,
+        symbols=[
+            Symbol(name=name, type=kind, start_line=start, end_line=end, signature=signature, docstring=docstring, parent=parent)
+            for name, kind, start, end, signature, docstring, parent in symbols
+        ],
+        dependencies=dependencies,
+        lines=lines
+    )
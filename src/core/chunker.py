@@ -1,13 +1,14 @@
+from array import array
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-from src.core.ast_parser import ASTMetadata
+from src.core.ast_parser import ASTMetadata, CLASS_TYPES, Symbol, detect_language
 from src.core.config import settings
 
 from loguru import logger
 
-@dataclass
+@dataclass(slots=True)
 class Chunk:
     content: str
     path: str
@@ -18,87 +19,268 @@ class Chunk:
     symbol_name: Optional[str] = None
     docstring: Optional[str] = None
     ast_metadata: Optional[dict] = None
-    pass
+
+# (content, path, language, start_line, end_line, chunk_type, symbol_name, docstring)
+ChunkRow = Tuple[str, str, Optional[str], int, int, str, Optional[str], Optional[str]]
+
+class _Interned:
+    """append-only string table. ids stay valid, so slices of a batch share it"""
+    __slots__ = ('values', 'ids')
+
+    def __init__(self) -> None:
+        self.values: List[Optional[str]] = []
+        self.ids: Dict[Optional[str], int] = {}
+
+    def id(self, value: Optional[str]) -> int:
+        index = self.ids.get(value)
+        if index is None:
+            index = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+def _reintern(ids: array, table: _Interned, source: _Interned) -> Iterable[int]:
+    if table is source:
+        return ids
+    # different tables (e.g. a batch built in a worker process)
+    remap = [table.id(value) for value in source.values]
+    return (remap[i] for i in ids)
+
+class ChunkBatch:
+    """
+    columnar list of chunks. paths, languages and chunk types are interned
+    and line numbers live in flat uint32 arrays, so a batch costs a few
+    list/array slots per chunk instead of one object (and its strings) each.
+    indexing or iterating materializes Chunk objects on demand
+    """
+
+    __slots__ = (
+        'contents', 'symbol_names', 'docstrings', 'start_lines', 'end_lines',
+        'path_ids', 'language_ids', 'type_ids', '_paths', '_languages', '_types',
+    )
+
+    def __init__(self, tables: Optional["ChunkBatch"] = None) -> None:
+        self.contents: List[str] = []
+        self.symbol_names: List[Optional[str]] = []
+        self.docstrings: List[Optional[str]] = []
+        self.start_lines = array('I')
+        self.end_lines = array('I')
+        self.path_ids = array('I')
+        self.language_ids = array('I')
+        self.type_ids = array('I')
+        self._paths = tables._paths if tables else _Interned()
+        self._languages = tables._languages if tables else _Interned()
+        self._types = tables._types if tables else _Interned()
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[Chunk]) -> "ChunkBatch":
+        if isinstance(chunks, ChunkBatch):
+            return chunks
+        batch = cls()
+        for c in chunks:
+            batch.append(c.content, c.path, c.language, c.start_line, c.end_line, c.chunk_type, c.symbol_name, c.docstring)
+        return batch
+
+    def append(
+        self,
+        content: str,
+        path: str,
+        language: Optional[str],
+        start_line: int,
+        end_line: int,
+        chunk_type: str,
+        symbol_name: Optional[str] = None,
+        docstring: Optional[str] = None
+    ) -> None:
+        self.contents.append(content)
+        self.symbol_names.append(symbol_name)
+        self.docstrings.append(docstring)
+        self.start_lines.append(start_line)
+        self.end_lines.append(end_line)
+        self.path_ids.append(self._paths.id(str(path)))
+        self.language_ids.append(self._languages.id(language))
+        self.type_ids.append(self._types.id(chunk_type))
+
+    def extend(self, other: "ChunkBatch") -> None:
+        self.contents.extend(other.contents)
+        self.symbol_names.extend(other.symbol_names)
+        self.docstrings.extend(other.docstrings)
+        self.start_lines.extend(other.start_lines)
+        self.end_lines.extend(other.end_lines)
+        self.path_ids.extend(_reintern(other.path_ids, self._paths, other._paths))
+        self.language_ids.extend(_reintern(other.language_ids, self._languages, other._languages))
+        self.type_ids.extend(_reintern(other.type_ids, self._types, other._types))
+
+    def slice(self, start: int, stop: int) -> "ChunkBatch":
+        batch = ChunkBatch(tables=self)
+        batch.contents = self.contents[start:stop]
+        batch.symbol_names = self.symbol_names[start:stop]
+        batch.docstrings = self.docstrings[start:stop]
+        batch.start_lines = self.start_lines[start:stop]
+        batch.end_lines = self.end_lines[start:stop]
+        batch.path_ids = self.path_ids[start:stop]
+        batch.language_ids = self.language_ids[start:stop]
+        batch.type_ids = self.type_ids[start:stop]
+        return batch
+
+    def take(self, indices: Sequence[int]) -> "ChunkBatch":
+        """the chunks at indices, in that order"""
+        batch = ChunkBatch(tables=self)
+        batch.contents = [self.contents[i] for i in indices]
+        batch.symbol_names = [self.symbol_names[i] for i in indices]
+        batch.docstrings = [self.docstrings[i] for i in indices]
+        batch.start_lines = array('I', (self.start_lines[i] for i in indices))
+        batch.end_lines = array('I', (self.end_lines[i] for i in indices))
+        batch.path_ids = array('I', (self.path_ids[i] for i in indices))
+        batch.language_ids = array('I', (self.language_ids[i] for i in indices))
+        batch.type_ids = array('I', (self.type_ids[i] for i in indices))
+        return batch
+
+    def path(self, index: int) -> str:
+        return self._paths.values[self.path_ids[index]]
+
+    def rows(self) -> Iterator[ChunkRow]:
+        """plain tuples, cheaper than materializing Chunk objects"""
+        paths, languages, types = self._paths.values, self._languages.values, self._types.values
+        for content, path_id, language_id, start, end, type_id, symbol_name, docstring in zip(
+            self.contents, self.path_ids, self.language_ids, self.start_lines, self.end_lines,
+            self.type_ids, self.symbol_names, self.docstrings
+        ):
+            yield content, paths[path_id], languages[language_id], start, end, types[type_id], symbol_name, docstring
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def __getitem__(self, index: int) -> Chunk:
+        return Chunk(
+            content = self.contents[index],
+            path = self._paths.values[self.path_ids[index]],
+            language = self._languages.values[self.language_ids[index]],
+            start_line = self.start_lines[index],
+            end_line = self.end_lines[index],
+            chunk_type = self._types.values[self.type_ids[index]],
+            symbol_name = self.symbol_names[index],
+            docstring = self.docstrings[index]
+        )
+
+    def __iter__(self) -> Iterator[Chunk]:
+        for row in self.rows():
+            yield Chunk(*row)
 
 class Chunker:
     def __init__(self) -> None:
         self.chunk_size = settings.CHUNK_SIZE
         self.overlap = settings.CHUNK_OVERLAP
 
-    def chunk_file(self, path: Path, content: str, ast_metadata: Optional[ASTMetadata]) -> List[Chunk]:
+    def chunk_file(self, path: Path, content: str, ast_metadata: Optional[ASTMetadata]) -> ChunkBatch:
         # TODO implement more thorough chunking strategy. see ZeroEntropy docs
         lines = content.splitlines(keepends=True)
-        chunks: List[Chunk] = []
-        language = self._detect_language(path)
+        chunks = ChunkBatch()
+        language = detect_language(path)
         if ast_metadata and ast_metadata.symbols:
-            chunks.extend(self._chunk_by_symbols(path, lines, language, ast_metadata))
+            self._chunk_by_symbols(chunks, str(path), lines, language, ast_metadata)
         else:
             # fallback
-            chunks.extend(self._chunk_by_line(path, lines, language, ast_metadata))
+            self._chunk_by_line(chunks, str(path), lines, language)
 
         logger.debug(f"Created {len(chunks)} chunks from {path}")
 
         return chunks
 
-    def _detect_language(self, path: Path) -> Optional[str]:
-        language_map = {
-            '.py': 'python',
-            '.js': 'javascript',
-            '.ts': 'typescript',
-            '.tsx': 'tsx',
-            '.jsx': 'javascript',
-            '.java': 'java',
-            '.cpp': 'cpp',
-            '.cc': 'cpp',
-            '.c': 'c',
-            '.h': 'cpp',
-            '.hpp': 'cpp',
-            '.go': 'go',
-            '.rs': 'rust',
-        }
-        return language_map.get(path.suffix.lower())
-
-    def _chunk_by_symbols(self, path: Path, lines: str, language: str, ast_metadata: ASTMetadata) -> List[Chunk]:
-        chunks: List[Chunk] = []
-        for symbol in ast_metadata.symbols:
-            chunk_lines = lines[symbol.start_line - 1 :symbol.end_line]
-            content = ''.join(chunk_lines)
+    def _chunk_by_symbols(
+        self,
+        chunks: ChunkBatch,
+        path: str,
+        lines: List[str],
+        language: Optional[str],
+        ast_metadata: ASTMetadata
+    ) -> None:
+        symbols = sorted(ast_metadata.symbols, key=lambda s: (s.start_line, -s.end_line))
+        self._chunk_range(chunks, path, lines, language, 1, len(lines), symbols)
 
-            if content.strip():
-                chunks.append(Chunk(
-                    content = content,
-                    path = str(path),
-                    language = language,
-                    start_line = symbol.start_line,
-                    end_line = symbol.end_line,
-                    chunk_type = symbol.type,
-                    symbol_name = symbol.name,
-                    docstring = symbol.docstring,
-                    ast_metadata = {'symbol_type': symbol.type}
-                ))
-        if not chunks:
-            chunks = self._chunk_by_line(path, lines, language)
-        return chunks
+    def _chunk_range(
+        self,
+        chunks: ChunkBatch,
+        path: str,
+        lines: List[str],
+        language: Optional[str],
+        start: int,
+        end: int,
+        symbols: List[Symbol]
+    ) -> int:
+        """
+        chunk lines start..end (1-based, inclusive) so every line lands in
+        exactly one chunk: each symbol as its own chunk and the lines between
+        symbols (imports, constants, module level code) by line. functions
+        keep anything nested in them, classes are split into a header chunk
+        and one per member. returns the last line covered
+        """
+        line = start
+        i = 0
+        while i < len(symbols):
+            symbol = symbols[i]
+            # symbols starting inside this one are nested in it
+            j = i + 1
+            while j < len(symbols) and symbols[j].start_line <= symbol.end_line:
+                j += 1
+            nested = symbols[i + 1:j]
+            i = j
+            if symbol.end_line < line:
+                continue
+            first = max(symbol.start_line, line)
+            if first > line:
+                self._chunk_by_line(chunks, path, lines, language, line, first - 1)
+
+            if symbol.type in CLASS_TYPES and nested:
+                header_end = max(first, nested[0].start_line) - 1
+                if header_end >= first:
+                    self._chunk_symbol(chunks, path, lines, language, symbol, first, header_end)
+                last = self._chunk_range(chunks, path, lines, language, header_end + 1, symbol.end_line, nested)
+            else:
+                self._chunk_symbol(chunks, path, lines, language, symbol, first, symbol.end_line)
+                last = symbol.end_line
+            line = max(line, last + 1)
 
-    def _chunk_by_line(self, path: Path, lines: str, language: str, ast_metadata: Optional[dict] = None) -> List[Chunk]:
-        chunks: List[Chunk] = []
-        size = len(lines)
-        start = 0
+        if line <= end:
+            self._chunk_by_line(chunks, path, lines, language, line, end)
+            line = end + 1
+        return line - 1
+
+    def _chunk_symbol(
+        self,
+        chunks: ChunkBatch,
+        path: str,
+        lines: List[str],
+        language: Optional[str],
+        symbol: Symbol,
+        start: int,
+        end: int
+    ) -> None:
+        # symbols longer than a chunk are split like plain text, keeping their name
+        self._chunk_by_line(
+            chunks, path, lines, language, start, end,
+            chunk_type=symbol.type, symbol_name=symbol.name, docstring=symbol.docstring
+        )
+
+    def _chunk_by_line(
+        self,
+        chunks: ChunkBatch,
+        path: str,
+        lines: List[str],
+        language: Optional[str],
+        start: int = 1,
+        end: Optional[int] = None,
+        chunk_type: str = 'block',
+        symbol_name: Optional[str] = None,
+        docstring: Optional[str] = None
+    ) -> None:
+        """lines start..end (1-based, inclusive, the whole file by default) in overlapping windows"""
+        size = len(lines) if end is None else min(end, len(lines))
+        start -= 1
         while start < size:
-            end = min(start + self.chunk_size, size)
-            chunk_lines = lines[start:end]
-            content = ''.join(chunk_lines)
+            stop = min(start + self.chunk_size, size)
+            content = ''.join(lines[start:stop])
 
             if content.strip():
-                chunks.append(Chunk(
-                    content = content,
-                    path = str(path),
-                    language = language,
-                    start_line = start + 1,
-                    end_line = end,
-                    chunk_type = 'block',
-                    ast_metadata = None
-                ))
+                chunks.append(content, path, language, start + 1, stop, chunk_type, symbol_name, docstring)
             # move by overlap
-            start = end - self.overlap if end < size else end
-        return chunks
+            start = stop - self.overlap if stop < size else stop
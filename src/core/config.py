@@ -1,3 +1,4 @@
+import os
 from typing import Optional
 
 class settings:
@@ -7,19 +8,89 @@ class settings:
     LLM_API_KEY: Optional[str] = None
     LLM_MODEL: str = "claude-3-5-sonnet-20240620"
     LLM_MAX_TOKENS: int = 4096
+    LLM_TIMEOUT_S: float = 30 # per call, including the wait for a concurrency slot
+    LLM_MAX_CONCURRENCY: int = 8 # requests in flight across the whole process
+    LLM_MAX_RETRIES: int = 2
+    RESPONSE_CONTEXT_TOKENS: int = 6000 # budget for the code snippets in an answer prompt
+    RESPONSE_DUPLICATE_THRESHOLD: float = 0.9 # line overlap at which two snippets count as the same code
+    QUERY_REWRITE_TIMEOUT_S: float = 5 # the search goes ahead with the original query after this
+    QUERY_MAX_EXPANSIONS: int = 4 # rewritten variants searched alongside the original query
+    QUERY_CACHE_ENABLED: bool = True # rewrites, query embeddings, search results and responses
+    QUERY_CACHE_TTL_S: int = 600
+    QUERY_CACHE_MAX_ENTRIES: int = 1024 # per cache layer
 
     # Chunker
     CHUNK_SIZE: int = 50
     CHUNK_OVERLAP: int = 20
 
     # Embeddings
-    EMBEDDING_PROVIDER: str = "sentence-transformers"
+    EMBEDDING_PROVIDER: str = "sentence-transformers" # sentence-transformers, onnx, openai or mock
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
     EMBEDDING_DIMENSION: int = 384
+    EMBEDDING_NORMALIZE: bool = False # scale vectors to unit length before storing them
+    EMBEDDING_BATCH_TOKENS: int = 16384 # padded tokens per encoder batch (texts * longest text)
+    EMBEDDING_ONNX_DIR: str = "./data/onnx" # exported and quantized models for the onnx provider
+    EMBEDDING_ONNX_QUANTIZE: bool = True # int8 dynamic quantization, cosine >= 0.98 to the torch vectors
+    EMBEDDING_ONNX_THREADS: int = 0 # onnx runtime intra-op threads, 0 uses every core
+    EMBEDDING_WORKERS: int = 0 # encoder processes shared by the whole process, 0 encodes in process
     OPENAI_API_KEY: Optional[str] = None
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "./data/embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_MB: int = 2048
 
     # Indexing
-    BATCH_SIZE = 20
+    BATCH_SIZE = 128 # max texts per encoder batch, EMBEDDING_BATCH_TOKENS usually binds first
+    INDEX_QUEUE_SIZE: int = 64 # files buffered between pipeline stages
+    INDEX_EMBED_BATCH_SIZE: int = 256 # chunks per embed/upsert batch
+    INDEX_MANIFEST_DIR = "./data/manifests"
+    LEXICAL_INDEX_ENABLED: bool = True # bm25 index backing the "ast" search branch
+    LEXICAL_INDEX_DIR = "./data/lexical"
+    LEXICAL_SYMBOL_BOOST: int = 3 # extra term frequency for a chunk's own symbol name
+    SYMBOL_INDEX_DIR = "./data/symbols"
+    PARSE_WORKERS: int = 0 # parse/chunk workers, 0 parses on the event loop thread
+    PARSE_POOL_MODE: str = "process" # process or thread
+    PARSE_BATCH_SIZE: int = 32 # files per worker task
+    AST_CACHE_ENABLED: bool = True # parsed symbols and imports keyed by git blob sha
+    AST_CACHE_PATH: str = "./data/ast_cache.sqlite3"
+    AST_CACHE_MAX_MB: int = 512
+    # files indexed: what git lists (or a walk outside git) with an extension in
+    # GIT_CHECKOUT_EXTENSIONS, minus INDEX_EXCLUDE. binary and minified files are skipped on read
+    INDEX_EXCLUDE = (
+        # directories (trailing /) match at any depth, the rest match file names
+        'node_modules/', 'vendor/', 'third_party/', 'bower_components/', 'dist/', 'build/',
+        '.venv/', 'venv/', '__pycache__/', '.tox/', 'site-packages/',
+        '*.min.js', '*.min.css', '*.bundle.js', '*.map', '*.lock', '*-lock.json', '*-lock.yaml', 'go.sum',
+        '*_pb2.py', '*.pb.go', '*.generated.*',
+    )
+    INDEX_MAX_FILE_KB: int = 1024 # larger source files are almost always generated
+    INDEX_MMAP_MIN_KB: int = 256 # files at least this large are memory mapped instead of read
+
+    # Qdrant. QDRANT_HOST connects to a server, otherwise QDRANT_PATH opens a
+    # local on-disk store, otherwise everything lives in memory
+    QDRANT_HOST: Optional[str] = os.getenv("QDRANT_HOST")
+    QDRANT_PORT: int = int(os.getenv("QDRANT_PORT", "6333"))
+    QDRANT_GRPC_PORT: int = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+    QDRANT_PREFER_GRPC: bool = os.getenv("QDRANT_PREFER_GRPC", "true").lower() == "true"
+    QDRANT_API_KEY: Optional[str] = os.getenv("QDRANT_API_KEY")
+    QDRANT_PATH: Optional[str] = os.getenv("QDRANT_PATH")
+    QDRANT_TIMEOUT: int = 30
+    QDRANT_POOL_SIZE: int = 16 # http/grpc connections shared by every QdrantClient
+    QDRANT_COLLECTION: str = "codebase_vectors"
+    QDRANT_HNSW_M: int = 16
+    QDRANT_HNSW_EF_CONSTRUCT: int = 100
+    QDRANT_ON_DISK: bool = False # keep vectors and the hnsw graph on disk (mmap)
+    QDRANT_QUANTIZATION: Optional[str] = None # "int8" keeps scalar quantized vectors in ram
+    QDRANT_UPSERT_BATCH_SIZE: int = 256 # points per upsert request
+    QDRANT_MAX_IN_FLIGHT: int = 4 # concurrent upsert requests
+    QDRANT_UPSERT_RETRIES: int = 3
+
+    # Daemon. `cbrt daemon` keeps a warm CodebaseRAG behind this unix socket and
+    # other cbrt invocations send their commands to it when it is running
+    DAEMON_SOCKET: str = os.getenv("CBRT_DAEMON_SOCKET", "./data/cbrt.sock")
+
+    # Metrics. per-stage latency histograms and counters, see src/core/metrics.py
+    METRICS_ENABLED: bool = os.getenv("CBRT_METRICS", "true").lower() == "true"
+    METRICS_PORT: Optional[int] = int(os.getenv("CBRT_METRICS_PORT", "0")) or None # prometheus endpoint of the daemon
 
     # Discord bot
     DISCORD_TOKEN: str = ""
@@ -30,4 +101,9 @@ class settings:
     GIT_CACHE_DIR = "./data/repos"
 
     # Git
-    MAX_REPO_SIZE_MB = 500
+    MAX_REPO_SIZE_MB = 500 # packed objects, enforced while a clone or fetch is running
+    # files checked out of a clone (sparse checkout) and indexed, an empty tuple takes everything
+    GIT_CHECKOUT_EXTENSIONS = (
+        '.py', '.js', '.ts', '.tsx', '.jsx', '.java', '.cpp', '.cc', '.c', '.h', '.hpp', '.go', '.rs',
+        '.md', '.rst', '.txt',
+    )
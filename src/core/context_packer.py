@@ -0,0 +1,120 @@
+from dataclasses import replace
+from typing import Dict, FrozenSet, List, Optional
+
+from src.core.config import settings
+from src.core.hybrid_search import SearchResult
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for code, close enough for budgeting without a tokenizer
+    return len(text) // 4 + 1
+
+def merge_ranges(results: List[SearchResult]) -> List[SearchResult]:
+    """
+    merge overlapping or adjacent snippets from the same file into one, so
+    lines repeated by the chunk overlap are only sent once. the merged
+    snippet keeps the best score
+    """
+    by_file: Dict[str, List[SearchResult]] = {}
+    for result in results:
+        by_file.setdefault(result.file_path, []).append(result)
+
+    merged: List[SearchResult] = []
+    for snippets in by_file.values():
+        snippets.sort(key=lambda r: (r.start_line, r.end_line))
+        current = snippets[0]
+        for snippet in snippets[1:]:
+            if snippet.start_line <= current.end_line + 1 and _lines_match(current) and _lines_match(snippet):
+                current = _merge(current, snippet)
+            else:
+                merged.append(current)
+                current = snippet
+        merged.append(current)
+    return merged
+
+def _lines_match(result: SearchResult) -> bool:
+    # only snippets whose text covers exactly their line range can be spliced by line number
+    return len(result.content.splitlines()) == result.end_line - result.start_line + 1
+
+def _merge(first: SearchResult, second: SearchResult) -> SearchResult:
+    if second.end_line <= first.end_line:
+        content = first.content
+    else:
+        # chunks keep their trailing newline, join on whole lines either way
+        tail = second.content.splitlines(keepends=True)[first.end_line - second.start_line + 1:]
+        head = first.content if first.content.endswith("\n") else first.content + "\n"
+        content = head + "".join(tail)
+    return replace(
+        first,
+        content=content,
+        end_line=max(first.end_line, second.end_line),
+        score=max(first.score, second.score),
+        chunk_type=first.chunk_type if first.chunk_type == second.chunk_type else "block",
+        symbol_name=first.symbol_name if first.symbol_name == second.symbol_name else None
+    )
+
+def _shingles(content: str) -> FrozenSet[str]:
+    # whitespace-insensitive lines, so reindented or reformatted copies still match
+    return frozenset(" ".join(line.split()) for line in content.splitlines() if line.strip())
+
+def drop_near_duplicates(results: List[SearchResult], threshold: float) -> List[SearchResult]:
+    """
+    drop snippets when at least threshold of their lines are already in a
+    better scored one, e.g. vendored copies, the same code in two forks or
+    a chunk contained in a larger one
+    """
+    kept: List[SearchResult] = []
+    kept_shingles: List[FrozenSet[str]] = []
+    for result in sorted(results, key=lambda r: r.score, reverse=True):
+        shingles = _shingles(result.content)
+        if any(
+            shingles == other or (shingles and len(shingles & other) / len(shingles) >= threshold)
+            for other in kept_shingles
+        ):
+            continue
+        kept.append(result)
+        kept_shingles.append(shingles)
+    return kept
+
+def _truncate(result: SearchResult, token_budget: int) -> SearchResult:
+    kept, used = [], 0
+    for line in result.content.splitlines(keepends=True):
+        used += estimate_tokens(line)
+        if used > token_budget and kept:
+            break
+        kept.append(line)
+    return replace(result, content="".join(kept), end_line=result.start_line + len(kept) - 1)
+
+def pack_context(
+    results: List[SearchResult],
+    token_budget: Optional[int] = None,
+    duplicate_threshold: Optional[float] = None
+) -> List[SearchResult]:
+    """
+    the snippets to put in a prompt: overlapping ranges merged, near
+    duplicates dropped, then chosen by score per token until the budget is
+    spent. returned best score first. the best snippet is always included,
+    cut down to the budget if it is too large on its own
+    """
+    token_budget = settings.RESPONSE_CONTEXT_TOKENS if token_budget is None else token_budget
+    threshold = settings.RESPONSE_DUPLICATE_THRESHOLD if duplicate_threshold is None else duplicate_threshold
+    if not results:
+        return []
+
+    candidates = drop_near_duplicates(merge_ranges(results), threshold)
+    costs = {id(r): estimate_tokens(r.content) for r in candidates}
+    best = candidates[0]
+
+    chosen: List[SearchResult] = []
+    remaining = token_budget
+    if costs[id(best)] > remaining:
+        best = _truncate(best, remaining)
+        costs[id(best)] = remaining
+    chosen.append(best)
+    remaining -= costs[id(best)]
+
+    for result in sorted(candidates[1:], key=lambda r: r.score / costs[id(r)], reverse=True):
+        if costs[id(result)] <= remaining:
+            chosen.append(result)
+            remaining -= costs[id(result)]
+    chosen.sort(key=lambda r: r.score, reverse=True)
+    return chosen
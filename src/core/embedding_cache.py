@@ -0,0 +1,74 @@
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from src.core.config import settings
+from src.core.sqlite_cache import SqliteLRUCache
+
+class EmbeddingCache(SqliteLRUCache):
+    """
+    persistent content-addressed cache of embeddings, keyed on
+    (model, dimension, sha256 of the text). vectors are stored as float32 blobs
+    and the least recently used rows are evicted once the cache grows past max_bytes.
+    """
+
+    _TABLE = 'embeddings'
+    _KEY = ('model', 'dim', 'text_hash')
+    _VALUE = 'vector'
+    _COLUMNS = "model TEXT NOT NULL, dim INTEGER NOT NULL, text_hash BLOB NOT NULL, vector BLOB NOT NULL"
+
+    def __init__(
+        self,
+        model_name: str,
+        dimension: int,
+        path: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        self.model_name = model_name
+        self.dimension = dimension
+        super().__init__(
+            Path(path or settings.EMBEDDING_CACHE_PATH),
+            max_bytes if max_bytes is not None else settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+        )
+
+    @staticmethod
+    def _hash(text: str) -> bytes:
+        return hashlib.sha256(text.encode('utf-8', errors='surrogatepass')).digest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """cached float32 vector for each text, or None for a miss"""
+        hashes = [self._hash(text) for text in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            # stay well below sqlite's host parameter limit
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT text_hash, vector FROM embeddings WHERE model = ? AND dim = ? "
+                    f"AND text_hash IN ({','.join('?' * len(part))})",
+                    [self.model_name, self.dimension, *part]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+
+            self._touch([(self.model_name, self.dimension, h) for h in found])
+
+            results = [found.get(h) for h in hashes]
+            hit_count = sum(1 for vector in results if vector is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, texts: Sequence[str], embeddings: Union[np.ndarray, Sequence[Sequence[float]]]) -> None:
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        rows = []
+        for text, vector in zip(texts, vectors):
+            rows.append((self.model_name, self.dimension, self._hash(text), vector.tobytes()))
+        if not rows:
+            return
+
+        with self._lock:
+            self._insert(rows)
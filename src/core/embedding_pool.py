@@ -0,0 +1,123 @@
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from src.core.config import settings
+
+# settings a worker needs to load the same model the parent was configured with
+_FORWARDED_SETTINGS = (
+    'EMBEDDING_PROVIDER', 'EMBEDDING_MODEL', 'EMBEDDING_DIMENSION', 'BATCH_SIZE', 'EMBEDDING_BATCH_TOKENS',
+    'EMBEDDING_ONNX_DIR', 'EMBEDDING_ONNX_QUANTIZE', 'EMBEDDING_ONNX_THREADS',
+)
+
+# the model owned by this worker process, loaded once by _init_worker
+_worker_generator: Optional[Any] = None
+
+def _init_worker(overrides: Dict[str, Any], threads: int) -> None:
+    global _worker_generator
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    # workers encode, they never cache or spawn pools of their own
+    settings.EMBEDDING_WORKERS = 0
+    settings.EMBEDDING_CACHE_ENABLED = False
+    # split the cores between workers instead of every worker using all of them
+    if not settings.EMBEDDING_ONNX_THREADS:
+        settings.EMBEDDING_ONNX_THREADS = threads
+    if settings.EMBEDDING_PROVIDER == 'sentence-transformers':
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+    from src.core.embeddings import EmbeddingGenerator
+    _worker_generator = EmbeddingGenerator()
+
+def _encode_into(name: str, shape: Tuple[int, int], rows: np.ndarray, texts: List[str]) -> int:
+    """encode texts in this worker and write them to rows of the parent's shared block"""
+    generator = _worker_generator
+    if generator.provider != settings.EMBEDDING_PROVIDER:
+        # never hand back fallback mock vectors as if they came from the configured model
+        raise RuntimeError(f"embedding worker could not load {settings.EMBEDDING_PROVIDER} model")
+    vectors = generator.encode_blocking(texts)
+    # spawned workers share the parent's resource tracker, so attaching doesn't
+    # hand ownership over. the parent unlinks the block
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        out[rows] = vectors
+        del out
+    finally:
+        shm.close()
+    return len(texts)
+
+class EmbeddingPool:
+    """
+    encodes on a pool of worker processes that each load the model once.
+    work goes out over the executor's shared call queue as length-sorted
+    slices of the batch, and the vectors come back through a shared memory
+    block instead of being pickled
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        overrides = {name: getattr(settings, name) for name in _FORWARDED_SETTINGS}
+        self.executor = ProcessPoolExecutor(
+            max_workers = workers,
+            mp_context = multiprocessing.get_context('spawn'),
+            initializer = _init_worker,
+            initargs = (overrides, threads)
+        )
+        logger.info(f"started {workers} embedding workers")
+
+    async def encode(self, texts: Sequence[str], dimension: int) -> np.ndarray:
+        shape = (len(texts), dimension)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(texts) * dimension * 4))
+        try:
+            # similar lengths together, a couple of slices per worker so a slow one doesn't hold the rest
+            lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+            order = np.argsort(lengths, kind='stable')
+            parts = [part for part in np.array_split(order, min(len(texts), self.workers * 2)) if len(part)]
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(
+                loop.run_in_executor(self.executor, _encode_into, shm.name, shape, part, [texts[i] for i in part])
+                for part in parts
+            ))
+            out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            vectors = out.copy()
+            del out
+            return vectors
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait = False, cancel_futures = True)
+
+# one pool per model and size, shared by every EmbeddingGenerator in the process so
+# concurrent index jobs use the same warm workers
+_pools: Dict[Tuple[str, str, int], EmbeddingPool] = {}
+_pools_lock = threading.Lock()
+
+def get_embedding_pool(workers: Optional[int] = None) -> EmbeddingPool:
+    workers = workers or settings.EMBEDDING_WORKERS
+    key = (settings.EMBEDDING_PROVIDER, settings.EMBEDDING_MODEL, workers)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = EmbeddingPool(workers)
+        return pool
+
+@atexit.register
+def _close_pools() -> None:
+    for pool in _pools.values():
+        pool.close()
@@ -1,21 +1,42 @@
 import asyncio
-from typing import List, Optional
+import hashlib
+from typing import Optional, Sequence
+
+import numpy as np
 from loguru import logger
 
 from src.core.config import settings
+from src.core.embedding_cache import EmbeddingCache
+from src.core.embedding_pool import EmbeddingPool, get_embedding_pool
+from src.core.metrics import metrics
 
 class EmbeddingGenerator:
     def __init__(self) -> None:
         self.provider = settings.EMBEDDING_PROVIDER
         self.model_name = settings.EMBEDDING_MODEL
         self.batch_size = settings.BATCH_SIZE
+        self.batch_tokens = settings.EMBEDDING_BATCH_TOKENS
         self.model: Optional[object] = None
+        self.pool: Optional[EmbeddingPool] = None
 
-        if self.provider == 'sentence-transformers':
+        if settings.EMBEDDING_WORKERS > 0:
+            # the workers load the model, this process never does
+            self.pool = get_embedding_pool()
+        elif self.provider == 'sentence-transformers':
             self._init_sentence_transformers()
+        elif self.provider == 'onnx':
+            self._init_onnx()
         elif self.provider == 'mock':
             self._init_mock_embeddings()
 
+        self.cache: Optional[EmbeddingCache] = None
+        # mock vectors are free to compute and must never be mixed with real ones
+        if settings.EMBEDDING_CACHE_ENABLED and self.provider != 'mock':
+            try:
+                self.cache = EmbeddingCache(self._cache_key(), settings.EMBEDDING_DIMENSION)
+            except Exception as e:
+                logger.warning(f"embedding cache unavailable: {e}")
+
     def _init_sentence_transformers(self) -> None:
         try:
             # lazy import to avoid segfaults during testing
@@ -38,15 +59,72 @@ class EmbeddingGenerator:
             logger.info("falling back to mock embeddings")
             self._init_mock_embeddings()
 
+    def _init_onnx(self) -> None:
+        try:
+            from src.core.onnx_encoder import OnnxEncoder
+            self.model = OnnxEncoder(self.model_name)
+        except Exception as e:
+            logger.error(f"failed to load onnx embedding model: {e}")
+            logger.info("falling back to mock embeddings")
+            self._init_mock_embeddings()
+
+    def _cache_key(self) -> str:
+        # quantized vectors differ slightly from full precision ones, never serve one as the other
+        if self.provider == 'onnx' and settings.EMBEDDING_ONNX_QUANTIZE:
+            return f"onnx-int8:{self.model_name}"
+        return f"{self.provider}:{self.model_name}"
+
     def _init_mock_embeddings(self) -> None:
         logger.info("using mock embeddings for testing")
         self.provider = 'mock'
 
-    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    async def generate_embeddings(self, texts: Sequence[str]) -> np.ndarray:
+        """one contiguous float32 row per text, shape (len(texts), dimension)"""
         if not texts:
-            return []
-
-        if self.provider == 'sentence-transformers':
+            return np.empty((0, settings.EMBEDDING_DIMENSION), dtype=np.float32)
+        metrics.count('embedded_texts', len(texts))
+        with metrics.span('embed'):
+            if self.cache is None:
+                vectors = await self._encode_unique(texts)
+            else:
+                vectors = await self._encode_cached(texts)
+        if settings.EMBEDDING_NORMALIZE:
+            normalize_rows(vectors)
+        return vectors
+
+    async def _encode_unique(self, texts: Sequence[str]) -> np.ndarray:
+        # the same chunk vendored or copied across files is only encoded once per batch
+        unique = list(dict.fromkeys(texts))
+        if len(unique) == len(texts):
+            return await self._encode(texts)
+        computed = await self._encode(unique)
+        rows = {text: i for i, text in enumerate(unique)}
+        return computed[[rows[text] for text in texts]]
+
+    async def _encode_cached(self, texts: Sequence[str]) -> np.ndarray:
+        # sqlite lookups and writes block, the cache locks its connection so a worker thread is safe
+        cached = await asyncio.to_thread(self.cache.get_many, texts)
+        # identical texts within a batch are only encoded once
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        if len(missing) == len(texts):
+            computed = await self._encode(missing)
+            await asyncio.to_thread(self.cache.put_many, missing, computed)
+            return computed
+
+        vectors = np.empty((len(texts), self.cache.dimension), dtype=np.float32)
+        if missing:
+            computed = await self._encode(missing)
+            await asyncio.to_thread(self.cache.put_many, missing, computed)
+            rows = {text: i for i, text in enumerate(missing)}
+        for i, (text, vector) in enumerate(zip(texts, cached)):
+            vectors[i] = vector if vector is not None else computed[rows[text]]
+        return vectors
+
+    async def _encode(self, texts: Sequence[str]) -> np.ndarray:
+        if self.pool is not None:
+            return await self.pool.encode(texts, settings.EMBEDDING_DIMENSION)
+        if self.provider in ('sentence-transformers', 'onnx'):
+            # the onnx encoder mimics the SentenceTransformer interface
             return await self._generate_st_embeddings(texts)
         elif self.provider == 'mock':
             return await self._generate_mock_embeddings(texts)
@@ -55,42 +133,106 @@ class EmbeddingGenerator:
         else:
             raise ValueError(f"unknown embedding provider: {self.provider}")
 
-    async def _generate_st_embeddings(self, texts: List[str]) -> List[List[float]]:
+    async def _generate_st_embeddings(self, texts: Sequence[str]) -> np.ndarray:
         event_loop = asyncio.get_event_loop()
+        return await event_loop.run_in_executor(None, self._encode_by_length, texts)
+
+    def _encode_by_length(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        encode texts in batches of similar token length, each sized to the token
+        budget, so short chunks are not padded out to the longest one in a fixed
+        size batch. rows are written back in input order. a batch that runs out
+        of memory halves the budget and is retried in smaller pieces
+        """
+        lengths = self._token_lengths(texts)
+        order = np.argsort(lengths, kind='stable')
+        sorted_lengths = lengths[order]
+        out = np.empty((len(texts), self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        start = 0
+        while start < len(order):
+            end = batch_end(sorted_lengths, start, self.batch_tokens, self.batch_size)
+            indices = order[start:end]
+            try:
+                embeddings = self.model.encode(
+                    [texts[i] for i in indices],
+                    batch_size=len(indices),
+                    convert_to_numpy=True
+                )
+            except Exception as e:
+                if not _is_out_of_memory(e) or len(indices) == 1:
+                    raise
+                self.batch_tokens = max(1, self.batch_tokens // 2)
+                logger.warning(f"out of memory encoding {len(indices)} texts, token budget now {self.batch_tokens}")
+                self._release_memory()
+                continue
+            out[indices] = embeddings
+            start = end
+        return out
+
+    def _token_lengths(self, texts: Sequence[str]) -> np.ndarray:
+        max_length = getattr(self.model, 'max_seq_length', None) or 512
+        try:
+            ids = self.model.tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=max_length)
+            lengths = [len(input_ids) for input_ids in ids['input_ids']]
+        except Exception:
+            # ~4 characters per token for code, plus the special tokens
+            lengths = [min(len(text) // 4 + 2, max_length) for text in texts]
+        return np.asarray(lengths, dtype=np.int64)
+
+    def _release_memory(self) -> None:
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
 
-        def _encode() -> List[List[float]]:
-            embeddings = self.model.encode(
-                texts,
-                batch_size=self.batch_size,
-                convert_to_numpy=True
-            )
-            return embeddings.tolist()
-
-        return await event_loop.run_in_executor(None, _encode)
+    async def _generate_mock_embeddings(self, texts: Sequence[str]) -> np.ndarray:
+        return self._mock_embeddings(texts)
 
-    async def _generate_mock_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def _mock_embeddings(self, texts: Sequence[str]) -> np.ndarray:
         # return mock embeddings for testing
-        import hashlib
-        embeddings = []
-        for text in texts:
-            # create deterministic mock embedding based on text hash
-            hash_obj = hashlib.md5(text.encode())
-            hash_bytes = hash_obj.digest()
-            # convert to 384-dimensional float vector
-            embedding = []
-            for i in range(0, len(hash_bytes), 2):
-                if i + 1 < len(hash_bytes):
-                    val = (hash_bytes[i] + hash_bytes[i+1] * 256) / 65535.0
-                    embedding.append(val)
-            # pad to 384 dimensions
-            while len(embedding) < 384:
-                embedding.append(0.0)
-            embeddings.append(embedding[:384])
+        embeddings = np.zeros((len(texts), settings.EMBEDDING_DIMENSION), dtype=np.float32)
+        for i, text in enumerate(texts):
+            # deterministic mock embedding based on text hash: the md5 digest read
+            # as little endian 16 bit ints scaled to [0, 1], padded with zeros
+            digest = hashlib.md5(text.encode()).digest()
+            embeddings[i, :8] = np.frombuffer(digest, dtype='<u2') / 65535.0
         return embeddings
 
-    async def _generate_openai_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def encode_blocking(self, texts: Sequence[str]) -> np.ndarray:
+        """encode on the calling thread, without the cache. used by embedding pool workers"""
+        if self.provider in ('sentence-transformers', 'onnx'):
+            return self._encode_by_length(texts)
+        elif self.provider == 'mock':
+            return self._mock_embeddings(texts)
+        raise ValueError(f"provider {self.provider} cannot encode in a worker")
+
+    async def _generate_openai_embeddings(self, texts: Sequence[str]) -> np.ndarray:
         raise NotImplementedError("openai embeddings not yet implemented")
 
-    async def generate_single_embedding(self, text: str) -> List[float]:
+    async def generate_single_embedding(self, text: str) -> np.ndarray:
         embeddings = await self.generate_embeddings([text])
-        return embeddings[0] if embeddings else []
+        return embeddings[0]
+
+def batch_end(sorted_lengths: np.ndarray, start: int, token_budget: int, max_size: int) -> int:
+    """
+    end of the batch starting at start, over lengths sorted ascending: the
+    most texts whose padded cost (count * longest length) fits the budget,
+    always at least one
+    """
+    lengths = sorted_lengths[start:start + max_size]
+    # lengths are sorted, so the padded cost only grows with the batch size
+    costs = np.arange(1, len(lengths) + 1) * lengths
+    return start + max(1, int(np.searchsorted(costs, token_budget, side='right')))
+
+def _is_out_of_memory(error: Exception) -> bool:
+    return isinstance(error, MemoryError) or 'out of memory' in str(error).lower()
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """scale each row to unit length, in place"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    vectors /= norms
+    return vectors
@@ -0,0 +1,106 @@
+import hashlib
+import mmap
+import os
+import stat
+import subprocess
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from src.core.config import settings
+
+# git's own heuristic: a NUL byte in the first 8000 bytes makes a file binary
+_SNIFF_BYTES = 8000
+# average line length in the first block above which a file is taken to be minified or generated
+_MINIFIED_LINE = 1000
+
+def scan_files(repo_path: Path) -> Iterator[Path]:
+    """
+    files under repo_path that pass the index policy. in a git repo these come
+    from the git index, the tracked files plus untracked ones .gitignore does
+    not exclude, skipping paths outside the sparse checkout. anything else is
+    walked, pruning excluded directories
+    """
+    listed = _git_ls_files(repo_path)
+    for rel_path in listed if listed is not None else _walk(repo_path):
+        path = repo_path / rel_path
+        if should_index(rel_path, path):
+            yield path
+
+def should_index(rel_path: str, path: Path) -> bool:
+    """the include/exclude policy and size cap for one file, rel_path using / separators"""
+    extensions = settings.GIT_CHECKOUT_EXTENSIONS
+    if extensions and os.path.splitext(rel_path)[1].lower() not in extensions:
+        return False
+    if is_excluded(rel_path):
+        return False
+    try:
+        info = path.lstat()
+    except OSError:
+        return False
+    # symlinks are skipped, they may point outside the repo
+    return stat.S_ISREG(info.st_mode) and info.st_size <= settings.INDEX_MAX_FILE_KB * 1024
+
+def is_excluded(rel_path: str) -> bool:
+    parts = rel_path.split('/')
+    for pattern in settings.INDEX_EXCLUDE:
+        if pattern.endswith('/'):
+            if any(fnmatchcase(part, pattern[:-1]) for part in parts[:-1]):
+                return True
+        elif fnmatchcase(parts[-1], pattern):
+            return True
+    return False
+
+def read_source(path: Path) -> Tuple[str, Optional[bytes]]:
+    """
+    (sha256, contents) of a file. contents are None for binary or minified
+    files, which are hashed but not worth chunking. large files are mapped
+    rather than read, so a binary one is rejected on its first block
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        # empty files cannot be mapped
+        if size and size >= settings.INDEX_MMAP_MIN_KB * 1024:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if not looks_like_text(mapped[:_SNIFF_BYTES]):
+                    return hashlib.sha256(mapped).hexdigest(), None
+                data = mapped[:]
+        else:
+            head = f.read(_SNIFF_BYTES)
+            data = head + f.read()
+            if not looks_like_text(head):
+                return hashlib.sha256(data).hexdigest(), None
+    return hashlib.sha256(data).hexdigest(), data
+
+def looks_like_text(head: bytes) -> bool:
+    if b'\0' in head:
+        return False
+    # a full block with hardly any newlines is a minified bundle or generated blob
+    return len(head) < _SNIFF_BYTES or head.count(b'\n') >= len(head) // _MINIFIED_LINE
+
+def _git_ls_files(repo_path: Path) -> Optional[List[str]]:
+    if not (repo_path / '.git').exists():
+        return None
+    try:
+        # an explicit git dir, so a broken repo never falls through to a parent one
+        output = subprocess.run(
+            ['git', f'--git-dir={repo_path / ".git"}', f'--work-tree={repo_path}',
+             'ls-files', '-z', '-t', '--cached', '--others', '--exclude-standard'],
+            cwd = repo_path, capture_output = True, check = True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.debug(f"git ls-files failed in {repo_path}, walking it instead: {e}")
+        return None
+    # entries are "<tag> <path>", S marks a path outside the sparse checkout
+    entries = output.decode('utf-8', errors='surrogateescape').split('\0')
+    return list(dict.fromkeys(entry[2:] for entry in entries if entry and entry[0] != 'S'))
+
+def _walk(repo_path: Path) -> Iterator[str]:
+    for root, dirs, files in os.walk(repo_path):
+        rel_root = os.path.relpath(root, repo_path).replace(os.sep, '/')
+        prefix = '' if rel_root == '.' else rel_root + '/'
+        dirs[:] = [d for d in dirs if d != '.git' and not is_excluded(f"{prefix}{d}/_")]
+        for name in files:
+            yield prefix + name
@@ -1,16 +1,30 @@
 import git # hilarious
 
+import asyncio
 import os
+import subprocess
 import sys
+import time
+import weakref
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 import shutil
 
 from loguru import logger
 
 from src.core.config import settings
+from src.core.file_scanner import scan_files
 from src.utils.helpers import generate_repo_id, parse_github_url
 
+# one lock per repo and event loop, so concurrent requests for the same url share a
+# clone or fetch (the cli runs a new loop per command), and when each repo last
+# finished syncing
+_repo_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Lock]]" = weakref.WeakKeyDictionary()
+_synced_at: Dict[str, float] = {}
+
+# how often a running clone or fetch is checked against MAX_REPO_SIZE_MB
+_SIZE_POLL_S = 0.25
+
 class GitHandler:
     def __init__(self) -> None:
         self.cache_dir = Path(settings.GIT_CACHE_DIR)
@@ -19,37 +33,142 @@ class GitHandler:
     async def clone_repo(
         self,
         github_url,
+        update: bool = False,
     ) -> tuple[str, Path]:
+        """
+        clone github_url into the cache, or with update fetch the latest commit
+        of an already cached clone. git runs off the event loop, and requests
+        that arrive while the same repo is being synced wait for that sync
+        instead of starting their own
+        """
         repo_id = generate_repo_id(github_url)
         repo_path = self.cache_dir / repo_id
+        requested = time.monotonic()
+
+        locks = _repo_locks.setdefault(asyncio.get_running_loop(), {})
+        async with locks.setdefault(repo_id, asyncio.Lock()):
+            if _synced_at.get(repo_id, float('-inf')) >= requested and repo_path.exists():
+                logger.info(f"Repo {repo_id} was synced while this request waited")
+                return repo_id, repo_path
+
+            if (repo_path / '.git').exists():
+                logger.info(f"Repo {repo_id} already cloned at {repo_path}")
+                if not update:
+                    return repo_id, repo_path
+                await self.update_repo(repo_path)
+            else:
+                if not parse_github_url(github_url):
+                    raise ValueError(f"Invalid github URL: {github_url}")
+                logger.info(f"Cloning repository {github_url} to {repo_path}")
+                try:
+                    await asyncio.to_thread(self._clone, github_url, repo_path)
+                except Exception as e:
+                    logger.error(f"Encountered error: {e}")
+                    raise
+                logger.info(f"Successfully cloned repo {repo_id} at {repo_path}")
+            _synced_at[repo_id] = time.monotonic()
+        return repo_id, repo_path
 
-        if repo_path.exists():
-            logger.info(f"Repo {repo_id} already cloned at {repo_path}")
-            return repo_id, repo_path
-        parsed = parse_github_url(github_url)
-        if not parsed:
-            raise ValueError(f"Invalid github URL: {github_url}")
-        logger.info(f"Cloning repository {github_url} to {repo_path}")
+    async def update_repo(self, repo_path: Path) -> None:
+        """fetch the latest commit of the cloned branch and check it out"""
+        await asyncio.to_thread(self._update, repo_path)
+        logger.info(f"updated {repo_path} to {self.get_head_commit(repo_path)[:12]}")
 
+    def _clone(self, url: str, repo_path: Path) -> None:
+        """
+        a shallow blobless clone: only commits and trees are downloaded up
+        front, and the checkout fetches just the blobs of the files the sparse
+        patterns select. the clone is built next to repo_path and moved into
+        place when complete, so a failed one never looks cached
+        """
+        partial = repo_path.with_name(repo_path.name + '.partial')
+        shutil.rmtree(partial, ignore_errors = True)
         try:
-            git.Repo.clone(
-                github_url,
-                depth = 1,
-                single_branch = True
+            self._git(
+                ['clone', '--filter=blob:none', '--no-checkout', '--depth', '1', '--single-branch', url, str(partial)],
+                watch = partial
             )
-            repo_size_mb = self._get_directory_size(repo_path) / 1024 * 1024
-            if repo_size_mb > settings.MAX_REPO_SIZE_MB:
-                shutil.rmtree(repo_path)
-                raise ValueError(
-                    f"github repo too large: {repo_size_mb:.1f}MB > "
-                    f"{settings.MAX_REPO_SIZE_MB}MB limit"
-                )
-            logger.info(f"Successfully cloned repo {repo_id} at {repo_path}")
-            return repo_id, repo_path
-        except Exception as e:
-            logger.error(f"Encountered error: {e}")
+            self._checkout(partial, 'HEAD')
+            shutil.rmtree(repo_path, ignore_errors = True)
+            os.replace(partial, repo_path)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors = True)
             raise
 
+    def _update(self, repo_path: Path) -> None:
+        # the clone's filter and single branch refspec are remembered in its
+        # config, so this only downloads the new commit's trees and changed blobs
+        self._git(['fetch', '--depth', '1', 'origin'], cwd = repo_path, watch = repo_path)
+        self._checkout(repo_path, 'FETCH_HEAD')
+
+    def _checkout(self, repo_path: Path, ref: str) -> None:
+        patterns = sparse_patterns()
+        if patterns:
+            self._git(['sparse-checkout', 'set', '--no-cone', *patterns], cwd = repo_path, watch = repo_path)
+        else:
+            self._git(['sparse-checkout', 'disable'], cwd = repo_path, watch = repo_path)
+        self._git(['reset', '--hard', ref], cwd = repo_path, watch = repo_path)
+
+    def _git(self, args: List[str], cwd: Optional[Path] = None, watch: Optional[Path] = None) -> str:
+        """
+        run git, killing it once the packed objects under watch grow by more
+        than MAX_REPO_SIZE_MB instead of finding out after the whole download.
+        only the growth counts, so fetching into a large clone is not refused
+        """
+        limit = settings.MAX_REPO_SIZE_MB * 1024 * 1024
+        baseline = _pack_size(watch) if watch is not None else 0
+        env = {**os.environ, 'GIT_TERMINAL_PROMPT': '0'}
+        process = subprocess.Popen(
+            ['git', *args], cwd = cwd, env = env, text = True,
+            stdout = subprocess.PIPE, stderr = subprocess.PIPE
+        )
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout = _SIZE_POLL_S)
+            except subprocess.TimeoutExpired:
+                if watch is not None and _pack_size(watch) - baseline > limit:
+                    process.kill()
+                    process.communicate()
+                    raise ValueError(f"github repo too large: over the {settings.MAX_REPO_SIZE_MB}MB limit")
+                continue
+            # downloads that finish between two polls are caught here
+            if watch is not None and _pack_size(watch) - baseline > limit:
+                raise ValueError(f"github repo too large: over the {settings.MAX_REPO_SIZE_MB}MB limit")
+            break
+        if process.returncode != 0:
+            raise git.GitCommandError(['git', *args], process.returncode, stderr)
+        return stdout
+
+    def get_head_commit(self, repo_path: Path) -> Optional[str]:
+        try:
+            return git.Repo(repo_path).head.commit.hexsha
+        except (git.InvalidGitRepositoryError, git.NoSuchPathError, ValueError):
+            return None
+
+    def diff_files(self, repo_path: Path, since_commit: str) -> Optional[Tuple[Set[str], Set[str]]]:
+        """
+        (changed, deleted) paths between since_commit and HEAD, or None when
+        since_commit is not available locally (e.g. pruned from a shallow clone)
+        """
+        try:
+            repo = git.Repo(repo_path)
+            diffs = repo.commit(since_commit).diff(repo.head.commit)
+        except (git.BadName, git.BadObject, git.GitCommandError, git.InvalidGitRepositoryError, ValueError) as e:
+            logger.debug(f"cannot diff {repo_path} against {since_commit}: {e}")
+            return None
+
+        changed: Set[str] = set()
+        deleted: Set[str] = set()
+        for diff in diffs:
+            if diff.deleted_file:
+                deleted.add(diff.a_path)
+            elif diff.renamed_file:
+                deleted.add(diff.a_path)
+                changed.add(diff.b_path)
+            else:
+                changed.add(diff.b_path)
+        return changed, deleted
+
     def delete_repo(self, repo_id: str) -> bool:
         repo_path = self.cache_dir / repo_id
         if not repo_path.exists():
@@ -59,15 +178,31 @@ class GitHandler:
         logger.info(f"deleted repo {repo_id}")
         return True
 
+    def list_files(self, repo_path: Path) -> Iterator[Path]:
+        """lazily list the files to index, see file_scanner.scan_files"""
+        return scan_files(repo_path)
+
     def get_repo_path(self, repo_id: str) -> Optional[Path]:
         repo_path = self.cache_dir / repo_id
         return repo_path if repo_path.exists() else None
 
-    def _get_directory_size(self, path: Path) -> int:
-        total = 0
-        for entry in os.scandir(path):
-            if entry.is_file():
-                total += entry.stat().st_size
-            elif entry.is_dir():
-                total += GitHandler._get_directory_size(Path(entry.path))
-        return total
+def sparse_patterns() -> List[str]:
+    """checkout patterns for GIT_CHECKOUT_EXTENSIONS, empty when everything is checked out"""
+    if not settings.GIT_CHECKOUT_EXTENSIONS:
+        return []
+    return [f"*{extension}" for extension in settings.GIT_CHECKOUT_EXTENSIONS]
+
+def _pack_size(repo_path: Path) -> int:
+    # a clone or fetch streams into objects/pack, including its temporary packs
+    total = 0
+    try:
+        with os.scandir(repo_path / '.git' / 'objects' / 'pack') as entries:
+            for entry in entries:
+                try:
+                    total += entry.stat().st_size
+                except FileNotFoundError:
+                    # temporary packs are renamed as they complete
+                    pass
+    except FileNotFoundError:
+        pass
+    return total
@@ -1,13 +1,22 @@
-from typing import Optional, List, Literal, Dict, Any
-from dataclasses import dataclass
-from loguru import logger
+import re
+from typing import TYPE_CHECKING, Optional, List, Literal, Dict, Any, Tuple
+from dataclasses import dataclass, replace
+from pathlib import Path
 
-from src.core.ast_parser import ASTMetadata
+import numpy as np
+from loguru import logger
 
+from src.core.ast_parser import detect_language
+from src.core.lexical_index import LexicalIndex
+from src.core.metrics import metrics
 from src.core.query_rewriter import RewrittenQuery
-from src.qdrant.qdrant_client import QdrantClient
+from src.core.symbol_index import SymbolEntry, SymbolIndex
 from src.qdrant.schemas import SearchFilter
 
+if TYPE_CHECKING:
+    from src.qdrant.qdrant_client import QdrantClient
+
+@dataclass(slots=True)
 class SearchResult:
     file_path: str
     content: str
@@ -20,45 +29,79 @@ class SearchResult:
     source: Literal['ast', 'semantic', 'hybrid']
     ast_metadata: Optional[Dict[str, Any]] = None
 
+_IDENTIFIER = r"[A-Za-z_~][\w]*(?:(?:\.|::)[A-Za-z_~][\w]*)*"
+# a bare identifier (Foo.bar, ns::Foo, get_user, getUser, `Foo`, login()). a plain
+# word like "authentication" is more likely a topic than a name, it is searched normally
+_BARE_SYMBOL = re.compile(rf"^(`)?({_IDENTIFIER})`?(\(\))?$")
+_IDENTIFIER_SHAPED = re.compile(r"[_.]|::|[a-z0-9][A-Z]")
+# the usual "where is X defined" phrasings
+_SYMBOL_QUERIES = [
+    re.compile(rf"^(?:where\s+is|where's)\s+`?({_IDENTIFIER})`?(?:\(\))?\s+(?:defined|declared|implemented)\??$", re.I),
+    re.compile(rf"^(?:(?:show|find|go\s+to)\s+)?(?:the\s+)?(?:definition|declaration)\s+of\s+`?({_IDENTIFIER})`?(?:\(\))?\??$", re.I),
+]
+
+def symbol_query(query: str) -> Optional[str]:
+    """the identifier a query asks for, if it is a plain symbol lookup"""
+    query = query.strip()
+    match = _BARE_SYMBOL.match(query)
+    if match:
+        quoted, name, call = match.groups()
+        return name if quoted or call or _IDENTIFIER_SHAPED.search(name) else None
+    for pattern in _SYMBOL_QUERIES:
+        match = pattern.match(query)
+        if match:
+            return match.group(1)
+    return None
+
 class HybridSearch:
-    def __init__(self, qdrant_client: QdrantClient) -> None:
+    def __init__(self, qdrant_client: "QdrantClient") -> None:
         self.qdrant = qdrant_client
+        # repo_id -> loaded lexical index, swapped out when a re-index publishes a new one
+        self._lexical: Dict[str, LexicalIndex] = {}
+        # repo_id -> (file mtime, loaded symbol index)
+        self._symbols: Dict[str, Tuple[float, SymbolIndex]] = {}
+
     async def search(
         self,
         repo_id: str,
-        query_vector: List[float],
-        rewritten_query: str,
+        query_vectors: np.ndarray,
+        rewritten_query: RewrittenQuery,
         top_k: int = 5
-    ) -> None:
+    ) -> List[SearchResult]:
+        """
+        query_vectors holds one embedding row per query variant (the original query
+        followed by its rewritten expansions). all of them are searched in one batch
+        """
 
         semantic_results: List[SearchResult] = []
-        ast_results: List[ASTMetadata] = []
+        ast_results: List[SearchResult] = []
         filters = self._build_filters(rewritten_query)
 
         # semantic search
-        if rewritten_query.search_strategy in ['semantic', 'hybdrid']:
-            semantic_results = await self._semantic_search(
+        if rewritten_query.search_strategy in ['semantic', 'hybrid']:
+            semantic_results = await self.semantic_search(
                 repo_id,
-                query_vector,
+                query_vectors,
                 top_k * 2, # used for fusion
                 filters
             )
 
         # ast search
         if rewritten_query.search_strategy in ['ast', 'hybrid']:
-            ast_results = await self._ast_search(
-                repo_id,
-                query_vector,
-                top_k * 2,
-                filters
-            )
+            with metrics.span('lexical_search'):
+                ast_results = self.ast_search(
+                    repo_id,
+                    rewritten_query,
+                    top_k * 2,
+                    filters
+                )
 
         # fuse results
         if rewritten_query.search_strategy == 'hybrid' and semantic_results and ast_results:
             # oh man we can replace with zeroentropy here hehehehe
             # sooon.
-            fused = self.reciprocal_rank_fusion(
-    ast_results,
+            fused_results = self.reciprocal_rank_fusion(
+                ast_results,
                 semantic_results
             )
         elif semantic_results:
@@ -67,16 +110,96 @@ class HybridSearch:
             fused_results = ast_results
         else:
             fused_results = []
-        return fused[:top_k]
+        return fused_results[:top_k]
 
     def ast_search(
         self,
         repo_id: str,
-        rewritten_query: str,
+        rewritten_query: RewrittenQuery,
         limit: int,
         filters: SearchFilter
     ) -> List[SearchResult]:
-        raise NotImplementedError("AST Search not yet implemented")
+        """bm25 over the repo's local lexical index, using the query and its expansions"""
+        index = self._lexical_index(repo_id)
+        if index is None:
+            logger.debug(f"no lexical index for repo {repo_id}")
+            return []
+
+        query_text = " ".join(dict.fromkeys([rewritten_query.original_query, *rewritten_query.expanded_terms]))
+        results: List[SearchResult] = []
+        for doc_id, score in index.search(query_text, limit):
+            (path, start_line, end_line, chunk_type, symbol_name, language), content = index.doc(doc_id)
+            results.append(SearchResult(
+                file_path=path,
+                content=content,
+                language=language or '',
+                start_line=start_line,
+                end_line=end_line,
+                score=score,
+                chunk_type=chunk_type,
+                symbol_name=symbol_name,
+                source='ast'
+            ))
+        return results
+
+    def _lexical_index(self, repo_id: str) -> Optional[LexicalIndex]:
+        current = LexicalIndex.current_path(repo_id)
+        cached = self._lexical.get(repo_id)
+        if cached is not None and cached.path == current:
+            return cached
+        index = LexicalIndex.load(repo_id)
+        if index is None:
+            self._lexical.pop(repo_id, None)
+        else:
+            self._lexical[repo_id] = index
+        return index
+
+    def lookup_symbol(self, repo_id: str, query: str, limit: int = 5) -> List[SearchResult]:
+        """
+        exact definition lookup for identifier queries, answered from the
+        symbol index without embedding or searching anything
+        """
+        name = symbol_query(query)
+        if name is None:
+            return []
+        with metrics.span('symbol_lookup'):
+            index = self._symbol_index(repo_id)
+            if index is None:
+                return []
+            return [self._symbol_result(index, entry) for entry in index.lookup(name)[:limit]]
+
+    def _symbol_index(self, repo_id: str) -> Optional[SymbolIndex]:
+        mtime = SymbolIndex.mtime(repo_id)
+        if mtime is None:
+            self._symbols.pop(repo_id, None)
+            return None
+        cached = self._symbols.get(repo_id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        index = SymbolIndex.load(repo_id)
+        if index is not None:
+            self._symbols[repo_id] = (mtime, index)
+        return index
+
+    def _symbol_result(self, index: SymbolIndex, entry: SymbolEntry) -> SearchResult:
+        content = entry.signature or entry.name
+        if index.repo_path:
+            try:
+                lines = (Path(index.repo_path) / entry.path).read_text(errors='ignore').splitlines()
+                content = '\n'.join(lines[entry.start_line - 1:entry.end_line]) or content
+            except OSError:
+                pass
+        return SearchResult(
+            file_path=entry.path,
+            content=content,
+            language=detect_language(Path(entry.path)) or '',
+            start_line=entry.start_line,
+            end_line=entry.end_line,
+            score=1.0,
+            chunk_type=entry.kind,
+            symbol_name=entry.name,
+            source='ast'
+        )
 
     def hybrid_search(
         self,
@@ -87,24 +210,70 @@ class HybridSearch:
     ) -> List[SearchResult]:
         raise NotImplementedError("Hybrid Search not yet implemented")
 
-    def semantic_search(
+    async def semantic_search(
         self,
         repo_id: str,
-        rewritten_query: str,
+        query_vectors: np.ndarray,
         limit: int,
         filters: SearchFilter
     ) -> List[SearchResult]:
-        raise NotImplementedError("Semantic Search not yet implemented")
+        # one round trip for every expansion, then fuse the per-expansion rankings
+        batches = await self.qdrant.search_batch(query_vectors, limit, repo_filter=repo_id, filters=filters)
+        result_lists = [[self._to_search_result(hit, 'semantic') for hit in hits] for hits in batches]
+        result_lists = [results for results in result_lists if results]
+        if len(result_lists) <= 1:
+            return result_lists[0] if result_lists else []
+        return self.reciprocal_rank_fusion(*result_lists)[:limit]
 
-    async def reciprocal_rank_fusion(
+    def reciprocal_rank_fusion(
         self,
-        ast_results: List[SearchResult],
-        semantic_results: List[SearchResult],
+        *result_lists: List[SearchResult],
         k: int = 60
     ) -> List[SearchResult]:
-        raise NotImplementedError("RRF not yet implemented")
+        """fuse rankings by summing 1 / (k + rank) for every list a chunk appears in"""
+        slots: Dict[Tuple[str, int, int], int] = {}
+        unique: List[SearchResult] = []
+        positions: List[np.ndarray] = []
+        contributions: List[np.ndarray] = []
+        for results in result_lists:
+            if not results:
+                continue
+            index = np.empty(len(results), dtype=np.intp)
+            for rank, result in enumerate(results):
+                key = (result.file_path, result.start_line, result.end_line)
+                slot = slots.get(key)
+                if slot is None:
+                    slot = slots[key] = len(unique)
+                    unique.append(result)
+                elif unique[slot].source != result.source:
+                    unique[slot] = replace(unique[slot], source='hybrid')
+                index[rank] = slot
+            positions.append(index)
+            contributions.append(1.0 / (k + np.arange(1, len(results) + 1, dtype=np.float64)))
+        if not unique:
+            return []
+
+        scores = np.zeros(len(unique), dtype=np.float64)
+        # a chunk can repeat within one list, so accumulate unbuffered
+        np.add.at(scores, np.concatenate(positions), np.concatenate(contributions))
+        order = np.argsort(-scores, kind='stable')
+        return [replace(unique[i], score=float(scores[i])) for i in order]
+
+    def _to_search_result(self, hit: Dict[str, Any], source: Literal['ast', 'semantic', 'hybrid']) -> SearchResult:
+        payload = hit.get('payload') or {}
+        return SearchResult(
+            file_path=payload.get('file_path', ''),
+            content=payload.get('content', ''),
+            language=payload.get('language') or '',
+            start_line=payload.get('start_line', 0),
+            end_line=payload.get('end_line', 0),
+            score=hit.get('score', 0.0),
+            chunk_type=payload.get('chunk_type', 'block'),
+            symbol_name=payload.get('symbol_name'),
+            source=source
+        )
 
-    def _build_filters(self, rewritten_query: str) -> SearchFilter:
+    def _build_filters(self, rewritten_query: RewrittenQuery) -> SearchFilter:
         filters = SearchFilter()
         # TODO parse file and add language/path filters
         return filters
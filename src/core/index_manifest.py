@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from src.core.config import settings
+from src.core.file_scanner import should_index
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def blob_sha(data: bytes) -> bytes:
+    """the id git gives a file with these contents, the same on every branch and fork"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).digest()
+
+@dataclass
+class IndexManifest:
+    """what was indexed for a repo: the commit and a content hash per file"""
+    repo_id: str
+    commit: Optional[str] = None
+    files: Dict[str, str] = field(default_factory=dict) # relative path -> sha256
+    # files that failed to index, retried on the next run even if git reports them unchanged
+    failed: List[str] = field(default_factory=list)
+
+    @staticmethod
+    def _path_for(repo_id: str) -> Path:
+        return Path(settings.INDEX_MANIFEST_DIR) / f"{repo_id}.json"
+
+    @classmethod
+    def load(cls, repo_id: str) -> "IndexManifest":
+        path = cls._path_for(repo_id)
+        if not path.exists():
+            return cls(repo_id=repo_id)
+        try:
+            data = json.loads(path.read_text())
+            return cls(
+                repo_id=repo_id, commit=data.get('commit'), files=data.get('files', {}), failed=data.get('failed', [])
+            )
+        except Exception as e:
+            logger.warning(f"ignoring unreadable manifest {path}: {e}")
+            return cls(repo_id=repo_id)
+
+    @classmethod
+    def mtime_ns(cls, repo_id: str) -> Optional[int]:
+        """when the manifest was last written, a cheap version stamp for the index"""
+        try:
+            return cls._path_for(repo_id).stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def save(self) -> None:
+        path = self._path_for(self.repo_id)
+        path.parent.mkdir(parents = True, exist_ok = True)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'commit': self.commit, 'files': self.files, 'failed': self.failed}))
+        # atomic so a crash mid-write never leaves a truncated manifest behind
+        os.replace(tmp, path)
+
+@dataclass
+class ReindexPlan:
+    to_index: List[Path] # files to (re)chunk and embed
+    stale: Set[str] # relative paths whose existing points must be removed first
+    deleted: Set[str] # relative paths no longer in the repo
+
+def plan_reindex(
+    manifest: IndexManifest,
+    repo_path: Path,
+    files: Iterable[Path],
+    diff: Optional[Tuple[Set[str], Set[str]]] = None,
+) -> ReindexPlan:
+    """
+    work out which files changed since the manifest was written. with a git diff
+    (changed, deleted) only the changed paths are hashed, otherwise every file is.
+    changed paths the index policy now rejects are dropped like deleted ones.
+    reads every candidate, so run it off the event loop
+    """
+    if diff is not None:
+        changed, deleted = diff
+        deleted = set(deleted)
+        candidates = []
+        for p in sorted(set(changed) | set(manifest.failed)):
+            if should_index(p, repo_path / p):
+                candidates.append(repo_path / p)
+            else:
+                deleted.add(p)
+    else:
+        candidates = list(files)
+        seen = {str(path.relative_to(repo_path)) for path in candidates}
+        deleted = set(manifest.files) - seen
+
+    to_index: List[Path] = []
+    stale: Set[str] = set()
+    for path in candidates:
+        rel = str(path.relative_to(repo_path))
+        try:
+            digest = content_digest(path.read_bytes())
+        except OSError as e:
+            logger.warning(f"could not hash {path}: {e}")
+            continue
+        if manifest.files.get(rel) == digest:
+            continue
+        to_index.append(path)
+        if rel in manifest.files:
+            stale.add(rel)
+
+    deleted = {rel for rel in deleted if rel in manifest.files}
+    return ReindexPlan(to_index=to_index, stale=stale | deleted, deleted=deleted)
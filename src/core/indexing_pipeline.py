@@ -0,0 +1,255 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Deque, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+
+from src.core.ast_parser import ASTParser
+from src.core.chunker import ChunkBatch, Chunker
+from src.core.config import settings
+from src.core.embeddings import EmbeddingGenerator
+from src.core.lexical_index import LexicalIndexBuilder
+from src.core.metrics import metrics
+from src.core.parse_pool import ParsePool, process_file, symbols_from_record
+from src.core.symbol_index import SymbolIndex
+
+if TYPE_CHECKING:
+    from src.qdrant.qdrant_client import QdrantClient
+
+# sentinel pushed through a queue once the producing stage is finished
+_DONE = object()
+
+@dataclass
+class IndexStats:
+    files: int = 0
+    failed_files: int = 0
+    chunks: int = 0
+    upserted: int = 0
+    reused: int = 0 # chunks of replaced files whose points were already stored
+    # time spent inside each call, summed, so concurrent upserts count separately
+    embed_seconds: float = 0.0
+    upsert_seconds: float = 0.0
+    file_hashes: Dict[str, str] = field(default_factory=dict) # relative path -> sha256, for the manifest
+    failed_paths: List[str] = field(default_factory=list) # relative paths of the failed files
+    # current point ids of the replaced files' chunks, their other points are stale
+    replaced_ids: Set[str] = field(default_factory=set)
+
+class IndexingPipeline:
+    """
+    walk -> read/parse/chunk -> embed -> upsert, with each stage connected by a
+    bounded queue so a slow stage applies backpressure to the ones before it.
+    only a handful of files and embedding batches are ever held in memory.
+    """
+
+    def __init__(
+        self,
+        ast_parser: ASTParser,
+        chunker: Chunker,
+        embeddings: EmbeddingGenerator,
+        qdrant: "QdrantClient",
+        parse_pool: Optional[ParsePool] = None,
+        lexical_index: Optional[LexicalIndexBuilder] = None,
+        symbol_index: Optional[SymbolIndex] = None,
+    ) -> None:
+        self.ast_parser = ast_parser
+        self.chunker = chunker
+        self.embeddings = embeddings
+        self.qdrant = qdrant
+        self.parse_pool = parse_pool
+        self.lexical_index = lexical_index
+        self.symbol_index = symbol_index
+        self.queue_size = settings.INDEX_QUEUE_SIZE
+        self.embed_batch_size = settings.INDEX_EMBED_BATCH_SIZE
+
+    async def run(
+        self,
+        repo_id: str,
+        repo_path: Path,
+        files: Iterable[Path],
+        replace: Optional[Set[str]] = None
+    ) -> IndexStats:
+        """
+        index files. replace holds relative paths of files that may already
+        have points, chunks of theirs that are already stored are neither
+        embedded nor written again
+        """
+        stats = IndexStats()
+        paths: asyncio.Queue[Any] = asyncio.Queue(maxsize=self.queue_size)
+        file_chunks: asyncio.Queue[Any] = asyncio.Queue(maxsize=self.queue_size)
+        # embedded batches are the largest items, keep at most two in flight
+        batches: asyncio.Queue[Any] = asyncio.Queue(maxsize=2)
+
+        # a failing stage cancels the others instead of leaving them blocked on a queue
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self._walk(files, paths))
+            if self.parse_pool:
+                tg.create_task(self._parse_parallel(self.parse_pool, repo_path, paths, file_chunks, stats))
+            else:
+                tg.create_task(self._parse(repo_path, paths, file_chunks, stats))
+            tg.create_task(self._embed(repo_id, replace or set(), file_chunks, batches, stats))
+            tg.create_task(self._upsert(repo_id, batches, stats))
+
+        return stats
+
+    async def _walk(self, files: Iterable[Path], out: asyncio.Queue[Any]) -> None:
+        for path in files:
+            await out.put(path)
+        await out.put(_DONE)
+
+    async def _parse(
+        self,
+        repo_path: Path,
+        inp: asyncio.Queue[Any],
+        out: asyncio.Queue[Any],
+        stats: IndexStats,
+    ) -> None:
+        while (path := await inp.get()) is not _DONE:
+            with metrics.span('index_parse'):
+                processed = process_file(self.ast_parser, self.chunker, repo_path, path)
+            if processed is None:
+                stats.failed_files += 1
+                stats.failed_paths.append(str(path.relative_to(repo_path)))
+                metrics.count('failed_files')
+                continue
+            rel_path, digest, chunks, ast_metadata = processed
+            if self.symbol_index is not None and ast_metadata is not None:
+                self.symbol_index.add_file(rel_path, ast_metadata.symbols, ast_metadata.dependencies)
+            await self._emit(rel_path, digest, chunks, out, stats)
+        await out.put(_DONE)
+
+    async def _parse_parallel(
+        self,
+        pool: ParsePool,
+        repo_path: Path,
+        inp: asyncio.Queue[Any],
+        out: asyncio.Queue[Any],
+        stats: IndexStats,
+    ) -> None:
+        # batches are consumed in submission order so the output order matches
+        # the walk order no matter which worker finishes first
+        pending: Deque[asyncio.Future[Any]] = deque()
+        batch: List[Path] = []
+        done = False
+        while not done:
+            path = await inp.get()
+            if path is _DONE:
+                done = True
+            else:
+                batch.append(path)
+            if batch and (done or len(batch) >= pool.batch_size):
+                pending.append(pool.submit(repo_path, batch))
+                batch = []
+            while pending and (done or len(pending) >= pool.max_in_flight):
+                # time spent waiting on the workers, what parsing costs this stage
+                with metrics.span('index_parse_wait'):
+                    records = await pending.popleft()
+                for path, record in records:
+                    if record is None:
+                        stats.failed_files += 1
+                        stats.failed_paths.append(str(Path(path).relative_to(repo_path)))
+                        metrics.count('failed_files')
+                        continue
+                    if self.symbol_index is not None and (record[3] or record[4]):
+                        self.symbol_index.add_file(record[0], symbols_from_record(record), record[4])
+                    await self._emit(record[0], record[1], record[2], out, stats)
+        await out.put(_DONE)
+
+    async def _emit(
+        self,
+        rel_path: str,
+        digest: str,
+        chunks: ChunkBatch,
+        out: asyncio.Queue[Any],
+        stats: IndexStats
+    ) -> None:
+        stats.files += 1
+        stats.file_hashes[rel_path] = digest
+        metrics.count('indexed_files')
+        if chunks:
+            if self.lexical_index is not None:
+                self.lexical_index.add_chunks(chunks)
+            await out.put(chunks)
+
+    async def _embed(
+        self,
+        repo_id: str,
+        replace: Set[str],
+        inp: asyncio.Queue[Any],
+        out: asyncio.Queue[Any],
+        stats: IndexStats
+    ) -> None:
+        buffer = ChunkBatch()
+        while (chunks := await inp.get()) is not _DONE:
+            buffer.extend(chunks)
+            while len(buffer) >= self.embed_batch_size:
+                batch = buffer.slice(0, self.embed_batch_size)
+                buffer = buffer.slice(self.embed_batch_size, len(buffer))
+                await self._embed_batch(repo_id, replace, batch, out, stats)
+        if buffer:
+            await self._embed_batch(repo_id, replace, buffer, out, stats)
+        await out.put(_DONE)
+
+    async def _embed_batch(
+        self,
+        repo_id: str,
+        replace: Set[str],
+        batch: ChunkBatch,
+        out: asyncio.Queue[Any],
+        stats: IndexStats
+    ) -> None:
+        ids = self.qdrant.point_ids(repo_id, batch)
+        if replace:
+            replaced = [point for i, point in enumerate(ids) if batch.path(i) in replace]
+            stats.replaced_ids.update(replaced)
+            # ids are content addressed, a stored id is a chunk that did not change
+            stored = await self.qdrant.existing_ids(replaced)
+            if stored:
+                keep = [i for i, point in enumerate(ids) if point not in stored]
+                stats.reused += len(ids) - len(keep)
+                metrics.count('reused_chunks', len(ids) - len(keep))
+                batch = batch.take(keep)
+                ids = [ids[i] for i in keep]
+                if not batch:
+                    return
+
+        started = time.perf_counter()
+        embeddings = await self.embeddings.generate_embeddings(batch.contents)
+        seconds = time.perf_counter() - started
+        stats.embed_seconds += seconds
+        stats.chunks += len(batch)
+        metrics.observe('index_embed', seconds)
+        metrics.count('indexed_chunks', len(batch))
+        await out.put((batch, ids, embeddings))
+
+    async def _upsert(self, repo_id: str, inp: asyncio.Queue[Any], stats: IndexStats) -> None:
+        # keep several upserts in flight so embedding the next batch overlaps the writes,
+        # but no more than the client will send at once so batches don't pile up in memory
+        pending: Set[asyncio.Task[None]] = set()
+        while (item := await inp.get()) is not _DONE:
+            if len(pending) >= self.qdrant.max_in_flight:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            chunks, ids, embeddings = item
+            pending.add(asyncio.create_task(self._upsert_batch(repo_id, chunks, ids, embeddings, stats)))
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def _upsert_batch(
+        self,
+        repo_id: str,
+        chunks: ChunkBatch,
+        ids: List[str],
+        embeddings: Any,
+        stats: IndexStats
+    ) -> None:
+        started = time.perf_counter()
+        await self.qdrant.upsert_chunks(repo_id, chunks, embeddings, ids=ids)
+        seconds = time.perf_counter() - started
+        stats.upsert_seconds += seconds
+        metrics.observe('index_upsert', seconds)
+        stats.upserted += len(chunks)
+        logger.debug(f"upserted {stats.upserted} chunks so far for repo {repo_id}")
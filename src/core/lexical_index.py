@@ -0,0 +1,227 @@
+import json
+import math
+import os
+import re
+import shutil
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+from loguru import logger
+
+from src.core.chunker import Chunk, ChunkBatch
+from src.core.config import settings
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+# HTTPServerError -> http, server, error; parseJSON2 -> parse, json, 2
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+def tokenize(text: str) -> List[str]:
+    """
+    code aware tokens: every identifier is kept whole (lowercased) and, when it
+    is camelCase or snake_case, also split into its parts
+    """
+    tokens: List[str] = []
+    for word in _WORD.findall(text):
+        tokens.append(word.lower())
+        parts = [part.lower() for piece in word.split('_') if piece for part in _CAMEL.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+# (path, start_line, end_line, chunk_type, symbol_name, language)
+DocMeta = Tuple[str, int, int, str, Optional[str], Optional[str]]
+
+def _repo_dir(repo_id: str) -> Path:
+    return Path(settings.LEXICAL_INDEX_DIR) / repo_id
+
+class LexicalIndexBuilder:
+    """
+    accumulates postings while the indexing pipeline streams chunks past it.
+    chunk contents are spilled to disk as they arrive, only postings and
+    per-doc metadata stay in memory
+    """
+
+    def __init__(self, repo_id: str) -> None:
+        self.repo_id = repo_id
+        self.generation = f"{time.time_ns()}"
+        self.path = _repo_dir(repo_id) / self.generation
+        self.path.mkdir(parents = True, exist_ok = True)
+        self.docs: List[DocMeta] = []
+        self.doc_lens = array('I')
+        self.content_offsets = array('Q', [0])
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self._content = open(self.path / 'content.bin', 'wb')
+
+    def add_chunks(self, chunks: Union[ChunkBatch, Iterable[Chunk]]) -> None:
+        rows = ChunkBatch.from_chunks(chunks).rows()
+        for content, path, language, start_line, end_line, chunk_type, symbol_name, _ in rows:
+            self._add((path, start_line, end_line, chunk_type, symbol_name, language), content)
+
+    def carry_over(self, index: "LexicalIndex", skip_paths: Set[str]) -> None:
+        """
+        copy the docs of unchanged files from a previous index. postings, doc
+        lengths and contents are copied as stored, nothing is tokenized again
+        """
+        keep = np.fromiter((meta[0] not in skip_paths for meta in index.docs), dtype=bool, count=len(index.docs))
+        kept = np.flatnonzero(keep)
+        if not len(kept):
+            return
+        # old doc id -> new one, carried docs keep their order after any already added
+        new_ids = (np.cumsum(keep, dtype=np.int64) - 1 + len(self.docs)).astype(np.uint32)
+        for term, (start, df) in index.vocab.items():
+            doc_ids = index.postings_docs[start:start + df]
+            mask = keep[doc_ids]
+            if not mask.any():
+                continue
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = (array('I'), array('I'))
+            postings[0].frombytes(new_ids[doc_ids[mask]].tobytes())
+            postings[1].frombytes(np.ascontiguousarray(index.postings_tfs[start:start + df][mask], dtype=np.uint32).tobytes())
+
+        offsets = np.asarray(index.content_offsets, dtype=np.uint64)
+        if index.content is not None:
+            # runs of consecutive kept docs are one contiguous slice of content.bin
+            breaks = np.flatnonzero(np.diff(kept) != 1) + 1
+            for run in np.split(kept, breaks):
+                self._content.write(index.content[offsets[run[0]]:offsets[run[-1] + 1]].tobytes())
+        lengths = (offsets[1:] - offsets[:-1])[kept]
+        self.content_offsets.frombytes((self.content_offsets[-1] + np.cumsum(lengths, dtype=np.uint64)).tobytes())
+        self.doc_lens.frombytes(np.ascontiguousarray(index.doc_lens[kept], dtype=np.uint32).tobytes())
+        self.docs.extend(tuple(index.docs[doc_id]) for doc_id in kept)  # type: ignore[misc]
+        logger.debug(f"carried {len(kept)} lexical docs over for repo {self.repo_id}")
+
+    def _add(self, meta: DocMeta, content: str) -> None:
+        doc_id = len(self.docs)
+        tokens = tokenize(content)
+        if meta[4]:
+            # symbol names are the strongest signal for identifier lookups
+            tokens.extend(tokenize(meta[4]) * settings.LEXICAL_SYMBOL_BOOST)
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = (array('I'), array('I'))
+            postings[0].append(doc_id)
+            postings[1].append(tf)
+
+        data = content.encode('utf-8', errors='surrogatepass')
+        self._content.write(data)
+        self.content_offsets.append(self.content_offsets[-1] + len(data))
+        self.docs.append(meta)
+        self.doc_lens.append(len(tokens))
+
+    def save(self) -> None:
+        self._content.close()
+        terms = sorted(self.postings)
+        vocab: Dict[str, List[int]] = {}
+        doc_ids = array('I')
+        tfs = array('I')
+        for term in terms:
+            term_docs, term_tfs = self.postings[term]
+            vocab[term] = [len(doc_ids), len(term_docs)]
+            doc_ids.extend(term_docs)
+            tfs.extend(term_tfs)
+
+        np.save(self.path / 'postings_docs.npy', np.frombuffer(doc_ids, dtype=np.uint32))
+        np.save(self.path / 'postings_tfs.npy', np.frombuffer(tfs, dtype=np.uint32))
+        np.save(self.path / 'doc_lens.npy', np.frombuffer(self.doc_lens, dtype=np.uint32))
+        np.save(self.path / 'content_offsets.npy', np.frombuffer(self.content_offsets, dtype=np.uint64))
+        (self.path / 'vocab.json').write_text(json.dumps(vocab))
+        (self.path / 'docs.json').write_text(json.dumps(self.docs))
+
+        # publish the new generation atomically; readers holding the old one keep their mmaps
+        repo_dir = _repo_dir(self.repo_id)
+        tmp = repo_dir / 'CURRENT.tmp'
+        tmp.write_text(self.generation)
+        os.replace(tmp, repo_dir / 'CURRENT')
+        for old in repo_dir.iterdir():
+            if old.is_dir() and old.name != self.generation:
+                shutil.rmtree(old, ignore_errors = True)
+        logger.info(f"saved lexical index for {self.repo_id}: {len(self.docs)} docs, {len(terms)} terms")
+
+    def discard(self) -> None:
+        self._content.close()
+        shutil.rmtree(self.path, ignore_errors = True)
+
+class LexicalIndex:
+    """read-only bm25 index over a repo's chunks, memory mapped from disk"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.vocab: Dict[str, List[int]] = json.loads((path / 'vocab.json').read_text())
+        self.docs: List[List[Any]] = json.loads((path / 'docs.json').read_text())
+        self.postings_docs = np.load(path / 'postings_docs.npy', mmap_mode='r')
+        self.postings_tfs = np.load(path / 'postings_tfs.npy', mmap_mode='r')
+        self.doc_lens = np.load(path / 'doc_lens.npy', mmap_mode='r')
+        self.content_offsets = np.load(path / 'content_offsets.npy', mmap_mode='r')
+        self.content = np.memmap(path / 'content.bin', dtype=np.uint8, mode='r') if self.content_offsets[-1] else None
+        self.avg_doc_len = float(self.doc_lens.mean()) if len(self.doc_lens) else 0.0
+
+    @staticmethod
+    def current_path(repo_id: str) -> Optional[Path]:
+        repo_dir = _repo_dir(repo_id)
+        try:
+            return repo_dir / (repo_dir / 'CURRENT').read_text().strip()
+        except OSError:
+            return None
+
+    @classmethod
+    def exists(cls, repo_id: str) -> bool:
+        path = cls.current_path(repo_id)
+        return path is not None and path.is_dir()
+
+    @classmethod
+    def load(cls, repo_id: str) -> Optional["LexicalIndex"]:
+        path = cls.current_path(repo_id)
+        if path is None or not path.is_dir():
+            return None
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def doc(self, doc_id: int) -> Tuple[DocMeta, str]:
+        start, end = int(self.content_offsets[doc_id]), int(self.content_offsets[doc_id + 1])
+        content = ''
+        if self.content is not None:
+            content = bytes(self.content[start:end]).decode('utf-8', errors='surrogatepass')
+        return tuple(self.docs[doc_id]), content  # type: ignore[return-value]
+
+    def iter_docs(self) -> Iterator[Tuple[DocMeta, str]]:
+        for doc_id in range(len(self.docs)):
+            yield self.doc(doc_id)
+
+    def search(self, query: str, limit: int, k1: float = 1.2, b: float = 0.75) -> List[Tuple[int, float]]:
+        """top (doc_id, bm25 score) pairs for the query"""
+        n_docs = len(self.docs)
+        terms = set(tokenize(query))
+        if not n_docs or not terms:
+            return []
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        avg_doc_len = max(self.avg_doc_len, 1.0)
+        for term in terms:
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            start, df = entry
+            doc_ids = self.postings_docs[start:start + df]
+            tfs = self.postings_tfs[start:start + df].astype(np.float32)
+            norm = k1 * (1 - b + b * self.doc_lens[doc_ids].astype(np.float32) / avg_doc_len)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            # each doc appears at most once per term, so a fancy-indexed add is safe
+            scores[doc_ids] += idf * tfs * (k1 + 1) / (tfs + norm)
+
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        if len(hits) > limit:
+            hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in hits]
@@ -0,0 +1,110 @@
+import asyncio
+import weakref
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional, Tuple
+
+from loguru import logger
+
+from src.core.config import settings
+from src.core.metrics import metrics
+
+if TYPE_CHECKING:
+    from anthropic import AsyncAnthropic
+
+class LLMUnavailable(RuntimeError):
+    pass
+
+class _LoopState:
+    """
+    the client, semaphore and in-flight requests of one event loop. httpx and
+    asyncio primitives are bound to the loop they were first used on, so every
+    loop (e.g. each asyncio.run of the cli) gets its own
+    """
+
+    def __init__(self) -> None:
+        from anthropic import AsyncAnthropic
+        self.client: "AsyncAnthropic" = AsyncAnthropic(
+            api_key=settings.LLM_API_KEY,
+            timeout=settings.LLM_TIMEOUT_S,
+            max_retries=settings.LLM_MAX_RETRIES
+        )
+        self.semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        self.in_flight: Dict[Tuple[str, int, str], "asyncio.Task[str]"] = {}
+
+_states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+
+def llm_available() -> bool:
+    return settings.LLM_PROVIDER == 'anthropic' and bool(settings.LLM_API_KEY and settings.LLM_API_KEY.strip())
+
+def _state() -> _LoopState:
+    loop = asyncio.get_running_loop()
+    state = _states.get(loop)
+    if state is None:
+        # the anthropic sdk takes a second to import, only pay for it on the first call
+        state = _states[loop] = _LoopState()
+        logger.info(f"anthropic client initialized, at most {settings.LLM_MAX_CONCURRENCY} concurrent requests")
+    return state
+
+async def complete(prompt: str, max_tokens: int, timeout: Optional[float] = None) -> str:
+    """
+    text of a single-turn completion. identical prompts already in flight share
+    one request, and at most LLM_MAX_CONCURRENCY requests run at once across the
+    process. raises LLMUnavailable without an api key and asyncio.TimeoutError
+    when the request (including the wait for a slot) exceeds the timeout
+    """
+    if not llm_available():
+        raise LLMUnavailable(f"no api key configured for {settings.LLM_PROVIDER}")
+    state = _state()
+    key = (settings.LLM_MODEL, max_tokens, prompt)
+    task = state.in_flight.get(key)
+    if task is not None:
+        metrics.count('llm_coalesced')
+    else:
+        metrics.count('llm_requests')
+        task = asyncio.create_task(_request(state, prompt, max_tokens))
+        state.in_flight[key] = task
+        task.add_done_callback(lambda done: _finish(state, key, done))
+    # a caller that times out or is cancelled leaves the request running for the others
+    return await asyncio.wait_for(asyncio.shield(task), timeout or settings.LLM_TIMEOUT_S)
+
+def _finish(state: _LoopState, key: Tuple[str, int, str], task: "asyncio.Task[str]") -> None:
+    state.in_flight.pop(key, None)
+    if not task.cancelled():
+        # mark the error as retrieved, every caller may already have timed out
+        task.exception()
+
+async def _request(state: _LoopState, prompt: str, max_tokens: int) -> str:
+    async with state.semaphore:
+        response = await state.client.messages.create(
+            model=settings.LLM_MODEL,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    return response.content[0].text
+
+async def stream(prompt: str, max_tokens: int, timeout: Optional[float] = None) -> AsyncIterator[str]:
+    """
+    the completion in pieces as the model produces them. holds a concurrency
+    slot until the stream ends; streams are never coalesced. the timeout
+    applies to the wait for a slot and to the gap between pieces
+    """
+    if not llm_available():
+        raise LLMUnavailable(f"no api key configured for {settings.LLM_PROVIDER}")
+    state = _state()
+    timeout = timeout or settings.LLM_TIMEOUT_S
+    metrics.count('llm_requests')
+    await asyncio.wait_for(state.semaphore.acquire(), timeout)
+    try:
+        async with state.client.messages.stream(
+            model=settings.LLM_MODEL,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}]
+        ) as response:
+            pieces = response.text_stream.__aiter__()
+            while True:
+                try:
+                    piece = await asyncio.wait_for(pieces.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                yield piece
+    finally:
+        state.semaphore.release()
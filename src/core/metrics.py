@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+from src.core.config import settings
+
+# upper bounds in seconds, from a symbol lookup up to a slow llm answer
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+# stage -> milliseconds for the query being served by this task, see breakdown()
+_breakdown: ContextVar[Optional[Dict[str, float]]] = ContextVar('_breakdown', default=None)
+
+# one shared do-nothing context manager, so a disabled span costs a flag check
+_NOOP = nullcontext()
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """upper bound of the bucket holding the q-th observation, a coarse estimate"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return bound if bound != float('inf') else BUCKETS[-2]
+        return 0.0
+
+class Metrics:
+    """
+    process-wide counters and per-stage latency histograms. updates take a
+    lock since encoders and qdrant calls finish on worker threads
+    """
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, float] = {}
+        self.stages: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, value: float = 1) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage: str, seconds: float) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+        timings = _breakdown.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds * 1000
+
+    def span(self, stage: str) -> ContextManager[Any]:
+        """time the block as one observation of stage"""
+        if not settings.METRICS_ENABLED:
+            return _NOOP
+        return _Span(self, stage)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'stages': {
+                    stage: {
+                        'count': h.count,
+                        'total_ms': round(h.total * 1000, 3),
+                        'mean_ms': round(h.total * 1000 / h.count, 3) if h.count else 0.0,
+                        'p50_ms': h.quantile(0.5) * 1000,
+                        'p95_ms': h.quantile(0.95) * 1000,
+                        'p99_ms': h.quantile(0.99) * 1000,
+                    }
+                    for stage, h in self.stages.items()
+                }
+            }
+
+    def render(self) -> str:
+        """prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines += [f"# TYPE cbrt_{name}_total counter", f"cbrt_{name}_total {value:g}"]
+            if self.stages:
+                lines.append("# TYPE cbrt_stage_seconds histogram")
+            for stage, histogram in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f'cbrt_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'cbrt_stage_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'cbrt_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.stages.clear()
+
+class _Span:
+    __slots__ = ('metrics', 'stage', 'started')
+
+    def __init__(self, metrics: Metrics, stage: str) -> None:
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.metrics.observe(self.stage, time.perf_counter() - self.started)
+
+metrics = Metrics()
+
+@contextmanager
+def breakdown(timings: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, float]]:
+    """
+    collect the milliseconds spent in each stage inside the block, including
+    in tasks it starts, into timings (a new dict if not given), which is
+    yielded. stages that run more than once are summed
+    """
+    timings = {} if timings is None else timings
+    if not settings.METRICS_ENABLED:
+        yield timings
+        return
+    token = _breakdown.set(timings)
+    try:
+        yield timings
+    finally:
+        _breakdown.reset(token)
+
+async def serve_metrics(port: int, host: str = '127.0.0.1') -> None:
+    """a minimal http server answering GET /metrics with render(), for prometheus to scrape"""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            # drain the headers, nothing in them matters here
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            path = request_line.split()[1] if len(request_line.split()) > 1 else b'/'
+            if path.split(b'?')[0] in (b'/metrics', b'/'):
+                status, body = "200 OK", metrics.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
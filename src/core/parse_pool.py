@@ -0,0 +1,126 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from src.core.ast_parser import ASTMetadata, ASTParser, Symbol
+from src.core.chunker import ChunkBatch, Chunker
+from src.core.config import settings
+from src.core.file_scanner import read_source
+
+# compact, cheap to pickle forms of a file's results. chunks travel as a columnar
+# ChunkBatch, symbols as tuples:
+# (name, type, start_line, end_line, signature, parent)
+SymbolRecord = Tuple[str, str, int, int, Optional[str], Optional[str]]
+# (relative path, sha256, chunks, symbols, dependencies)
+FileRecord = Tuple[str, str, ChunkBatch, List[SymbolRecord], List[str]]
+# (relative path, None) marks a file that failed to parse
+ParseResult = Tuple[str, Optional[FileRecord]]
+
+def process_file(
+    parser: ASTParser,
+    chunker: Chunker,
+    repo_path: Path,
+    path: Path
+) -> Optional[Tuple[str, str, ChunkBatch, Optional[ASTMetadata]]]:
+    """read, parse and chunk one file. returns (relative path, sha256, chunks, ast metadata), or None on failure"""
+    try:
+        digest, data = read_source(path)
+        rel_path = path.relative_to(repo_path)
+        if data is None:
+            # recorded in the manifest with no chunks, so it isn't read again until it changes
+            logger.debug(f"skipping binary or minified file {rel_path}")
+            return str(rel_path), digest, ChunkBatch(), None
+        content = data.decode('utf-8', errors = 'ignore')
+        ast_metadata = parser.parse_file(path, data)
+        chunks = chunker.chunk_file(rel_path, content, ast_metadata)
+        return str(rel_path), digest, chunks, ast_metadata
+    except Exception as e:
+        logger.error(f"Failed to index {path}: {e}")
+        return None
+
+def to_record(rel_path: str, digest: str, chunks: ChunkBatch, ast_metadata: Optional[ASTMetadata]) -> FileRecord:
+    symbols = ast_metadata.symbols if ast_metadata else []
+    return rel_path, digest, chunks, [
+        (s.name, s.type, s.start_line, s.end_line, s.signature, s.parent)
+        for s in symbols
+    ], ast_metadata.dependencies if ast_metadata else []
+
+def symbols_from_record(record: FileRecord) -> List[Symbol]:
+    return [
+        Symbol(name=name, type=kind, start_line=start, end_line=end, signature=signature, parent=parent)
+        for name, kind, start, end, signature, parent in record[3]
+    ]
+
+# settings read while parsing and chunking, runtime changes in the parent are
+# not visible in spawned workers otherwise
+_FORWARDED_SETTINGS = (
+    'CHUNK_SIZE', 'CHUNK_OVERLAP', 'AST_CACHE_ENABLED', 'AST_CACHE_PATH', 'AST_CACHE_MAX_MB',
+    'INDEX_MMAP_MIN_KB', 'INDEX_MAX_FILE_KB', 'INDEX_EXCLUDE', 'GIT_CHECKOUT_EXTENSIONS',
+)
+
+# parser/chunker instances owned by the current worker. thread-local so the
+# thread pool fallback never shares a tree-sitter parser between threads
+_worker_state = threading.local()
+
+def _init_worker(overrides: Dict[str, Any]) -> None:
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+def _parse_batch(repo_path: str, paths: List[str]) -> List[ParseResult]:
+    if not hasattr(_worker_state, 'parser'):
+        _worker_state.parser = ASTParser()
+        _worker_state.chunker = Chunker()
+
+    root = Path(repo_path)
+    results: List[ParseResult] = []
+    for path in paths:
+        processed = process_file(_worker_state.parser, _worker_state.chunker, root, Path(path))
+        results.append((path, to_record(*processed) if processed else None))
+    return results
+
+class ParsePool:
+    """
+    fans read/parse/chunk out to a pool of workers in batches of files.
+    uses processes (tree-sitter and chunking are CPU bound) and falls back to
+    threads where processes are unavailable.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        mode: Optional[str] = None,
+        batch_size: Optional[int] = None
+    ) -> None:
+        self.workers = workers or settings.PARSE_WORKERS
+        self.mode = mode or settings.PARSE_POOL_MODE
+        self.batch_size = batch_size or settings.PARSE_BATCH_SIZE
+        # enough batches queued to keep every worker busy while results are consumed
+        self.max_in_flight = self.workers * 2
+        self.executor = self._create_executor()
+
+    def _create_executor(self) -> Executor:
+        if self.mode == 'process':
+            try:
+                return ProcessPoolExecutor(
+                    max_workers = self.workers,
+                    # fork is unsafe with the event loop and model threads already running
+                    mp_context = multiprocessing.get_context('spawn'),
+                    initializer = _init_worker,
+                    initargs = ({name: getattr(settings, name) for name in _FORWARDED_SETTINGS},)
+                )
+            except Exception as e:
+                logger.warning(f"process pool unavailable, falling back to threads: {e}")
+                self.mode = 'thread'
+        return ThreadPoolExecutor(max_workers = self.workers, thread_name_prefix = 'parse')
+
+    def submit(self, repo_path: Path, paths: List[Path]) -> "asyncio.Future[Any]":
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, _parse_batch, str(repo_path), [str(p) for p in paths])
+
+    def close(self) -> None:
+        self.executor.shutdown(wait = False, cancel_futures = True)
@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+from src.core.config import settings
+from src.core.index_manifest import IndexManifest
+
+V = TypeVar('V')
+
+class TTLCache(Generic[V]):
+    """
+    in-memory lru cache whose entries also expire ttl seconds after they were
+    stored. not thread safe, it is only used from the event loop
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None) -> None:
+        self.max_entries = settings.QUERY_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl = settings.QUERY_CACHE_TTL_S if ttl is None else ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: V) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard_where(self, predicate: Any) -> None:
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class QueryCache:
+    """
+    per-process caches for the query path. search results and responses are
+    keyed by (repo_id, repo version, query, top_k, mode), where the version
+    changes whenever the repo is re-indexed, so a re-index makes every older
+    entry unreachable even when it happened in another process
+    """
+
+    def __init__(self, enabled: Optional[bool] = None) -> None:
+        enabled = settings.QUERY_CACHE_ENABLED if enabled is None else enabled
+        max_entries = settings.QUERY_CACHE_MAX_ENTRIES if enabled else 0
+        self.embeddings: TTLCache[Any] = TTLCache(max_entries)
+        self.searches: TTLCache[Any] = TTLCache(max_entries)
+        self.responses: TTLCache[str] = TTLCache(max_entries)
+        # repo_id -> (manifest mtime, version), so the manifest is only read when it changes
+        self._versions: Dict[str, Tuple[int, str]] = {}
+
+    def repo_version(self, repo_id: str) -> Optional[str]:
+        """the indexed commit plus when it was indexed, None if the repo has no manifest"""
+        mtime = IndexManifest.mtime_ns(repo_id)
+        if mtime is None:
+            return None
+        cached = self._versions.get(repo_id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        version = f"{IndexManifest.load(repo_id).commit}@{mtime}"
+        self._versions[repo_id] = (mtime, version)
+        return version
+
+    def invalidate(self, repo_id: str) -> None:
+        """drop everything cached for a repo, called after it is re-indexed"""
+        self._versions.pop(repo_id, None)
+        for cache in (self.searches, self.responses):
+            cache.discard_where(lambda key: key[0] == repo_id)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {'entries': len(cache), 'hits': cache.hits, 'misses': cache.misses}
+            for name, cache in (('embeddings', self.embeddings), ('searches', self.searches), ('responses', self.responses))
+        }
@@ -1,10 +1,14 @@
-from dataclasses import dataclass
-from typing import Optional, List, Literal
-
-from anthropic import Anthropic
+import asyncio
+import json
+import re
+from dataclasses import dataclass, replace
+from typing import List, Literal
 
 from loguru import logger
+from src.core import llm_client
 from src.core.config import settings
+from src.core.metrics import metrics
+from src.core.query_cache import TTLCache
 
 @dataclass
 class RewrittenQuery:
@@ -20,17 +24,17 @@ class QueryRewriter:
         self.provider = settings.LLM_PROVIDER
         self.model = settings.LLM_MODEL
 
+        # successful rewrites by query text, failures are retried
+        self.cache: TTLCache[RewrittenQuery] = TTLCache(None if settings.QUERY_CACHE_ENABLED else 0)
+
         if self.provider == 'anthropic':
             if not settings.LLM_API_KEY:
                 logger.warning("No api key configured, query rewriting disabled")
-                self.client = None
-            else:
-                self.client = Anthropic(api_key=settings.LLM_API_KEY)
         else:
             logger.warning(f"Provider not yet supported: {settings.LLM_PROVIDER}")
 
     async def rewrite_query(self, original_query) -> RewrittenQuery:
-        if not self.client:
+        if not llm_client.llm_available():
             # Return basic query without rewriting
             return RewrittenQuery(
                 original_query=original_query,
@@ -40,39 +44,68 @@ class QueryRewriter:
                 reasoning="Query rewriting not available"
             )
 
+        cached = self.cache.get(original_query)
+        if cached is not None:
+            return replace(cached, expanded_terms=list(cached.expanded_terms))
+
         try:
             prompt = self._build_rewrite_prompt(original_query)
-            response = self.client.messages.create(
-                model = self.model,
-                max_tokens = 1000,
-                messages=[{"role": "user", "content": prompt}]
-            )
+            with metrics.span('rewrite'):
+                text = await llm_client.complete(prompt, max_tokens=1000, timeout=settings.QUERY_REWRITE_TIMEOUT_S)
 
-            rewritten = self._parse_rewrite_response(
-                original_query,
-                response.content[0].text
-            )
+            rewritten = self._parse_rewrite_response(original_query, text)
 
             logger.debug(f"Rewrote query: {original_query} -> {rewritten.expanded_terms}")
+            self.cache.put(original_query, replace(rewritten, expanded_terms=list(rewritten.expanded_terms)))
             return rewritten
 
-        except Exception as e:
-            logger.error(f"Query rewriting failed: {e}")
-            # Fallback to original query
+        except asyncio.TimeoutError:
+            metrics.count('rewrite_timeouts')
+            # a slow rewrite must not hold up the search, the original query is good enough
+            logger.warning(f"Query rewriting timed out after {settings.QUERY_REWRITE_TIMEOUT_S}s")
             return RewrittenQuery(
                 original_query=original_query,
                 expanded_terms=[original_query],
                 search_strategy='hybrid',
                 file_patterns=[],
-                reasoning=f"Rewriting failed: {e}"
+                reasoning="Rewriting timed out"
             )
-
         except Exception as e:
-            logger.error(f"unexpected error in query rewriting: {e}")
+            logger.error(f"Query rewriting failed: {e}")
+            # Fallback to original query
             return RewrittenQuery(
-                original_query=query,
-                rewritten_query=query,
+                original_query=original_query,
+                expanded_terms=[original_query],
                 search_strategy='hybrid',
                 file_patterns=[],
-                reasoning=f"Unexpected error: {e}"
+                reasoning=f"Rewriting failed: {e}"
             )
+
+    def _build_rewrite_prompt(self, original_query: str) -> str:
+        return f"""You are helping search a code repository. Rewrite the user's question into search queries.
+
+**User Question:** {original_query}
+
+Respond with only a JSON object with these keys:
+- "expanded_terms": 2-4 short alternative phrasings or identifier-style queries (e.g. function or class names) \
+that are likely to match the relevant code
+- "search_strategy": "ast" for exact identifier lookups, "semantic" for conceptual questions, "hybrid" otherwise
+- "file_patterns": glob patterns for files that are likely relevant, or an empty list
+- "reasoning": one sentence explaining the rewrite"""
+
+    def _parse_rewrite_response(self, original_query: str, text: str) -> RewrittenQuery:
+        # models sometimes wrap the json in prose or a code fence
+        match = re.search(r"\{.*\}", text, re.DOTALL)
+        data = json.loads(match.group(0) if match else text)
+
+        expanded = [str(term).strip() for term in data.get('expanded_terms') or [] if str(term).strip()]
+        strategy = data.get('search_strategy')
+        if strategy not in ('ast', 'semantic', 'hybrid'):
+            strategy = 'hybrid'
+        return RewrittenQuery(
+            original_query=original_query,
+            expanded_terms=expanded or [original_query],
+            search_strategy=strategy,
+            file_patterns=[str(p) for p in data.get('file_patterns') or []],
+            reasoning=str(data.get('reasoning', ''))
+        )
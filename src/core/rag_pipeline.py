@@ -1,18 +1,34 @@
 import asyncio
-from typing import List, Optional, Literal
+import time
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Literal, Set, Tuple, Union
+
+import numpy as np
 
 from loguru import logger
 
 from src.core.ast_parser import ASTParser
-from src.core.chunker import Chunker, Chunk
+from src.core.chunker import Chunker
 from src.core.config import settings
 from src.core.embeddings import EmbeddingGenerator
 from src.core.git_handler import GitHandler
 from src.core.hybrid_search import HybridSearch, SearchResult
+from src.core.index_manifest import IndexManifest, plan_reindex
+from src.core.indexing_pipeline import IndexingPipeline, IndexStats
+from src.core.lexical_index import LexicalIndex, LexicalIndexBuilder
+from src.core.metrics import breakdown, metrics
+from src.core.parse_pool import ParsePool
+from src.core.query_cache import QueryCache
 from src.core.query_rewriter import QueryRewriter, RewrittenQuery
-from src.core.response_generator import ResponseGenerator
-from src.qdrant.qdrant_client import QdrantClient
+from src.core.response_generator import CUT_OFF_NOTE, ResponseGenerator
+from src.core.symbol_index import SymbolIndex
+
+if TYPE_CHECKING:
+    from src.qdrant.qdrant_client import QdrantClient
 
+@dataclass
 class QueryResult:
     """Result of a query operation."""
     query: str
@@ -21,98 +37,325 @@ class QueryResult:
     search_time_ms: float
     search_mode: str
     generated_response: Optional[str] = None
+    # milliseconds per pipeline stage (rewrite, embed, qdrant_search, generate, ...)
+    timings_ms: Dict[str, float] = field(default_factory=dict)
 
 class CodebaseRAG:
-    def __init__(self) -> None:
-        self.query_rewriter = QueryRewriter()
-        self.qdrant = QdrantClient()
-        self.hybrid_search = HybridSearch(self.qdrant)
-        self.response_generator = ResponseGenerator()
-        self.chunker = Chunker()
-        self.embeddings = EmbeddingGenerator()
-        self.ast_parser = ASTParser()
-        self.git_handler = GitHandler()
+    """
+    components are built on first use, so a query answered from the symbol
+    index never loads the embedding model and git-only operations never
+    connect to qdrant
+    """
 
+    def __init__(self) -> None:
         logger.info("RAG pipeline initialized")
 
+    @cached_property
+    def query_cache(self) -> QueryCache:
+        return QueryCache()
+
+    @cached_property
+    def query_rewriter(self) -> QueryRewriter:
+        return QueryRewriter()
+
+    @cached_property
+    def qdrant(self) -> "QdrantClient":
+        # qdrant_client is one of the slowest imports in the tree
+        from src.qdrant.qdrant_client import QdrantClient
+        return QdrantClient()
+
+    @cached_property
+    def hybrid_search(self) -> HybridSearch:
+        return HybridSearch(self.qdrant)
+
+    @cached_property
+    def response_generator(self) -> ResponseGenerator:
+        return ResponseGenerator()
+
+    @cached_property
+    def chunker(self) -> Chunker:
+        return Chunker()
+
+    @cached_property
+    def embeddings(self) -> EmbeddingGenerator:
+        return EmbeddingGenerator()
+
+    @cached_property
+    def ast_parser(self) -> ASTParser:
+        return ASTParser()
+
+    @cached_property
+    def git_handler(self) -> GitHandler:
+        return GitHandler()
+
+    @cached_property
+    def parse_pool(self) -> Optional[ParsePool]:
+        return ParsePool() if settings.PARSE_WORKERS > 0 else None
+
     async def init(self) -> None:
         await self.qdrant.create_collection()
         logger.info("RAG pipeline ready")
 
-    async def index_repo(self, github_url: str, force_reindex: bool) -> str:
+    def close(self) -> None:
+        """stop the parse workers and flush the caches of the components that were built"""
+        built = vars(self)
+        if built.get('parse_pool') is not None:
+            built['parse_pool'].close()
+        for name in ('ast_parser', 'embeddings'):
+            cache = getattr(built.get(name), 'cache', None)
+            if cache is not None:
+                cache.close()
+
+    async def index_repo(self, github_url: str, force_reindex: bool = False) -> str:
         logger.info(f"Indexing repository: {github_url}")
         try:
-            files = self.git_handler.list_files(repo_path)
-            logger.info(f"Found {len(files)} files")
-
-            if not files:
-                raise ValueError("No files found in repo")
-
-            chunks: List[Chunk] = []
-
-            for i, path in enumerate(files):
-                try:
-                    content = path.read_text(encoding = 'utf-8', errors = 'ignore')
-                    ast_metadata = self.ast_parser.parse_file(path, content)
-                    file_chunks = self.chunker.chunk_file(
-                        path.relative_to(repo_path),
-                        content,
-                        ast_metadata
-                    )
-                    chunks.extend(file_chunks)
-                except Exception as e:
-                    logger.error(f"Failed to index {path}")
-            
-            logger.info(f"Created {len(chunks)} code chunks")
-
-            chunk_texts = [chunk.content for chunk in chunks]
-            embeddings = await self.embeddings.generate_embeddings(chunk_texts)
-
-            await self.qdrant.upsert_chunks(repo_id, chunks, embeddings)
-
-            logger.info(f"Indexed repo {repo_id}")
+            repo_id, repo_path = await self.git_handler.clone_repo(github_url, update=True)
+            await self.index_path(repo_id, repo_path, force_reindex)
+            return repo_id
         except Exception as e:
-            pass
+            logger.error(f"Indexing failed: {e}")
+            raise
+
+    async def index_path(self, repo_id: str, repo_path: Path, force_reindex: bool = False) -> IndexStats:
+        """index a working tree that is already on disk, incrementally unless forced"""
+        manifest = IndexManifest.load(repo_id)
+        head = self.git_handler.get_head_commit(repo_path)
+        # lazy, only listed when a full index or a plan without a git diff needs it
+        files = self.git_handler.list_files(repo_path)
+
+        lexical = LexicalIndexBuilder(repo_id) if settings.LEXICAL_INDEX_ENABLED else None
+        # everything up to the run can fail (e.g. qdrant unreachable), the half
+        # written generation is dropped whichever step it is
+        try:
+            previous_lexical = LexicalIndex.load(repo_id) if lexical is not None else None
+            symbols = SymbolIndex.load(repo_id)
+
+            # a manifest without points (e.g. a fresh in-memory store) cannot be trusted,
+            # and the local indexes can only be updated incrementally if they exist
+            if (
+                force_reindex
+                or not manifest.files
+                or not await self.qdrant.count_points(repo_id)
+                or (lexical is not None and previous_lexical is None)
+                or symbols is None
+            ):
+                logger.info(f"Full index of {repo_id}")
+                await self.qdrant.delete_repo(repo_id)
+                manifest = IndexManifest(repo_id=repo_id)
+                symbols = SymbolIndex(repo_id, str(repo_path))
+                # listing runs git ls-files and stats every path, keep that off the event loop
+                files = await asyncio.to_thread(lambda: list(self.git_handler.list_files(repo_path)))
+                deleted: Set[str] = set()
+                replaced_paths: Set[str] = set()
+            else:
+                diff = None
+                if manifest.commit and head:
+                    diff = await asyncio.to_thread(self.git_handler.diff_files, repo_path, manifest.commit)
+                # hashes every candidate file, keep that off the event loop
+                plan = await asyncio.to_thread(plan_reindex, manifest, repo_path, files, diff)
+                logger.info(
+                    f"Incremental index of {repo_id}: {len(plan.to_index)} changed, "
+                    f"{len(plan.deleted)} deleted (since {manifest.commit or 'unknown commit'})"
+                )
+                # deleted files go now. changed files keep their points while they are
+                # re-indexed, chunks that did not change are not embedded or written again
+                # and the points of the ones that did are dropped afterwards
+                await self.qdrant.delete_files(repo_id, sorted(plan.deleted))
+                replaced_paths = plan.stale - plan.deleted
+                symbols.remove_files(plan.stale)
+                if lexical is not None and previous_lexical is not None:
+                    if plan.to_index or plan.stale:
+                        await asyncio.to_thread(lexical.carry_over, previous_lexical, plan.stale)
+                    else:
+                        # nothing changed, keep the published index as is
+                        lexical.discard()
+                        lexical = None
+                files = plan.to_index
+                deleted = plan.deleted
+
+            pipeline = IndexingPipeline(
+                self.ast_parser,
+                self.chunker,
+                self.embeddings,
+                self.qdrant,
+                parse_pool=self.parse_pool,
+                lexical_index=lexical,
+                symbol_index=symbols
+            )
+            stats = await pipeline.run(repo_id, repo_path, files, replace=replaced_paths)
+        except BaseException:
+            if lexical is not None:
+                lexical.discard()
+            raise
+        if lexical is not None:
+            lexical.save()
+        symbols.save()
+        await self.qdrant.delete_files(repo_id, sorted(replaced_paths), keep_ids=stats.replaced_ids)
+
+        if not stats.files and not manifest.files:
+            raise ValueError("No files found in repo")
+
+        # a failed file keeps no hash, so the next run indexes it again instead
+        # of trusting its old one, whether or not git reports it as changed
+        for rel_path in deleted | set(stats.failed_paths):
+            manifest.files.pop(rel_path, None)
+        manifest.files.update(stats.file_hashes)
+        manifest.failed = sorted(stats.failed_paths)
+        manifest.commit = head
+        manifest.save()
+        self.query_cache.invalidate(repo_id)
+
+        logger.info(
+            f"Indexed repo {repo_id}: {stats.files} files ({stats.failed_files} failed), "
+            f"{stats.chunks} chunks embedded, {stats.upserted} upserted, {stats.reused} unchanged"
+        )
+        return stats
+
+    async def _search(
+        self,
+        repo_id: str,
+        query: str,
+        top_k: int,
+        search_mode: Literal['hybrid', 'ast', 'semantic']
+    ) -> Tuple[RewrittenQuery, List[SearchResult]]:
+        # identifier queries are answered straight from the symbol index,
+        # skipping the rewrite, embedding and vector search
+        if search_mode != 'semantic':
+            results = self.hybrid_search.lookup_symbol(repo_id, query, top_k)
+            if results:
+                return RewrittenQuery(query, [query], 'ast', [], "exact symbol match"), results
+
+        # the original query is embedded while the llm rewrites it, only the
+        # expansions have to wait for the rewrite
+        rewritten, query_vectors = await asyncio.gather(
+            self.query_rewriter.rewrite_query(query),
+            self._embed_queries([query])
+        )
+        if search_mode != 'hybrid':
+            rewritten = replace(rewritten, search_strategy=search_mode)
+        expansions = [text for text in dict.fromkeys(rewritten.expanded_terms) if text != query]
+        if expansions:
+            expansion_vectors = await self._embed_queries(expansions[:settings.QUERY_MAX_EXPANSIONS])
+            query_vectors = np.concatenate([query_vectors, expansion_vectors])
+        results = await self.hybrid_search.search(
+            repo_id=repo_id,
+            query_vectors=query_vectors,
+            rewritten_query=rewritten,
+            top_k=top_k
+        )
+        return rewritten, results
+
+    async def _embed_queries(self, texts: List[str]) -> np.ndarray:
+        cache = self.query_cache.embeddings
+        cached = [cache.get(text) for text in texts]
+        missing = [text for text, vector in zip(texts, cached) if vector is None]
+        if not missing:
+            return np.stack(cached)
+        computed = await self.embeddings.generate_embeddings(missing)
+        for text, vector in zip(missing, computed):
+            cache.put(text, vector)
+        rows = iter(computed)
+        return np.stack([vector if vector is not None else next(rows) for vector in cached])
+
+    async def _retrieve(
+        self,
+        repo_id: str,
+        query: str,
+        top_k: int,
+        search_mode: Literal['hybrid', 'ast', 'semantic']
+    ) -> Tuple[QueryResult, tuple]:
+        start_time = time.time()
+        metrics.count('queries')
+        timings: Dict[str, float] = {}
+        with breakdown(timings), metrics.span('retrieve'):
+            # keyed on the indexed version, so a re-index never serves stale results
+            cache_key = (repo_id, self.query_cache.repo_version(repo_id), query, top_k, search_mode)
+            cached = self.query_cache.searches.get(cache_key)
+            if cached is not None:
+                metrics.count('query_cache_hits')
+                rewritten, results = cached
+                results = list(results)
+            else:
+                rewritten, results = await self._search(repo_id, query, top_k, search_mode)
+                self.query_cache.searches.put(cache_key, (rewritten, list(results)))
+        search_time_ms = (time.time() - start_time) * 1000
+
+        logger.info(f"Finished query in {search_time_ms:.0f}ms, found {len(results)} results")
+        result = QueryResult(
+            query=query,
+            rewritten_query=rewritten,
+            results=results,
+            search_time_ms=search_time_ms,
+            search_mode=search_mode,
+            timings_ms=timings
+        )
+        return result, cache_key
+
+    def _cache_response(self, cache_key: tuple, query: str, results: List[SearchResult], response: str) -> None:
+        # fallbacks are cheap to rebuild, and caching one would hide the llm
+        # answer until the entry expires
+        if response and response != self.response_generator.fallback_response(query, results) \
+                and not response.endswith(CUT_OFF_NOTE):
+            self.query_cache.responses.put(cache_key, response)
 
     async def query(
         self,
         repo_id: str,
         query: str,
         top_k: int = 5,
-        search_mode: Literal['hybrid', 'test', 'semantic'] = 'hybrid',
+        search_mode: Literal['hybrid', 'ast', 'semantic'] = 'hybrid',
+        generate_response: bool = True,
     ) -> QueryResult:
-        start_time = time.time()
         logger.info(f"Query: {query} on repo: {repo_id}")
         try:
-            rewritten = await self.query_rewriter.rewrite_query(query)
-            if search_mode != 'hybrid':
-                rewritten.search_strategy = search_mode
-            embedding = await self.embeddings.generate_single_embedding(query)
-            results = await self.hybrid_search.search(
-                repo_id=repo_id,
-                query_vector=embedding,
-                rewritten_query=rewritten,
-                top_k=top_k
-            )
-            search_time_ms = (time.time() - start_time) * 1000
-
-            logger.info(f"Finished query in {search_time_ms:.0f}ms, found {len(results)} results")
-
-            generated_response = None
-            if generate_response and results:
-                try:
-                    generated_response = await self.response_generator.generate_response(query, results)
+            result, cache_key = await self._retrieve(repo_id, query, top_k, search_mode)
+            if generate_response and result.results:
+                result.generated_response = self.query_cache.responses.get(cache_key)
+                if result.generated_response is None:
+                    with breakdown(result.timings_ms):
+                        result.generated_response = await self.response_generator.generate_response(
+                            query, result.results
+                        )
                     logger.info(f"response generated")
-                except Exception as e:
-                    logger.warning(f"response generation failed: {e}")
-            return QueryResult(
-                original_query=query,
-                rewritten_query=rewritten,
-                results=results,
-                search_time_ms=search_time_ms,
-                search_mode=search_mode,
-                generated_response=generated_response
-            )
+                    self._cache_response(cache_key, query, result.results, result.generated_response)
+            return result
         except Exception as e:
             logger.error(f"Query failed: {e}")
             raise
+
+    async def query_stream(
+        self,
+        repo_id: str,
+        query: str,
+        top_k: int = 5,
+        search_mode: Literal['hybrid', 'ast', 'semantic'] = 'hybrid',
+        generate_response: bool = True,
+    ) -> AsyncIterator[Union[QueryResult, str]]:
+        """
+        yields the QueryResult as soon as retrieval completes, with no
+        generated_response yet, then the answer text in pieces as the model
+        writes it. the result's generated_response is filled in once the
+        answer is complete
+        """
+        logger.info(f"Query: {query} on repo: {repo_id}")
+        result, cache_key = await self._retrieve(repo_id, query, top_k, search_mode)
+        yield result
+        if not generate_response or not result.results:
+            return
+
+        cached = self.query_cache.responses.get(cache_key)
+        if cached is not None:
+            result.generated_response = cached
+            yield cached
+            return
+        pieces = []
+        # timed here rather than with breakdown(), whose context would leak out at every yield
+        started = time.perf_counter()
+        async for piece in self.response_generator.stream_response(query, result.results):
+            if not pieces:
+                result.timings_ms['generate_first_token'] = (time.perf_counter() - started) * 1000
+            pieces.append(piece)
+            yield piece
+        result.timings_ms['generate'] = (time.perf_counter() - started) * 1000
+        result.generated_response = "".join(pieces)
+        self._cache_response(cache_key, query, result.results, result.generated_response)
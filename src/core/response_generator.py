@@ -1,10 +1,16 @@
-from typing import List
+import time
+from typing import AsyncIterator, List
 from loguru import logger
-from anthropic import Anthropic
 
+from src.core import llm_client
 from src.core.config import settings
+from src.core.context_packer import pack_context
+from src.core.metrics import metrics
 from src.core.hybrid_search import SearchResult
 
+# appended when a streamed answer fails part way through
+CUT_OFF_NOTE = "\n\n*The answer was cut off.*"
+
 class ResponseGenerator:
     def __init__(self) -> None:
         self.provider = settings.LLM_PROVIDER
@@ -15,18 +21,8 @@ class ResponseGenerator:
         if self.provider == "anthropic":
             if not settings.LLM_API_KEY or settings.LLM_API_KEY.strip() == "":
                 logger.warning("no anthropic api key configured, response generation disabled")
-                self.client = None
-            else:
-                try:
-                    logger.info(f"initializing anthropic client...")
-                    self.client = Anthropic(api_key=settings.LLM_API_KEY)
-                    logger.info("anthropic clien initialized successfully")
-                except Exception as e:
-                    logger.error(f"Failed to initialize anthropic client: {e}")
-                    self.client = None
         else:
             logger.warning(f"Unsupported LLM provider: {self.provider}")
-            self.client = None
 
     async def generate_response(
         self,
@@ -35,29 +31,55 @@ class ResponseGenerator:
         max_tokens: int = 2000
     ) -> str:
 
-        if not self.client:
-            return self._fallback_response(query, seach_results)
+        if not llm_client.llm_available():
+            return self.fallback_response(query, search_results)
 
         if not search_results:
             return "No relevant answer found"
 
         try:
             prompt = self._build_prompt(query, search_results)
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=max_tokens,
-                messages=[{"role": "user", "content": "prompt"}]
-            )
-
-            answer = response.content[0].text
+            with metrics.span('generate'):
+                answer = await llm_client.complete(prompt, max_tokens=max_tokens)
             logger.info(f"Generated response for query: {query}")
             return answer
         except Exception as e:
             logger.error(f"Response generation failed: {e}")
+            return self.fallback_response(query, search_results)
+
+    async def stream_response(
+        self,
+        query: str,
+        search_results: List[SearchResult],
+        max_tokens: int = 2000
+    ) -> AsyncIterator[str]:
+        """the answer in pieces as the model writes it"""
+        if not llm_client.llm_available() or not search_results:
+            yield self.fallback_response(query, search_results)
+            return
+
+        prompt = self._build_prompt(query, search_results)
+        streamed = False
+        started = time.perf_counter()
+        try:
+            async for piece in llm_client.stream(prompt, max_tokens=max_tokens):
+                if not streamed:
+                    metrics.observe('generate_first_token', time.perf_counter() - started)
+                streamed = True
+                yield piece
+            metrics.observe('generate', time.perf_counter() - started)
+            logger.info(f"Streamed response for query: {query}")
+        except Exception as e:
+            logger.error(f"Response streaming failed: {e}")
+            # half an answer followed by the snippet list would read as one answer
+            if streamed:
+                yield CUT_OFF_NOTE
+            else:
+                yield self.fallback_response(query, search_results)
 
     def _build_prompt(self, query: str, search_results: List[SearchResult]) -> str:
         code_context = []
-        for i, result in enumerate(search_results[:5], 1):
+        for i, result in enumerate(pack_context(search_results), 1):
             code_context.append(
                 f"### Code Snippet {i}\n"
                 f"File: {result.file_path} (lines {result.start_line}-{result.end_line})\n"
@@ -84,13 +106,16 @@ I've retrieved the most relevant code snippets. Please provide a clear, concise
 
 **Your Answer:**"""
 
-    def _fallback_response(self, query: str, search_results: List[SearchResult]) -> str:
+    def fallback_response(self, query: str, search_results: List[SearchResult]) -> str:
+        """the answer without an llm, also used when the llm call fails"""
         if not search_results:
             return "No relevant answer found"
         response = f"Found {len(search_results)} relevant code snippet(s):\n\n"
         for i, result in enumerate(search_results[:3], 1):
+            response += f"{i}. `{result.file_path}` (lines {result.start_line}-{result.end_line})\n"
             if result.symbol_name:
                 response += f" Symbol: `{result.symbol_name}`\n"
             response += "\n"
-        response += "\n*Enable LLM API key for detailed natural language answers.*"
+        if not llm_client.llm_available():
+            response += "\n*Enable LLM API key for detailed natural language answers.*"
         return response
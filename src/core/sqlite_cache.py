@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+from loguru import logger
+
+class SqliteLRUCache:
+    """
+    base of the persistent caches: one sqlite table of payloads keyed on
+    _KEY, each row stamped with a last_used clock so the least recently used
+    are evicted once the payloads grow past max_bytes. hits are stamped in
+    batches, a read-mostly cache should not commit a write per lookup
+    """
+
+    _TABLE: str
+    _KEY: Tuple[str, ...] # primary key columns
+    _VALUE: str # payload column, its length is what counts against max_bytes
+    _COLUMNS: str # column definitions for the key and payload
+    # hits stamped per commit, recency only needs to be roughly right
+    _TOUCH_BATCH = 256
+
+    def __init__(self, path: Path, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents = True, exist_ok = True)
+        self._lock = threading.Lock()
+        # other processes may open the same file, sqlite serializes them
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"""CREATE TABLE IF NOT EXISTS {self._TABLE} (
+                {self._COLUMNS},
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY ({', '.join(self._KEY)})
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self._TABLE}_lru ON {self._TABLE} (last_used)")
+        self._conn.commit()
+
+        row = self._conn.execute(
+            f"SELECT COALESCE(SUM(LENGTH({self._VALUE})), 0), COALESCE(MAX(last_used), 0) FROM {self._TABLE}"
+        ).fetchone()
+        self._size_bytes: int = row[0]
+        self._clock: int = row[1]
+        self._touched: List[Tuple[Any, ...]] = []
+
+    def _touch(self, keys: Sequence[Tuple[Any, ...]]) -> None:
+        """stamp rows that were just read, the caller holds the lock"""
+        if not keys:
+            return
+        self._clock += 1
+        self._touched.extend((self._clock, *key) for key in keys)
+        if len(self._touched) >= self._TOUCH_BATCH:
+            self._flush_touched()
+            self._conn.commit()
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            where = ' AND '.join(f"{column} = ?" for column in self._KEY)
+            self._conn.executemany(f"UPDATE {self._TABLE} SET last_used = ? WHERE {where}", self._touched)
+            self._touched = []
+
+    def _insert(self, rows: Sequence[Tuple[Any, ...]]) -> None:
+        """insert (key..., payload) rows not cached yet, the caller holds the lock"""
+        if not rows:
+            return
+        self._clock += 1
+        before = self._conn.total_changes
+        columns = ', '.join((*self._KEY, self._VALUE, 'last_used'))
+        self._conn.executemany(
+            f"INSERT OR IGNORE INTO {self._TABLE} ({columns}) VALUES ({', '.join('?' * (len(self._KEY) + 2))})",
+            [(*row, self._clock) for row in rows]
+        )
+        inserted = self._conn.total_changes - before
+        # exact unless some rows were already cached, eviction recounts anyway
+        self._size_bytes += inserted * sum(len(row[-1]) for row in rows) // len(rows)
+        self._flush_touched()
+        if self._size_bytes > self.max_bytes:
+            self._evict()
+        self._conn.commit()
+
+    def _evict(self) -> None:
+        # other processes write to the same file, so start from the real size
+        self._size_bytes = self._conn.execute(
+            f"SELECT COALESCE(SUM(LENGTH({self._VALUE})), 0) FROM {self._TABLE}"
+        ).fetchone()[0]
+        # drop down to 90% of the limit so we don't evict on every insert
+        target = int(self.max_bytes * 0.9)
+        key = ', '.join(self._KEY)
+        where = ' AND '.join(f"{column} = ?" for column in self._KEY)
+        while self._size_bytes > target:
+            rows = self._conn.execute(
+                f"SELECT {key}, LENGTH({self._VALUE}) FROM {self._TABLE} ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._size_bytes = 0
+                break
+            freed = 0
+            evicted = []
+            for row in rows:
+                evicted.append(row[:-1])
+                freed += row[-1]
+                if self._size_bytes - freed <= target:
+                    break
+            self._conn.executemany(f"DELETE FROM {self._TABLE} WHERE {where}", evicted)
+            self._size_bytes -= freed
+            logger.debug(f"evicted {len(evicted)} cached {self._TABLE}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size_bytes': self._size_bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,137 @@
+import bisect
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from loguru import logger
+
+from src.core.ast_parser import Symbol
+from src.core.config import settings
+
+class SymbolEntry(NamedTuple):
+    name: str
+    kind: str
+    path: str
+    start_line: int
+    end_line: int
+    signature: Optional[str]
+    parent: Optional[str]
+
+def _keys(entry: SymbolEntry) -> List[str]:
+    """lookup keys for a symbol: its name, qualified forms and, for c++ names, the last component"""
+    keys = [entry.name]
+    if entry.parent:
+        keys.append(f"{entry.parent}.{entry.name}")
+        keys.append(f"{entry.parent}::{entry.name}")
+    if '::' in entry.name:
+        keys.append(entry.name.rsplit('::', 1)[1])
+    return [key.lower() for key in keys]
+
+class SymbolIndex:
+    """
+    exact per-repo symbol table (name -> definitions) plus the file level
+    import graph, persisted next to the other per-repo indexes
+    """
+
+    def __init__(self, repo_id: str, repo_path: Optional[str] = None) -> None:
+        self.repo_id = repo_id
+        self.repo_path = repo_path
+        self.files: Dict[str, List[SymbolEntry]] = {}
+        self.imports: Dict[str, List[str]] = {}
+        self._by_name: Optional[Dict[str, List[SymbolEntry]]] = None
+        self._sorted_keys: List[str] = []
+
+    @staticmethod
+    def _path_for(repo_id: str) -> Path:
+        return Path(settings.SYMBOL_INDEX_DIR) / f"{repo_id}.json"
+
+    @classmethod
+    def load(cls, repo_id: str) -> Optional["SymbolIndex"]:
+        path = cls._path_for(repo_id)
+        try:
+            data = json.loads(path.read_text())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"ignoring unreadable symbol index {path}: {e}")
+            return None
+        index = cls(repo_id, data.get('repo_path'))
+        for rel_path, entries in data.get('files', {}).items():
+            index.files[rel_path] = [SymbolEntry(*entry) for entry in entries]
+        index.imports = data.get('imports', {})
+        return index
+
+    @classmethod
+    def mtime(cls, repo_id: str) -> Optional[float]:
+        try:
+            return cls._path_for(repo_id).stat().st_mtime
+        except OSError:
+            return None
+
+    def save(self) -> None:
+        path = self._path_for(self.repo_id)
+        path.parent.mkdir(parents = True, exist_ok = True)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({
+            'repo_path': self.repo_path,
+            'files': self.files,
+            'imports': self.imports,
+        }))
+        os.replace(tmp, path)
+        logger.info(f"saved symbol index for {self.repo_id}: {sum(len(s) for s in self.files.values())} symbols")
+
+    def add_file(self, rel_path: str, symbols: Iterable[Symbol], dependencies: Iterable[str]) -> None:
+        self.files[rel_path] = [
+            SymbolEntry(s.name, s.type, rel_path, s.start_line, s.end_line, s.signature, s.parent)
+            for s in symbols
+        ]
+        self.imports[rel_path] = list(dependencies)
+        self._by_name = None
+
+    def remove_files(self, rel_paths: Set[str]) -> None:
+        for rel_path in rel_paths:
+            self.files.pop(rel_path, None)
+            self.imports.pop(rel_path, None)
+        self._by_name = None
+
+    def _build_lookup(self) -> Dict[str, List[SymbolEntry]]:
+        if self._by_name is None:
+            by_name: Dict[str, List[SymbolEntry]] = {}
+            for entries in self.files.values():
+                for entry in entries:
+                    for key in _keys(entry):
+                        by_name.setdefault(key, []).append(entry)
+            self._by_name = by_name
+            self._sorted_keys = sorted(by_name)
+        return self._by_name
+
+    def lookup(self, name: str) -> List[SymbolEntry]:
+        """exact definitions of name (case-insensitive, qualified names like Foo.bar allowed)"""
+        entries = self._build_lookup().get(name.lower(), [])
+        # exact-case matches first, then classes before their members
+        return sorted(entries, key=lambda e: (e.name != name and f"{e.parent}.{e.name}" != name, e.parent is not None))
+
+    def prefix(self, prefix: str, limit: int = 20) -> List[SymbolEntry]:
+        by_name = self._build_lookup()
+        prefix = prefix.lower()
+        results: List[SymbolEntry] = []
+        seen: Set[SymbolEntry] = set()
+        start = bisect.bisect_left(self._sorted_keys, prefix)
+        for key in self._sorted_keys[start:]:
+            if not key.startswith(prefix):
+                break
+            for entry in by_name[key]:
+                if entry not in seen:
+                    seen.add(entry)
+                    results.append(entry)
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def dependencies(self, rel_path: str) -> List[str]:
+        return self.imports.get(rel_path, [])
+
+    def importers(self, module: str) -> List[str]:
+        """files whose imports mention module"""
+        return sorted(path for path, deps in self.imports.items() if module in deps)
@@ -0,0 +1,105 @@
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import discord
+from discord.ext import commands
+from loguru import logger
+
+# the directory name isn't importable, so the bot runs as a script from anywhere
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+from src.core.config import settings
+from src.core.rag_pipeline import CodebaseRAG, QueryResult
+from src.utils.logger import init_logger
+
+MESSAGE_LIMIT = 2000
+EDIT_INTERVAL_S = 1.0 # discord rate limits message edits, batch the streamed text
+
+class StreamingReply:
+    """
+    a reply that grows as text streams in. edits are throttled, and text past
+    discord's message limit continues in a follow-up message
+    """
+
+    def __init__(self, ctx: commands.Context) -> None:
+        self.ctx = ctx
+        self.messages: List[discord.Message] = []
+        self.text = ""
+        self.shown = ""
+        self.last_edit = 0.0
+
+    async def write(self, text: str, force: bool = False) -> None:
+        self.text += text
+        if force or time.monotonic() - self.last_edit >= EDIT_INTERVAL_S:
+            await self.flush()
+
+    async def flush(self) -> None:
+        pages = [self.text[i:i + MESSAGE_LIMIT] for i in range(0, len(self.text), MESSAGE_LIMIT)] or ["..."]
+        for i, page in enumerate(pages):
+            if i < len(self.messages):
+                # only the last page of what was shown so far can have changed
+                if i == len(self.messages) - 1 and page != self.shown[i * MESSAGE_LIMIT:(i + 1) * MESSAGE_LIMIT]:
+                    await self.messages[i].edit(content=page)
+            else:
+                self.messages.append(await self.ctx.reply(page) if not self.messages else await self.ctx.send(page))
+        self.shown = self.text
+        self.last_edit = time.monotonic()
+
+def format_sources(result: QueryResult) -> str:
+    if not result.results:
+        return "No results found"
+    lines = [f"`{r.file_path}` lines {r.start_line}-{r.end_line}" for r in result.results]
+    return "**Sources:**\n" + "\n".join(lines) + "\n\n"
+
+intents = discord.Intents.default()
+intents.message_content = True
+bot = commands.Bot(command_prefix=settings.DISCORD_COMMAND_PREFIX, intents=intents)
+rag: Optional[CodebaseRAG] = None
+
+@bot.event
+async def on_ready() -> None:
+    global rag
+    if rag is None:
+        rag = CodebaseRAG()
+        await rag.init()
+    logger.info(f"discord bot logged in as {bot.user}")
+
+@bot.command(name="index")
+async def index(ctx: commands.Context, github_url: str) -> None:
+    """clone (or update) a repo and index it"""
+    reply = StreamingReply(ctx)
+    await reply.write(f"Indexing {github_url}...", force=True)
+    try:
+        repo_id = await rag.index_repo(github_url)
+    except Exception as e:
+        logger.error(f"index command failed: {e}")
+        await reply.write(f"\nIndexing failed: {e}", force=True)
+        return
+    await reply.write(f"\nIndexed `{repo_id}`", force=True)
+
+@bot.command(name="query")
+async def query(ctx: commands.Context, repo_id: str, *, question: str) -> None:
+    """answer a question about an indexed repo, streaming the answer as it is written"""
+    reply = StreamingReply(ctx)
+    await reply.write("Searching...", force=True)
+    try:
+        async for item in rag.query_stream(repo_id, question):
+            if isinstance(item, QueryResult):
+                # the sources show up as soon as retrieval is done
+                reply.text = format_sources(item)
+                await reply.flush()
+            else:
+                await reply.write(item)
+    except Exception as e:
+        logger.error(f"query command failed: {e}")
+        await reply.write(f"\nQuery failed: {e}")
+    await reply.flush()
+
+if __name__ == "__main__":
+    init_logger()
+    if not settings.DISCORD_TOKEN:
+        sys.exit("DISCORD_TOKEN is not configured")
+    bot.run(settings.DISCORD_TOKEN)
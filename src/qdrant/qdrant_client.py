@@ -1,17 +1,124 @@
 import asyncio
-from typing import List, Dict, Any
+import atexit
+import hashlib
+import threading
+import uuid
+from typing import Iterable, List, Dict, Any, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
 from loguru import logger
 from qdrant_client import QdrantClient as QdrantClientLib
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client.models import (
+    Batch,
+    Distance,
+    FieldCondition,
+    Filter,
+    FilterSelector,
+    HasIdCondition,
+    HnswConfigDiff,
+    MatchAny,
+    MatchValue,
+    PayloadSchemaType,
+    QueryRequest,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    VectorParams,
+)
+from src.core.chunker import Chunk, ChunkBatch
 from src.core.config import settings
+from src.core.metrics import metrics
+from src.qdrant.schemas import SearchFilter
+
+# one underlying client per connection target, shared by every QdrantClient in the
+# process so CodebaseRAG instances reuse the same connection pool (and, for local
+# stores, the same data - a local path can only be opened once per process anyway)
+_shared_clients: Dict[Tuple[Any, ...], QdrantClientLib] = {}
+_shared_clients_lock = threading.Lock()
+
+def _grpc_available() -> bool:
+    try:
+        import grpc # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def get_shared_client() -> Tuple[QdrantClientLib, bool]:
+    """(client, is_local) for the configured qdrant target"""
+    if settings.QDRANT_HOST:
+        key: Tuple[Any, ...] = ('server', settings.QDRANT_HOST, settings.QDRANT_PORT, settings.QDRANT_GRPC_PORT)
+    elif settings.QDRANT_PATH:
+        key = ('path', settings.QDRANT_PATH)
+    else:
+        key = ('memory',)
+
+    with _shared_clients_lock:
+        if key not in _shared_clients:
+            if settings.QDRANT_HOST:
+                prefer_grpc = settings.QDRANT_PREFER_GRPC and _grpc_available()
+                logger.info(
+                    f"connecting to qdrant at {settings.QDRANT_HOST}:{settings.QDRANT_PORT} "
+                    f"({'grpc' if prefer_grpc else 'http'})"
+                )
+                _shared_clients[key] = QdrantClientLib(
+                    host=settings.QDRANT_HOST,
+                    port=settings.QDRANT_PORT,
+                    grpc_port=settings.QDRANT_GRPC_PORT,
+                    prefer_grpc=prefer_grpc,
+                    api_key=settings.QDRANT_API_KEY,
+                    timeout=settings.QDRANT_TIMEOUT,
+                    pool_size=settings.QDRANT_POOL_SIZE
+                )
+            elif settings.QDRANT_PATH:
+                logger.info(f"opening local qdrant store at {settings.QDRANT_PATH}")
+                # upserts run on worker threads
+                _shared_clients[key] = QdrantClientLib(
+                    path=settings.QDRANT_PATH,
+                    force_disable_check_same_thread=True
+                )
+            else:
+                logger.info("using in-memory qdrant store")
+                _shared_clients[key] = QdrantClientLib(":memory:")
+        return _shared_clients[key], key[0] != 'server'
+
+@atexit.register
+def _close_shared_clients() -> None:
+    # local stores flush on close, which fails if left to __del__ during interpreter shutdown
+    for client in _shared_clients.values():
+        client.close()
+
+def point_id(repo_id: str, path: str, start_line: int, end_line: int, content: str) -> str:
+    """
+    content addressed: the same chunk always maps to the same point, so
+    upserts are idempotent, and a changed chunk gets a new one. qdrant only
+    accepts uints or uuids as point ids
+    """
+    digest = hashlib.sha256(content.encode('utf-8', errors='surrogatepass')).hexdigest()
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{repo_id}:{path}:{start_line}-{end_line}:{digest}"))
 
 class QdrantClient:
     def __init__(self):
-        self.client = QdrantClientLib(":memory:")  # use in-memory for testing
-        self.collection_name = "codebase_vectors"
+        self.client, self.is_local = get_shared_client()
+        self.collection_name = settings.QDRANT_COLLECTION
+        self.upsert_batch_size = settings.QDRANT_UPSERT_BATCH_SIZE
+        self.upsert_retries = settings.QDRANT_UPSERT_RETRIES
+        # the embedded local store is not safe to write from several threads at once
+        self.max_in_flight = 1 if self.is_local else settings.QDRANT_MAX_IN_FLIGHT
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._in_flight_loop: Optional[asyncio.AbstractEventLoop] = None
 
-    async def create_collection(self) -> None:
-        """create vector collection"""
+    async def create_collection(
+        self,
+        hnsw_m: Optional[int] = None,
+        hnsw_ef_construct: Optional[int] = None,
+        quantization: Optional[str] = None,
+        on_disk: Optional[bool] = None
+    ) -> None:
+        """create vector collection. parameters default to the QDRANT_* settings"""
+        hnsw_m = hnsw_m if hnsw_m is not None else settings.QDRANT_HNSW_M
+        hnsw_ef_construct = hnsw_ef_construct if hnsw_ef_construct is not None else settings.QDRANT_HNSW_EF_CONSTRUCT
+        quantization = quantization if quantization is not None else settings.QDRANT_QUANTIZATION
+        on_disk = on_disk if on_disk is not None else settings.QDRANT_ON_DISK
         try:
             # check if collection exists
             collections = self.client.get_collections()
@@ -19,72 +126,244 @@ class QdrantClient:
                 logger.info(f"collection {self.collection_name} already exists")
                 return
 
+            quantization_config = None
+            if quantization in ('int8', 'scalar'):
+                # int8 copies stay in ram for the hnsw walk, full vectors can live on disk for rescoring
+                quantization_config = ScalarQuantization(scalar=ScalarQuantizationConfig(
+                    type=ScalarType.INT8,
+                    quantile=0.99,
+                    always_ram=True
+                ))
+            elif quantization:
+                raise ValueError(f"unsupported quantization: {quantization}")
+
             # create collection
             self.client.create_collection(
                 collection_name=self.collection_name,
                 vectors_config=VectorParams(
                     size=settings.EMBEDDING_DIMENSION,
-                    distance=Distance.COSINE
-                )
+                    distance=Distance.COSINE,
+                    on_disk=on_disk
+                ),
+                hnsw_config=HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct, on_disk=on_disk),
+                quantization_config=quantization_config,
+                on_disk_payload=on_disk
+            )
+            if not self.is_local:
+                # repo/file filters are on every search and delete
+                for field_name in ("repo_id", "file_path"):
+                    self.client.create_payload_index(
+                        collection_name=self.collection_name,
+                        field_name=field_name,
+                        field_schema=PayloadSchemaType.KEYWORD
+                    )
+            logger.info(
+                f"created collection {self.collection_name} (m={hnsw_m}, ef_construct={hnsw_ef_construct}, "
+                f"quantization={quantization or 'none'}, on_disk={on_disk})"
             )
-            logger.info(f"created collection {self.collection_name}")
         except Exception as e:
             logger.error(f"failed to create collection: {e}")
             raise
 
-    async def upsert_chunks(self, repo_id: str, chunks: List[Any], embeddings: List[List[float]]) -> None:
-        """insert or update chunk vectors"""
-        if not chunks or not embeddings:
+    async def upsert_chunks(
+        self,
+        repo_id: str,
+        chunks: Union[ChunkBatch, Sequence[Chunk]],
+        embeddings: np.ndarray,
+        ids: Optional[List[str]] = None
+    ) -> None:
+        """
+        insert or update chunk vectors. embeddings holds one row per chunk, and
+        ids, when the caller already has them from point_ids, one id per chunk
+        """
+        if not len(chunks) or not len(embeddings):
             logger.warning("no chunks or embeddings to upsert")
             return
 
         if len(chunks) != len(embeddings):
             raise ValueError(f"chunks ({len(chunks)}) and embeddings ({len(embeddings)}) length mismatch")
 
-        points = []
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            points.append({
-                "id": f"{repo_id}_{i}",
-                "vector": embedding,
-                "payload": {
-                    "repo_id": repo_id,
-                    "file_path": str(chunk.file_path) if hasattr(chunk, 'file_path') else "",
-                    "content": chunk.content if hasattr(chunk, 'content') else str(chunk),
-                    "start_line": getattr(chunk, 'start_line', 0),
-                    "end_line": getattr(chunk, 'end_line', 0)
-                }
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        batch = ChunkBatch.from_chunks(chunks)
+        ids = ids if ids is not None else self.point_ids(repo_id, batch)
+        payloads = []
+        for content, path, language, start_line, end_line, chunk_type, symbol_name, _ in batch.rows():
+            payloads.append({
+                "repo_id": repo_id,
+                "file_path": path,
+                "content": content,
+                "language": language,
+                "start_line": start_line,
+                "end_line": end_line,
+                "chunk_type": chunk_type,
+                "symbol_name": symbol_name
             })
 
+        # columnar batches that slice the embedding matrix rather than one object per point
+        step = self.upsert_batch_size
+        starts = range(0, len(ids), step)
+        await asyncio.gather(*(
+            self._upsert_batch(ids[start:start + step], vectors[start:start + step], payloads[start:start + step])
+            for start in starts
+        ))
+        logger.info(f"upserted {len(ids)} chunks for repo {repo_id} in {len(starts)} batches")
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # shared by every upsert on this client, recreated if we move to another event loop
+        loop = asyncio.get_running_loop()
+        if self._in_flight is None or self._in_flight_loop is not loop:
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+            self._in_flight_loop = loop
+        return self._in_flight
+
+    async def _upsert_batch(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict[str, Any]]) -> None:
+        """send one batch off the event loop, retrying it on its own if it fails"""
+        async with self._semaphore():
+            for attempt in range(1, self.upsert_retries + 1):
+                try:
+                    with metrics.span('qdrant_upsert'):
+                        await asyncio.to_thread(self._send_batch, ids, vectors, payloads)
+                    metrics.count('upserted_points', len(ids))
+                    return
+                except Exception as e:
+                    if attempt == self.upsert_retries:
+                        logger.error(f"upsert of {len(ids)} points failed after {attempt} attempts: {e}")
+                        raise
+                    metrics.count('upsert_retries')
+                    delay = 0.5 * 2 ** (attempt - 1)
+                    logger.warning(f"upsert of {len(ids)} points failed ({e}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+    def _send_batch(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict[str, Any]]) -> None:
+        # the wire formats need python floats, so convert just this batch, just before sending
+        # and off the event loop. handing the ndarray itself to Batch is much slower, pydantic
+        # validates it element by element
         self.client.upsert(
             collection_name=self.collection_name,
-            points=points
+            points=Batch(ids=ids, vectors=vectors.tolist(), payloads=payloads),
+            wait=True
         )
-        logger.info(f"upserted {len(points)} chunks for repo {repo_id}")
 
-    async def search(self, query_embedding: List[float], top_k: int = 5, repo_filter: str = None) -> List[Dict[str, Any]]:
-        """search for similar vectors"""
-        try:
-            search_filter = None
-            if repo_filter:
-                search_filter = {
-                    "must": [{"key": "repo_id", "match": {"value": repo_filter}}]
-                }
+    async def count_points(self, repo_id: str) -> int:
+        result = await asyncio.to_thread(
+            self.client.count,
+            collection_name=self.collection_name,
+            count_filter=Filter(must=[FieldCondition(key="repo_id", match=MatchValue(value=repo_id))]),
+            exact=False
+        )
+        return result.count
+
+    async def delete_repo(self, repo_id: str) -> None:
+        """remove every point belonging to a repo"""
+        await asyncio.to_thread(
+            self.client.delete,
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(filter=Filter(
+                must=[FieldCondition(key="repo_id", match=MatchValue(value=repo_id))]
+            ))
+        )
+        logger.info(f"deleted all chunks for repo {repo_id}")
+
+    async def delete_files(self, repo_id: str, file_paths: List[str], keep_ids: Optional[Iterable[str]] = None) -> None:
+        """
+        remove the points of the given files, except keep_ids, e.g. the points
+        of a changed file's chunks that are still current after re-indexing it
+        """
+        if not file_paths:
+            return
+        keep = list(keep_ids or [])
+        await asyncio.to_thread(
+            self.client.delete,
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(filter=Filter(
+                must=[
+                    FieldCondition(key="repo_id", match=MatchValue(value=repo_id)),
+                    FieldCondition(key="file_path", match=MatchAny(any=list(file_paths))),
+                ],
+                must_not=[HasIdCondition(has_id=keep)] if keep else None
+            ))
+        )
+        logger.info(f"deleted chunks of {len(file_paths)} files for repo {repo_id}")
 
-            results = self.client.search(
+    def point_ids(self, repo_id: str, chunks: ChunkBatch) -> List[str]:
+        return [
+            point_id(repo_id, path, start_line, end_line, content)
+            for content, path, _, start_line, end_line, _, _, _ in chunks.rows()
+        ]
+
+    async def existing_ids(self, ids: Sequence[str]) -> Set[str]:
+        """which of ids are already stored"""
+        if not ids:
+            return set()
+        with metrics.span('qdrant_retrieve'):
+            points = await asyncio.to_thread(
+                self.client.retrieve,
                 collection_name=self.collection_name,
-                query_vector=query_embedding,
-                limit=top_k,
-                query_filter=search_filter
+                ids=list(ids),
+                with_payload=False,
+                with_vectors=False
             )
+        return {str(point.id) for point in points}
+
+    def _build_filter(self, repo_filter: Optional[str], filters: Optional[SearchFilter]) -> Optional[Filter]:
+        must: List[Any] = []
+        if repo_filter:
+            must.append(FieldCondition(key="repo_id", match=MatchValue(value=repo_filter)))
+        if filters and filters.must:
+            must.extend(filters.must)
+        if not must and not (filters and (filters.must_not or filters.should)):
+            return None
+        return Filter(
+            must=must or None,
+            must_not=filters.must_not if filters else None,
+            should=filters.should if filters else None
+        )
+
+    async def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        repo_filter: Optional[str] = None,
+        filters: Optional[SearchFilter] = None
+    ) -> List[Dict[str, Any]]:
+        """search for similar vectors"""
+        results = await self.search_batch([query_embedding], top_k, repo_filter, filters)
+        return results[0] if results else []
+
+    async def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        repo_filter: Optional[str] = None,
+        filters: Optional[SearchFilter] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """search for several query vectors in a single request, one result list per vector"""
+        if not len(query_embeddings):
+            return []
+        try:
+            query_filter = self._build_filter(repo_filter, filters)
+            requests = [
+                QueryRequest(query=embedding, filter=query_filter, limit=top_k, with_payload=True)
+                for embedding in np.asarray(query_embeddings, dtype=np.float32).tolist()
+            ]
+            with metrics.span('qdrant_search'):
+                responses = await asyncio.to_thread(
+                    self.client.query_batch_points,
+                    collection_name=self.collection_name,
+                    requests=requests
+                )
 
             return [
-                {
-                    "id": result.id,
-                    "score": result.score,
-                    "payload": result.payload
-                }
-                for result in results
+                [
+                    {
+                        "id": point.id,
+                        "score": point.score,
+                        "payload": point.payload
+                    }
+                    for point in response.points
+                ]
+                for response in responses
             ]
         except Exception as e:
             logger.error(f"search failed: {e}")
-            return []
+            return [[] for _ in query_embeddings]